@@ -1,7 +1,9 @@
-from flask import Flask, render_template, request, jsonify, url_for
+from flask import Flask, render_template, request, jsonify, Response, abort
 import os
 import time
 import traceback
+import orcamento_cpu
+orcamento_cpu.limitar_blas()   # antes do NumPy (só com CPU_THREADS_BLAS definido): as variáveis de ambiente valem quando o BLAS carrega
 import numpy as np
 import pandas as pd
 import threading
@@ -23,22 +25,44 @@ app = Flask(__name__, static_folder=STATIC_DIR, template_folder=TEMPLATE_DIR)
 
 
 import config
-import preparar_dados
-import modelo_AG
-import modelo_GUROBI
-import plot
+import triagem_ativos
+import snapshot_dados
+import simulacao_estresse
+import compactacao
+import perfilamento
+import universos
+import pre_aquecimento
+from importacao_tardia import importar_tardio
+
+# Módulos pesados (yfinance, pymoo, gurobipy, matplotlib) só carregam no primeiro uso
+preparar_dados = importar_tardio('preparar_dados')
+modelo_AG = importar_tardio('modelo_AG')
+modelo_GUROBI = importar_tardio('modelo_GUROBI')
+modelo_HRP = importar_tardio('modelo_HRP')
+plot = importar_tardio('plot')
+fronteira_parametrica = importar_tardio('fronteira_parametrica')
+otimizacao_lote = importar_tardio('otimizacao_lote')
 
 
 CACHE_DADOS = None
 CACHE_LOCK = threading.Lock()
 STATUS_CARREGAMENTO = "Aguardando..."
 
+# Metadados do snapshot em uso e controle da atualização em background
+METADADOS_SNAPSHOT = None
+ATUALIZACAO_LOCK = threading.Lock()
+
+# Renderiza os gráficos no próprio processo (desligado nos workers do modo ASGI)
+PRE_RENDERIZAR_GRAFICOS = True
+
 # Função de pré-carregamento em background
 def tarefa_background_download():
-    global CACHE_DADOS, STATUS_CARREGAMENTO
+    global CACHE_DADOS, STATUS_CARREGAMENTO, METADADOS_SNAPSHOT
     with CACHE_LOCK:
         if CACHE_DADOS is not None:
             STATUS_CARREGAMENTO = "Dados Prontos"
+            if METADADOS_SNAPSHOT and snapshot_dados.snapshot_desatualizado(METADADOS_SNAPSHOT):
+                iniciar_atualizacao_background()
             return
         print("--- [BACKGROUND] Iniciando pré-carregamento... ---")
         STATUS_CARREGAMENTO = "Baixando Ativos..."
@@ -46,6 +70,8 @@ def tarefa_background_download():
             dados = preparar_dados.calcular_inputs_otimizacao(10000)
             if dados:
                 CACHE_DADOS = dados
+                METADADOS_SNAPSHOT = snapshot_dados.localizar_snapshot()[1]
+                pre_aquecimento.invalidar_resultados()
                 STATUS_CARREGAMENTO = "Dados Prontos"
                 print("--- [BACKGROUND] Dados carregados! ---")
             else:
@@ -54,6 +80,101 @@ def tarefa_background_download():
             print(f"--- [BACKGROUND] Erro: {e}")
             STATUS_CARREGAMENTO = "Erro"
 
+# Recalcula os inputs sem bloquear as requisições (o snapshot atual continua em uso até terminar)
+def tarefa_atualizar_dados():
+    global CACHE_DADOS, METADADOS_SNAPSHOT
+    if not ATUALIZACAO_LOCK.acquire(blocking=False):
+        return
+    try:
+        print("--- [BACKGROUND] Snapshot desatualizado, atualizando dados... ---")
+        dados = preparar_dados.calcular_inputs_otimizacao(10000)
+        if dados:
+            with CACHE_LOCK:
+                CACHE_DADOS = dados
+                METADADOS_SNAPSHOT = snapshot_dados.localizar_snapshot()[1]
+            pre_aquecimento.invalidar_resultados()
+            print("--- [BACKGROUND] Dados atualizados! ---")
+    except Exception as e:
+        print(f"--- [BACKGROUND] Erro na atualização: {e}")
+    finally:
+        ATUALIZACAO_LOCK.release()
+
+def iniciar_atualizacao_background():
+    thread = threading.Thread(target=tarefa_atualizar_dados)
+    thread.daemon = True
+    thread.start()
+
+# Inicialização rápida: usa o snapshot salvo em disco e, se estiver velho, atualiza em background
+def carregar_snapshot_inicial():
+    global CACHE_DADOS, STATUS_CARREGAMENTO, METADADOS_SNAPSHOT
+    dados, metadados = snapshot_dados.carregar_snapshot()
+    if dados is None:
+        return False
+
+    with CACHE_LOCK:
+        CACHE_DADOS = dados
+        METADADOS_SNAPSHOT = metadados
+        STATUS_CARREGAMENTO = "Dados Prontos"
+
+    if snapshot_dados.snapshot_desatualizado(metadados):
+        iniciar_atualizacao_background()
+    return True
+
+# Comprime as respostas JSON grandes (gzip, ou brotli se instalado) conforme o Accept-Encoding
+@app.after_request
+def comprimir_resposta(resposta):
+    if resposta.mimetype != 'application/json' or resposta.direct_passthrough or 'Content-Encoding' in resposta.headers:
+        return resposta
+    corpo, codificacao = compactacao.comprimir_corpo(resposta.get_data(), request.headers.get('Accept-Encoding', ''))
+    if codificacao:
+        resposta.set_data(corpo)
+        resposta.headers['Content-Encoding'] = codificacao
+        resposta.headers['Vary'] = 'Accept-Encoding'
+    return resposta
+
+# Executa uma rota de otimização, perfilando se pedido (cabeçalho X-Perfil: 1 ou ?perfil=1).
+# Pedidos cacheáveis vão para o registro do pré-aquecimento e, sem perfil, usam o cache de respostas
+def executar_rota(funcao, rota):
+    pedido = request.headers.get('X-Perfil') or request.args.get('perfil')
+    perfilar = perfilamento.deve_perfilar(pedido)
+    dados = request.json
+    pre_aquecimento.registrar_pedido(rota, dados)
+    if not perfilar:
+        pronta = pre_aquecimento.obter_resultado(rota, dados)
+        if pronta is not None:
+            registrar_graficos_resposta(pronta)
+            return pronta, 200
+
+    geracao = pre_aquecimento.geracao_atual()
+    resposta, status = perfilamento.executar(funcao, rota, perfilar, dados)
+    if status == 200 and not perfilar:
+        pre_aquecimento.guardar_resultado(rota, dados, resposta, geracao)
+    return resposta, status
+
+def verificar_acesso_admin():
+    if not perfilamento.acesso_admin_permitido(request.headers.get('X-Token-Admin'), request.remote_addr):
+        abort(403)
+
+# Perfis salvos (mais recentes primeiro)
+@app.route('/admin/perfis', methods=['GET'])
+def listar_perfis():
+    verificar_acesso_admin()
+    return jsonify([perfilamento.ler_resumo(id_perfil) for id_perfil in perfilamento.listar_ids()])
+
+# Resumo de um perfil (etapas, memória, funções mais lentas) ou o arquivo do flamegraph (<id>.folded)
+@app.route('/admin/perfis/<id_perfil>', methods=['GET'])
+def obter_perfil(id_perfil):
+    verificar_acesso_admin()
+    if id_perfil.endswith('.folded'):
+        conteudo = perfilamento.ler_flamegraph(id_perfil[:-len('.folded')])
+        if conteudo is None:
+            abort(404)
+        return Response(conteudo, mimetype='text/plain')
+    resumo = perfilamento.ler_resumo(id_perfil)
+    if resumo is None:
+        abort(404)
+    return jsonify(resumo)
+
 @app.route('/pre-carregar', methods=['GET'])
 def trigger_pre_load():
     thread = threading.Thread(target=tarefa_background_download)
@@ -63,7 +184,27 @@ def trigger_pre_load():
 
 @app.route('/status-dados', methods=['GET'])
 def check_status():
-    return jsonify({'status': STATUS_CARREGAMENTO})
+    return jsonify({'status': STATUS_CARREGAMENTO, 'cpu': orcamento_cpu.estado(),
+                    'universos_carregados': universos.universos_carregados(),
+                    'pre_aquecimento': pre_aquecimento.estado()})
+
+# Universos disponíveis e tickers em quarentena
+@app.route('/universos', methods=['GET'])
+def listar_universos():
+    return jsonify({'universos': universos.listar_universos(), 'quarentena': universos.listar_quarentena()})
+
+# Registra um universo nomeado: {'nome', 'setores': {setor: [tickers]}} ou {'nome', 'ativos': [tickers]}.
+# Os dados só são baixados no primeiro pedido que usar o universo. Restrito como as rotas /admin: cada
+# universo dispara downloads e ocupa disco
+@app.route('/universos', methods=['POST'])
+def registrar_universo():
+    verificar_acesso_admin()
+    dados = request.json or {}
+    try:
+        universo = universos.registrar_universo(dados.get('nome'), dados)
+    except ValueError as e:
+        return jsonify({'sucesso': False, 'erro': str(e)}), 400
+    return jsonify({'sucesso': True, 'nome': universo['nome'], 'n_ativos': len(universo['ativos'])})
 
 
 @app.route('/')
@@ -72,11 +213,40 @@ def index():
     lista_setores = list(mapa_setores.keys())
     return render_template('index.html', setores=lista_setores)
 
-@app.route('/grafico_temporal_<tipo>.png')
-def serve_temporal_chart(tipo):
-    """Serve temporal analysis chart images"""
-    from flask import send_from_directory
-    return send_from_directory(STATIC_DIR, f'grafico_temporal_{tipo}.png')
+@app.route('/grafico/<chave>.png')
+def serve_chart(chave):
+    """Serve pie chart images rendered in memory"""
+    png = plot.obter_png_grafico(chave)
+    if png is None:
+        abort(404)
+    resposta = Response(png, mimetype='image/png')
+    resposta.headers['Cache-Control'] = 'public, max-age=86400, immutable'
+    return resposta
+
+# URL pública de um gráfico do cache em memória
+def url_grafico(chave):
+    return f"/grafico/{chave}.png"
+
+# Registra os gráficos no cache em memória e dispara a renderização em paralelo
+def registrar_graficos(graficos):
+    urls = {}
+    chaves = []
+    for nome, dados_grafico in graficos.items():
+        if dados_grafico and dados_grafico['labels']:
+            chave = plot.registrar_grafico(dados_grafico)
+            chaves.append(chave)
+            urls[nome] = url_grafico(chave)
+    if PRE_RENDERIZAR_GRAFICOS:
+        plot.pre_renderizar_graficos(chaves)
+    return urls
+
+# Registra no processo atual os gráficos de uma resposta já montada (modo ASGI)
+def registrar_graficos_resposta(resposta):
+    graficos = {}
+    for nome, bloco in resposta.items():
+        if isinstance(bloco, dict) and bloco.get('grafico_url') and bloco.get('grafico_dados'):
+            graficos[nome] = bloco['grafico_dados']
+    return registrar_graficos(graficos)
 
 # Função segura para converter valores para float
 def safe_num(val):
@@ -124,8 +294,9 @@ def formatar_dados_para_frontend(ticker_list, peso_array, valor_investido, preco
     return sorted(alocacao, key=lambda x: x['peso'], reverse=True)
 
 # Função para calcular alocação setorial
-def calcular_alocacao_setorial(nomes_ativos, pesos_array, valor_investido, precos_map, lotes_exatos=None):
-    mapa_setores = config.obter_mapa_setores_ativos()
+def calcular_alocacao_setorial(nomes_ativos, pesos_array, valor_investido, precos_map, lotes_exatos=None,
+                               setores_extras=None):
+    mapa_setores = config.obter_mapa_setores_ativos(setores_extras)
     
     ativo_para_setor = {}
     for setor, lista_ativos in mapa_setores.items():
@@ -175,19 +346,82 @@ def calcular_alocacao_setorial(nomes_ativos, pesos_array, valor_investido, preco
         
     return sorted(resultado, key=lambda x: x['peso'], reverse=True)
 
+# Lê da requisição os controles do Gurobi (tempo limite, gap, threads, pool e modo do CVaR)
+def ler_parametros_gurobi(dados):
+    params = {}
+    if dados.get('tempo_limite') not in (None, ''): params['tempo_limite'] = float(dados.get('tempo_limite'))
+    if dados.get('mip_gap') not in (None, ''): params['mip_gap'] = float(dados.get('mip_gap')) / 100.0
+    if dados.get('threads') not in (None, ''): params['threads'] = int(dados.get('threads'))
+    if dados.get('num_solucoes') not in (None, ''): params['num_solucoes_pool'] = int(dados.get('num_solucoes'))
+    if dados.get('cvar_modo'): params['cvar_modo'] = dados.get('cvar_modo')
+    if dados.get('cvar_maximo') not in (None, ''): params['cvar_maximo'] = float(dados.get('cvar_maximo')) / 100.0
+    return params
+
+# Lê da requisição o rebalanceamento: carteira atual ({ticker: cotas}), custo de transação (%),
+# giro máximo (% do patrimônio) e máximo de negociações. Sem 'lotes_atuais', retorna {}
+def ler_parametros_rebalanceamento(dados, nomes_ativos):
+    if not dados.get('lotes_atuais'):
+        return {}
+    params = {'lotes_atuais': modelo_GUROBI.alinhar_lotes(dados['lotes_atuais'], nomes_ativos)}
+    if dados.get('custo_transacao') not in (None, ''): params['custo_transacao'] = float(dados['custo_transacao']) / 100.0
+    if dados.get('turnover_maximo') not in (None, ''): params['turnover_maximo'] = float(dados['turnover_maximo']) / 100.0
+    if dados.get('max_negociacoes') not in (None, ''): params['max_negociacoes'] = int(dados['max_negociacoes'])
+    if dados.get('fixar_intocados') is not None: params['fixar_intocados'] = bool(dados['fixar_intocados'])
+    return params
+
+# Função para formatar as soluções alternativas do pool do Gurobi
+def formatar_solucoes_pool(res_gurobi, nomes_ativos, valor_investido, precos_map):
+    alternativas = []
+    for sol in res_gurobi.get('solucoes_pool', []):
+        alternativas.append({
+            'metricas': {
+                'retorno_aa': safe_num(sol['retorno'] * 100),
+                'risco_aa': safe_num(sol['risco'] * 100),
+                'score': safe_num(sol['obj']),
+                'pvp': safe_num(sol.get('pvp_final')),
+                'cvar': safe_num(sol.get('cvar_final', 0) * 100)
+            },
+            'alocacao': formatar_dados_para_frontend(nomes_ativos, sol['pesos'], valor_investido, precos_map, sol.get('lotes'))
+        })
+    return alternativas
+
+# Aplica a triagem de ativos (retorna os inputs para os modelos e o mapeamento de volta)
+def aplicar_triagem(inputs, dados, setores_proibidos, teto_ativo):
+    if not dados.get('triagem', config.TRIAGEM_ATIVA):
+        return inputs, None
+    triagem = triagem_ativos.triar_universo(inputs, setores_proibidos, teto_ativo,
+                                            remover_dominados=dados.get('remover_dominados'))
+    if len(triagem['indices']) == 0:
+        return inputs, None
+    return triagem['inputs'], triagem
+
+# Mapeia um resultado de volta para o universo completo (se houve triagem)
+def expandir_se_triado(res, triagem):
+    if triagem is None:
+        return res
+    return triagem_ativos.expandir_resultado(res, triagem)
+
 # Função para contar ativos e setores
 def contar_ativos_setores(pesos_array, alocacao_setorial_lista):
     qtd_ativos = np.sum(np.nan_to_num(pesos_array) > 1e-4)
     qtd_setores = len([s for s in alocacao_setorial_lista if "CAIXA" not in s['setor']])
     return int(qtd_ativos), int(qtd_setores)
 
-@app.route('/otimizar', methods=['POST'])
+# Inputs do universo pedido em 'universo'; sem ele (ou no universo padrão) ficam os inputs recebidos.
+# Nome desconhecido gera ValueError
+def inputs_do_universo(dados, inputs):
+    nome = dados.get('universo')
+    if not nome or nome == config.UNIVERSO_PADRAO:
+        return inputs
+    inputs_universo = universos.obter_inputs(nome)
+    if inputs_universo is None:
+        raise RuntimeError(f"Falha ao baixar dados do universo '{nome}'.")
+    return inputs_universo
 
-# Função principal para processar a otimização
-def processar_otimizacao():
+# Função principal para processar a otimização (independente do Flask, retorna resposta e status)
+def executar_otimizacao(dados, inputs=None):
     global CACHE_DADOS
     try:
-        dados = request.json
         valor_investir = float(dados.get('valor') or 0)
         
         # Variáveis de controle
@@ -199,73 +433,134 @@ def processar_otimizacao():
         
         max_ativos_global = int(dados.get('max_ativos') or 15)
         max_ativos_por_setor = int(dados.get('max_ativos_setor') or 4)
+        params_gurobi = ler_parametros_gurobi(dados)
+
+        # Motor: 'ga' (AG + Gurobi warm/cold) ou 'hrp' (prévia rápida por clusters, sem solver)
+        motor = dados.get('motor') or 'ga'
+        if motor not in ('ga', 'hrp'):
+            return {'sucesso': False, 'erro': f"Motor desconhecido: {motor}"}, 400
+
+        # Séries do backtest: pontos por série (LTTB) e formato ('json' ou 'float32' em base64)
+        try:
+            pontos_serie, formato_serie = compactacao.ler_parametros_series(dados)
+        except ValueError as e:
+            return {'sucesso': False, 'erro': str(e)}, 400
         
         print(f"\n--- [POST /otimizar] Iniciando... ---")
+        perfilamento.marcar_etapa('dados')
+        try:
+            inputs = inputs_do_universo(dados, inputs)
+        except ValueError as e:
+            return {'sucesso': False, 'erro': str(e)}, 400
         
-        inputs = None
-        with CACHE_LOCK:
-            if CACHE_DADOS is not None:
-                inputs = CACHE_DADOS.copy()
-                inputs['valor_total_investido'] = valor_investir
-        
-        if inputs is None:
-            inputs = preparar_dados.calcular_inputs_otimizacao(valor_investir)
-            with CACHE_LOCK: CACHE_DADOS = inputs
+        # Inputs podem vir prontos (modo ASGI ou universo nomeado) ou do cache do processo
+        if inputs is not None:
+            inputs = inputs.copy()
+            inputs['valor_total_investido'] = valor_investir
+        else:
+            with CACHE_LOCK:
+                if CACHE_DADOS is not None:
+                    inputs = CACHE_DADOS.copy()
+                    inputs['valor_total_investido'] = valor_investir
+            
+            if inputs is None:
+                inputs = preparar_dados.calcular_inputs_otimizacao(valor_investir)
+                with CACHE_LOCK: CACHE_DADOS = inputs
         
         if inputs is None:
-            return jsonify({'sucesso': False, 'erro': 'Falha ao baixar dados.'}), 500
+            return {'sucesso': False, 'erro': 'Falha ao baixar dados.'}, 500
         
         nomes_ativos = inputs['nomes_dos_ativos']
         
         # Pega os preços para calcular as quantidades
         precos_map = inputs.get('ultimos_precos', pd.Series()).to_dict()
 
-        # 1 - Algoritmo Genético
-        print(">> Rodando GA...")
+        # Rebalanceamento: o patrimônio é o caixa novo mais a carteira atual a preço de hoje
+        try:
+            params_rebalanceamento = ler_parametros_rebalanceamento(dados, nomes_ativos)
+        except ValueError as e:
+            return {'sucesso': False, 'erro': str(e)}, 400
+        if params_rebalanceamento:
+            if motor != 'ga':
+                return {'sucesso': False, 'erro': "Rebalanceamento requer o motor 'ga'."}, 400
+            precos_atuais = np.array([safe_num(precos_map.get(t)) or 0.0 for t in nomes_ativos])
+            valor_investir += float(params_rebalanceamento['lotes_atuais'] @ precos_atuais)
+            inputs['valor_total_investido'] = valor_investir
+            print(f">> Rebalanceamento: patrimônio de R$ {valor_investir:.2f}")
+
+        # 0 - Triagem de ativos (desligada no rebalanceamento: as posições atuais precisam ficar no modelo)
+        perfilamento.marcar_etapa('triagem')
+        if params_rebalanceamento:
+            inputs_modelo, triagem = inputs, None
+        else:
+            inputs_modelo, triagem = aplicar_triagem(inputs, dados, setores_proibidos, teto_ativo_input)
+
+        # 1 - Algoritmo Genético (ou HRP no modo de prévia)
+        perfilamento.marcar_etapa(motor)
         start_ga = time.time()
-        res_ga = modelo_AG.rodar_otimização(inputs, risco_teto, lambda_risco, setores_proibidos, 
-                                           teto_maximo_ativo=teto_ativo_input, 
-                                           teto_maximo_setor=teto_setor_input)
+        if motor == 'hrp':
+            print(">> Rodando HRP...")
+            res_ga = modelo_HRP.rodar_hrp(inputs_modelo, risco_teto, lambda_risco, setores_proibidos,
+                                          teto_maximo_ativo=teto_ativo_input,
+                                          teto_maximo_setor=teto_setor_input)
+        else:
+            print(">> Rodando GA...")
+            res_ga = modelo_AG.rodar_otimização(inputs_modelo, risco_teto, lambda_risco, setores_proibidos, 
+                                               teto_maximo_ativo=teto_ativo_input, 
+                                               teto_maximo_setor=teto_setor_input,
+                                               max_ativos=max_ativos_global,
+                                               usar_cache=dados.get('cache_populacao'))
         tempo_ga = time.time() - start_ga
         
-        if res_ga is None: return jsonify({'sucesso': False, 'erro': 'GA não convergiu.'}), 400
+        if res_ga is None: return {'sucesso': False, 'erro': f"{motor.upper()} não encontrou solução."}, 400
 
-        # 2 - Gurobi Warm
-        print(">> Rodando Gurobi (Warm)...")
-        start_gu_warm = time.time()
-        res_gurobi_warm = modelo_GUROBI.resolver_com_gurobi_setores(
-            inputs, lambda_risco, risco_teto, 
-            warm_start_pesos=res_ga['pesos_finais'], setores_proibidos=setores_proibidos, 
-            teto_maximo_ativo=teto_ativo_input, teto_maximo_setor=teto_setor_input,
-            max_ativos_carteira=max_ativos_global,
-            max_ativos_setor=max_ativos_por_setor
-        )
-        tempo_gu_warm = time.time() - start_gu_warm
-
-        # 3 - Gurobi Cold
-        print(">> Rodando Gurobi (Cold)...")
-        start_gu_cold = time.time()
-        res_gurobi_cold = modelo_GUROBI.resolver_com_gurobi_setores(
-            inputs, lambda_risco, risco_teto, 
-            warm_start_pesos=None, setores_proibidos=setores_proibidos, 
-            teto_maximo_ativo=teto_ativo_input, teto_maximo_setor=teto_setor_input,
-            max_ativos_carteira=max_ativos_global,
-            max_ativos_setor=max_ativos_por_setor
-        )
-        tempo_gu_cold = time.time() - start_gu_cold
+        # A prévia HRP não chama o Gurobi
+        res_gurobi_warm = res_gurobi_cold = None
+        tempo_gu_warm = tempo_gu_cold = 0.0
+
+        if motor == 'ga':
+            # 2 - Gurobi Warm
+            perfilamento.marcar_etapa('gurobi_warm')
+            print(">> Rodando Gurobi (Warm)...")
+            start_gu_warm = time.time()
+            res_gurobi_warm = modelo_GUROBI.resolver_com_gurobi_setores(
+                inputs_modelo, lambda_risco, risco_teto, 
+                warm_start_pesos=res_ga['pesos_finais'], setores_proibidos=setores_proibidos, 
+                teto_maximo_ativo=teto_ativo_input, teto_maximo_setor=teto_setor_input,
+                max_ativos_carteira=max_ativos_global,
+                max_ativos_setor=max_ativos_por_setor,
+                **params_gurobi, **params_rebalanceamento
+            )
+            tempo_gu_warm = time.time() - start_gu_warm
+
+            # 3 - Gurobi Cold
+            perfilamento.marcar_etapa('gurobi_cold')
+            print(">> Rodando Gurobi (Cold)...")
+            start_gu_cold = time.time()
+            res_gurobi_cold = modelo_GUROBI.resolver_com_gurobi_setores(
+                inputs_modelo, lambda_risco, risco_teto, 
+                warm_start_pesos=None, setores_proibidos=setores_proibidos, 
+                teto_maximo_ativo=teto_ativo_input, teto_maximo_setor=teto_setor_input,
+                max_ativos_carteira=max_ativos_global,
+                max_ativos_setor=max_ativos_por_setor,
+                **params_gurobi, **params_rebalanceamento
+            )
+            tempo_gu_cold = time.time() - start_gu_cold
+
+        # Volta os resultados para o universo completo
+        res_ga = expandir_se_triado(res_ga, triagem)
+        res_gurobi_warm = expandir_se_triado(res_gurobi_warm, triagem)
+        res_gurobi_cold = expandir_se_triado(res_gurobi_cold, triagem)
 
         # 4. Gráficos
-        timestamp = int(time.time())
-        nome_ga, nome_gu_warm, nome_gu_cold = 'grafico_ga.png', 'grafico_gurobi_warm.png', 'grafico_gurobi_cold.png'
-        
-        plot.rodar_visualizacao_completa(
-            inputs, res_ga, res_gurobi_warm, res_gurobi_cold, 
-            os.path.join(STATIC_DIR, nome_ga), 
-            os.path.join(STATIC_DIR, nome_gu_warm), 
-            os.path.join(STATIC_DIR, nome_gu_cold)
-        )
+        perfilamento.marcar_etapa('graficos')
+        # Apenas os dados vão na resposta; o PNG é renderizado em paralelo e servido do cache
+        titulo_ga = "Hierarchical Risk Parity" if motor == 'hrp' else "Algoritmo Genético"
+        graficos = plot.montar_graficos_completos(inputs, res_ga, res_gurobi_warm, res_gurobi_cold, titulo_ga)
+        urls_graficos = registrar_graficos(graficos) if dados.get('graficos', True) else {}
 
         # 5. Dados Interativos
+        perfilamento.marcar_etapa('resposta')
         retornos_hist = inputs['retornos_diarios_historicos']
         df_bench = inputs['df_benchmarks']
         
@@ -287,13 +582,20 @@ def processar_otimizacao():
             )
             return datas_cart, clean_list(valores_cart)
 
+        def montar_backtest(datas, valores):
+            return compactacao.compactar_series(
+                {'datas': datas, 'carteira': valores, 'cdi': bench_cdi, 'ibov': bench_ibov, 'sp500': bench_sp500},
+                pontos_serie, formato_serie
+            )
+
         # Dados do GA
         row_ga = res_ga['dataframe_resultado'].iloc[0]
         pesos_ga = row_ga.drop(['Risco_Alvo', 'Risco_Encontrado_Anual', 'Retorno_Encontrado_Anual'], errors='ignore')
         pesos_ga_final = pesos_ga.reindex(nomes_ativos).fillna(0.0).values
         datas_ga, valores_ga = preparar_backtest_carteira(pesos_ga_final, nomes_ativos)
         
-        aloc_setor_ga = calcular_alocacao_setorial(nomes_ativos, pesos_ga_final, valor_investir, precos_map)
+        aloc_setor_ga = calcular_alocacao_setorial(nomes_ativos, pesos_ga_final, valor_investir, precos_map,
+                                                   setores_extras=inputs.get('setores_universo'))
         n_ativos_ga, n_setores_ga = contar_ativos_setores(pesos_ga_final, aloc_setor_ga)
 
         data_ga = {
@@ -310,8 +612,9 @@ def processar_otimizacao():
             },
             'alocacao': formatar_dados_para_frontend(nomes_ativos, pesos_ga_final, valor_investir, precos_map),
             'alocacao_setorial': aloc_setor_ga,
-            'grafico_url': url_for('static', filename=nome_ga) + f'?t={timestamp}',
-            'backtest': {'datas': datas_ga, 'carteira': valores_ga, 'cdi': bench_cdi, 'ibov': bench_ibov, 'sp500': bench_sp500}
+            'grafico_url': urls_graficos.get('ga'),
+            'grafico_dados': graficos['ga'],
+            'backtest': montar_backtest(datas_ga, valores_ga)
         }
 
         # Dados do Gurobi Warm
@@ -321,7 +624,8 @@ def processar_otimizacao():
             
             lotes_warm = res_gurobi_warm.get('lotes') 
             
-            aloc_setor_warm = calcular_alocacao_setorial(nomes_ativos, res_gurobi_warm['pesos'], valor_investir, precos_map, lotes_warm)
+            aloc_setor_warm = calcular_alocacao_setorial(nomes_ativos, res_gurobi_warm['pesos'], valor_investir, precos_map, lotes_warm,
+                                                         inputs.get('setores_universo'))
             n_ativos_warm, n_setores_warm = contar_ativos_setores(res_gurobi_warm['pesos'], aloc_setor_warm)
 
             data_gu_warm = {
@@ -333,13 +637,20 @@ def processar_otimizacao():
                     'tempo': safe_num(tempo_gu_warm),
                     'pvp': safe_num(res_gurobi_warm.get('pvp_final')),
                     'cvar': safe_num(res_gurobi_warm.get('cvar_final', 0) * 100),
+                    'cvar_carteira': safe_num((res_gurobi_warm.get('cvar_carteira') or 0) * 100),
+                    'cvar_excedido': bool(res_gurobi_warm.get('cvar_excedido')),
                     'qtd_ativos': n_ativos_warm,
-                    'qtd_setores': n_setores_warm
+                    'qtd_setores': n_setores_warm,
+                    'status_solver': res_gurobi_warm.get('status'),
+                    'gap': safe_num(res_gurobi_warm.get('gap', 0) * 100)
                 },
                 'alocacao': formatar_dados_para_frontend(nomes_ativos, res_gurobi_warm['pesos'], valor_investir, precos_map, lotes_warm),
                 'alocacao_setorial': aloc_setor_warm,
-                'grafico_url': url_for('static', filename=nome_gu_warm) + f'?t={timestamp}',
-                'backtest': {'datas': datas_gu, 'carteira': valores_gu, 'cdi': bench_cdi, 'ibov': bench_ibov, 'sp500': bench_sp500}
+                'grafico_url': urls_graficos.get('gurobi_warm'),
+                'grafico_dados': graficos['gurobi_warm'],
+                'alternativas': formatar_solucoes_pool(res_gurobi_warm, nomes_ativos, valor_investir, precos_map),
+                'backtest': montar_backtest(datas_gu, valores_gu),
+                'rebalanceamento': res_gurobi_warm.get('rebalanceamento')
             }
 
         # Dados do Gurobi Cold
@@ -349,7 +660,8 @@ def processar_otimizacao():
             
             lotes_cold = res_gurobi_cold.get('lotes')
             
-            aloc_setor_cold = calcular_alocacao_setorial(nomes_ativos, res_gurobi_cold['pesos'], valor_investir, precos_map, lotes_cold)
+            aloc_setor_cold = calcular_alocacao_setorial(nomes_ativos, res_gurobi_cold['pesos'], valor_investir, precos_map, lotes_cold,
+                                                         inputs.get('setores_universo'))
             n_ativos_cold, n_setores_cold = contar_ativos_setores(res_gurobi_cold['pesos'], aloc_setor_cold)
 
             data_gu_cold = {
@@ -361,28 +673,51 @@ def processar_otimizacao():
                     'tempo': safe_num(tempo_gu_cold),
                     'pvp': safe_num(res_gurobi_cold.get('pvp_final')),
                     'cvar': safe_num(res_gurobi_cold.get('cvar_final', 0) * 100),
+                    'cvar_carteira': safe_num((res_gurobi_cold.get('cvar_carteira') or 0) * 100),
+                    'cvar_excedido': bool(res_gurobi_cold.get('cvar_excedido')),
                     'qtd_ativos': n_ativos_cold,
-                    'qtd_setores': n_setores_cold
+                    'qtd_setores': n_setores_cold,
+                    'status_solver': res_gurobi_cold.get('status'),
+                    'gap': safe_num(res_gurobi_cold.get('gap', 0) * 100)
                 },
                 'alocacao': formatar_dados_para_frontend(nomes_ativos, res_gurobi_cold['pesos'], valor_investir, precos_map, lotes_cold),
                 'alocacao_setorial': aloc_setor_cold,
-                'grafico_url': url_for('static', filename=nome_gu_cold) + f'?t={timestamp}',
-                'backtest': {'datas': datas_cold, 'carteira': valores_cold, 'cdi': bench_cdi, 'ibov': bench_ibov, 'sp500': bench_sp500}
+                'grafico_url': urls_graficos.get('gurobi_cold'),
+                'grafico_dados': graficos['gurobi_cold'],
+                'alternativas': formatar_solucoes_pool(res_gurobi_cold, nomes_ativos, valor_investir, precos_map),
+                'backtest': montar_backtest(datas_cold, valores_cold),
+                'rebalanceamento': res_gurobi_cold.get('rebalanceamento')
             }
 
-        return jsonify({'sucesso': True, 'ga': data_ga, 'gurobi_warm': data_gu_warm, 'gurobi_cold': data_gu_cold})
+        # 6. Teste de estresse: as três carteiras nos mesmos caminhos simulados
+        if dados.get('simulacao', config.SIMULACAO_ATIVA):
+            perfilamento.marcar_etapa('simulacao')
+            start_sim = time.time()
+            simulacao = simulacao_estresse.simular_carteiras(inputs, {
+                'ga': pesos_ga_final,
+                'gurobi_warm': res_gurobi_warm['pesos'] if res_gurobi_warm else None,
+                'gurobi_cold': res_gurobi_cold['pesos'] if res_gurobi_cold else None
+            }, metodo=dados.get('simulacao_metodo'))
+            for nome, data in (('ga', data_ga), ('gurobi_warm', data_gu_warm), ('gurobi_cold', data_gu_cold)):
+                if data is not None and nome in simulacao:
+                    data['simulacao'] = simulacao[nome]
+            print(f">> Simulação de estresse: {time.time() - start_sim:.2f}s")
+
+        return {'sucesso': True, 'motor': motor, 'ga': data_ga, 'gurobi_warm': data_gu_warm, 'gurobi_cold': data_gu_cold}, 200
 
     except Exception as e:
         traceback.print_exc()
-        return jsonify({'sucesso': False, 'erro': str(e)}), 500
+        return {'sucesso': False, 'erro': str(e)}, 500
 
-@app.route('/otimizar-temporal', methods=['POST'])
+@app.route('/otimizar', methods=['POST'])
+def processar_otimizacao():
+    resposta, status = executar_rota(executar_otimizacao, '/otimizar')
+    return jsonify(resposta), status
 
-# Função principal para processar a otimização temporal
-def processar_otimizacao_temporal():
+# Função principal para processar a otimização temporal (independente do Flask)
+def executar_otimizacao_temporal(dados):
   
     try:
-        dados = request.json
         valor_investir = float(dados.get('valor') or 100000)
         
         # Variáveis de controle
@@ -394,37 +729,51 @@ def processar_otimizacao_temporal():
         
         max_ativos_global = int(dados.get('max_ativos') or 15)
         max_ativos_por_setor = int(dados.get('max_ativos_setor') or 4)
+        params_gurobi = ler_parametros_gurobi(dados)
+        params_gurobi.pop('num_solucoes_pool', None)
+        try:
+            pontos_serie, formato_serie = compactacao.ler_parametros_series(dados)
+            universo = universos.obter_universo(dados.get('universo'))
+        except ValueError as e:
+            return {'sucesso': False, 'erro': str(e)}, 400
         
         print(f"\n{'='*80}")
         print(f"ANÁLISE TEMPORAL DE CARTEIRA")
         print(f"{'='*80}")
         
         print(f"\n[DOWNLOAD ÚNICO] Baixando dados de {config.DATA_INICIO_COMPLETO} a {config.DATA_FIM_COMPLETO}")
+        perfilamento.marcar_etapa('dados')
         
         inputs_completo = preparar_dados.calcular_inputs_otimizacao_periodo(
             valor_investir,
             config.DATA_INICIO_COMPLETO,
-            config.DATA_FIM_COMPLETO
+            config.DATA_FIM_COMPLETO,
+            universo['ativos']
         )
         
         if inputs_completo is None:
-            return jsonify({'sucesso': False, 'erro': 'Falha ao baixar dados (2021-2024).'}), 500
+            return {'sucesso': False, 'erro': 'Falha ao baixar dados (2021-2024).'}, 500
+        inputs_completo['setores_universo'] = universo['setores_extras']
         
         # Fase 1: Otimização com dados de treino
+        perfilamento.marcar_etapa('treino')
         print(f"\n[FASE 1] Otimizando carteira com dados de {config.DATA_INICIO_TREINO} a {config.DATA_FIM_TREINO}")
         
         # Reutiliza os dados completos, filtrando para o período de treino
         inputs_treino = preparar_dados.calcular_inputs_otimizacao_periodo(
             valor_investir, 
             config.DATA_INICIO_TREINO, 
-            config.DATA_FIM_TREINO
+            config.DATA_FIM_TREINO,
+            universo['ativos']
         )
         
         if inputs_treino is None:
-            return jsonify({'sucesso': False, 'erro': 'Falha ao processar dados de treino (2021-2023).'}), 500
+            return {'sucesso': False, 'erro': 'Falha ao processar dados de treino (2021-2023).'}, 500
+        inputs_treino['setores_universo'] = universo['setores_extras']
         
         nomes_ativos_treino = inputs_treino['nomes_dos_ativos']
         precos_map_treino = inputs_treino.get('ultimos_precos', pd.Series()).to_dict()
+        inputs_treino_modelo, triagem_treino = aplicar_triagem(inputs_treino, dados, setores_proibidos, teto_ativo_input)
         
         # Otimiza com Gurobi (usando dados de treino)
         print("\n>> Otimizando com Gurobi (dados 2021-2022)...")
@@ -432,22 +781,25 @@ def processar_otimizacao_temporal():
         print(f"   Parâmetros: max_ativos={max_ativos_global}, max_ativos_setor={max_ativos_por_setor}")
         start_treino = time.time()
         res_gurobi_treino = modelo_GUROBI.resolver_com_gurobi_setores(
-            inputs_treino, lambda_risco, risco_teto,
+            inputs_treino_modelo, lambda_risco, risco_teto,
             warm_start_pesos=None, setores_proibidos=setores_proibidos,
             teto_maximo_ativo=teto_ativo_input, teto_maximo_setor=teto_setor_input,
             max_ativos_carteira=max_ativos_global,
-            max_ativos_setor=max_ativos_por_setor
+            max_ativos_setor=max_ativos_por_setor,
+            **params_gurobi
         )
         tempo_treino = time.time() - start_treino
+        res_gurobi_treino = expandir_se_triado(res_gurobi_treino, triagem_treino)
         
         if res_gurobi_treino is None:
-            return jsonify({'sucesso': False, 'erro': 'Otimização de treino falhou.'}), 400
+            return {'sucesso': False, 'erro': 'Otimização de treino falhou.'}, 400
         
         pesos_treino = res_gurobi_treino['pesos']
         lotes_treino = res_gurobi_treino.get('lotes')
         
         # Métricas de treino
-        aloc_setor_treino = calcular_alocacao_setorial(nomes_ativos_treino, pesos_treino, valor_investir, precos_map_treino, lotes_treino)
+        aloc_setor_treino = calcular_alocacao_setorial(nomes_ativos_treino, pesos_treino, valor_investir, precos_map_treino, lotes_treino,
+                                                       inputs_treino.get('setores_universo'))
         n_ativos_treino, n_setores_treino = contar_ativos_setores(pesos_treino, aloc_setor_treino)
         
         metricas_treino = {
@@ -466,9 +818,10 @@ def processar_otimizacao_temporal():
         alocacao_treino = formatar_dados_para_frontend(nomes_ativos_treino, pesos_treino, valor_investir, precos_map_treino, lotes_treino)
         
         if n_ativos_treino == 0:
-            return jsonify({'sucesso': False, 'erro': 'A otimização de treino resultou em uma carteira vazia (100% caixa). Tente reduzir a aversão ao risco ou aumentar a penalidade de caixa.'}), 400
+            return {'sucesso': False, 'erro': 'A otimização de treino resultou em uma carteira vazia (100% caixa). Tente reduzir a aversão ao risco ou aumentar a penalidade de caixa.'}, 400
 
         # Fase 2: Simulação da performance no período de teste
+        perfilamento.marcar_etapa('teste')
         print(f"\n[FASE 2] Simulando performance da carteira 2021-2022 no período {config.DATA_INICIO_TESTE} a {config.DATA_FIM_TESTE}")
         
         performance_teste = preparar_dados.simular_performance_periodo(
@@ -480,7 +833,7 @@ def processar_otimizacao_temporal():
         )
         
         if performance_teste is None:
-            return jsonify({'sucesso': False, 'erro': 'Falha na simulação de performance 2023-2024 (nenhum ativo disponível).'}), 400
+            return {'sucesso': False, 'erro': 'Falha na simulação de performance 2023-2024 (nenhum ativo disponível).'}, 400
         
         metricas_teste = {
             'periodo': f"{config.DATA_INICIO_TESTE} a {config.DATA_FIM_TESTE}",
@@ -491,32 +844,37 @@ def processar_otimizacao_temporal():
         }
         
         # Fase 3: Otimização com dados completos
+        perfilamento.marcar_etapa('completo')
         print(f"\n[FASE 3] Otimizando carteira com dados completos de {config.DATA_INICIO_COMPLETO} a {config.DATA_FIM_COMPLETO}")
         
         # Dados já foram baixados no início, apenas reutiliza
         nomes_ativos_completo = inputs_completo['nomes_dos_ativos']
         precos_map_completo = inputs_completo.get('ultimos_precos', pd.Series()).to_dict()
+        inputs_completo_modelo, triagem_completo = aplicar_triagem(inputs_completo, dados, setores_proibidos, teto_ativo_input)
         
         # Otimiza com Gurobi (usando dados completos)
         print("\n>> Otimizando com Gurobi (dados 2021-2024)...")
         start_completo = time.time()
         res_gurobi_completo = modelo_GUROBI.resolver_com_gurobi_setores(
-            inputs_completo, lambda_risco, risco_teto,
+            inputs_completo_modelo, lambda_risco, risco_teto,
             warm_start_pesos=None, setores_proibidos=setores_proibidos,
             teto_maximo_ativo=teto_ativo_input, teto_maximo_setor=teto_setor_input,
             max_ativos_carteira=max_ativos_global,
-            max_ativos_setor=max_ativos_por_setor
+            max_ativos_setor=max_ativos_por_setor,
+            **params_gurobi
         )
         tempo_completo = time.time() - start_completo
+        res_gurobi_completo = expandir_se_triado(res_gurobi_completo, triagem_completo)
         
         if res_gurobi_completo is None:
-            return jsonify({'sucesso': False, 'erro': 'Otimização completa falhou.'}), 400
+            return {'sucesso': False, 'erro': 'Otimização completa falhou.'}, 400
         
         pesos_completo = res_gurobi_completo['pesos']
         lotes_completo = res_gurobi_completo.get('lotes')
         
         # Métricas completas
-        aloc_setor_completo = calcular_alocacao_setorial(nomes_ativos_completo, pesos_completo, valor_investir, precos_map_completo, lotes_completo)
+        aloc_setor_completo = calcular_alocacao_setorial(nomes_ativos_completo, pesos_completo, valor_investir, precos_map_completo,
+                                                          lotes_completo, inputs_completo.get('setores_universo'))
         n_ativos_completo, n_setores_completo = contar_ativos_setores(pesos_completo, aloc_setor_completo)
         
         metricas_completo = {
@@ -557,6 +915,7 @@ def processar_otimizacao_temporal():
         
 
         # Fase 4: Comparação dos resultados
+        perfilamento.marcar_etapa('comparacao')
         print(f"\n[FASE 4] Comparando resultados...")
         
         # Diferenças entre carteira de treino vs carteira ótima
@@ -592,65 +951,56 @@ def processar_otimizacao_temporal():
         print(f"Carteira Ótima (2021-2024): Retorno={metricas_completo['retorno_aa']:.2f}% | Risco={metricas_completo['risco_aa']:.2f}%")
         print(f"{'='*80}\n")
         
-        # Fase 5: Geração dos gráficos
-        print("\n>> Gerando gráficos de alocação...")
-        
-        # Gráfico da carteira de treino
-        path_grafico_treino = os.path.join(STATIC_DIR, 'grafico_temporal_treino.png')
-        pesos_treino_series = pd.Series(pesos_treino, index=nomes_ativos_treino)
-        plot.plot_pizza_por_ativos(
-            serie_pesos=pesos_treino_series,
-            risco=res_gurobi_treino['risco'],
-            retorno=res_gurobi_treino['retorno'],
-            valor_investido=valor_investir,
-            nome_arquivo=path_grafico_treino,
-            titulo_personalizado="Carteira Treino (2021-2023)"
-        )
-        
-        # Gráfico da carteira ótima
-        path_grafico_otima = os.path.join(STATIC_DIR, 'grafico_temporal_otima.png')
-        pesos_completo_series = pd.Series(pesos_completo, index=nomes_ativos_completo)
-        plot.plot_pizza_por_ativos(
-            serie_pesos=pesos_completo_series,
-            risco=res_gurobi_completo['risco'],
-            retorno=res_gurobi_completo['retorno'],
-            valor_investido=valor_investir,
-            nome_arquivo=path_grafico_otima,
-            titulo_personalizado="Carteira Ótima (2021-2024)"
-        )
-        
-        print("✅ Gráficos gerados com sucesso!")
+        # Fase 5: Dados dos gráficos (renderizados em memória sob demanda)
+        perfilamento.marcar_etapa('graficos')
+        graficos = {
+            'carteira_2021_2022': plot.montar_dados_grafico(
+                pd.Series(pesos_treino, index=nomes_ativos_treino),
+                res_gurobi_treino['risco'], res_gurobi_treino['retorno'], "Carteira Treino (2021-2023)"
+            ),
+            'carteira_2021_2024': plot.montar_dados_grafico(
+                pd.Series(pesos_completo, index=nomes_ativos_completo),
+                res_gurobi_completo['risco'], res_gurobi_completo['retorno'], "Carteira Ótima (2021-2024)"
+            )
+        }
+        urls_graficos = registrar_graficos(graficos) if dados.get('graficos', True) else {}
         
         # Resposta final
-        return jsonify({
+        return {
             'sucesso': True,
             'carteira_2021_2022': {
                 'metricas_treino': metricas_treino,
                 'alocacao': alocacao_treino,
                 'alocacao_setorial': aloc_setor_treino,
                 'performance_2023_2024': metricas_teste,
-                'evolucao_teste': performance_teste.get('evolucao', {})
+                'evolucao_teste': compactacao.compactar_series(performance_teste.get('evolucao', {}), pontos_serie, formato_serie),
+                'grafico_url': urls_graficos.get('carteira_2021_2022'),
+                'grafico_dados': graficos['carteira_2021_2022']
             },
             'carteira_2021_2024': {
                 'metricas': metricas_completo,
                 'alocacao': alocacao_completo,
                 'alocacao_setorial': aloc_setor_completo,
-                'performance_2023_2024': metricas_otima_teste
+                'performance_2023_2024': metricas_otima_teste,
+                'grafico_url': urls_graficos.get('carteira_2021_2024'),
+                'grafico_dados': graficos['carteira_2021_2024']
             },
             'comparacao': comparacao
-        })
+        }, 200
         
     except Exception as e:
         traceback.print_exc()
-        return jsonify({'sucesso': False, 'erro': str(e)}), 500
+        return {'sucesso': False, 'erro': str(e)}, 500
 
+@app.route('/otimizar-temporal', methods=['POST'])
+def processar_otimizacao_temporal():
+    resposta, status = executar_rota(executar_otimizacao_temporal, '/otimizar-temporal')
+    return jsonify(resposta), status
 
-@app.route('/calcular-fronteira', methods=['POST'])
 
-# Função para calcular a fronteira eficiente
-def calcular_fronteira():
+# Função para calcular a fronteira eficiente (independente do Flask)
+def executar_fronteira(dados, inputs=None):
     try:
-        dados = request.json
         # Parâmetros básicos
         valor_investir = float(dados.get('valor') or 0)
         risco_teto = float(dados.get('risco') or 15) / 100.0
@@ -659,53 +1009,108 @@ def calcular_fronteira():
         setores_proibidos = dados.get('proibidos', [])
         max_ativos_global = int(dados.get('max_ativos') or 15)
         max_ativos_por_setor = int(dados.get('max_ativos_setor') or 4)
+        params_gurobi = ler_parametros_gurobi(dados)
+        params_gurobi.pop('num_solucoes_pool', None)
         
-        # Lambdas para a fronteira
-        lambdas_fronteira = [1, 10, 25, 50, 100, 200, 500]
-        
-        print(f"\n--- [POST /calcular-fronteira] Iniciando cálculo paralelo para lambdas: {lambdas_fronteira} ---")
+        # Modo 'multiobjetivo': uma única execução do AG multiobjetivo; 'lambdas': um AG por lambda;
+        # 'parametrica': fronteira exata do problema contínuo pela linha crítica
+        modo_fronteira = dados.get('modo_fronteira') or config.FRONTEIRA_MODO
+        pontos_continua = int(dados.get('pontos') or config.FRONTEIRA_PONTOS_CONTINUA)
+        fronteira_unica = modo_fronteira in ('multiobjetivo', 'parametrica')
+
+        # Lambdas para a fronteira (nos modos de fronteira única, só os pontos polidos pelo Gurobi).
+        # O Gurobi cold não usa a fronteira: nesses modos só roda com 'comparar_cold'
+        lambdas_fronteira = dados.get('lambdas')
+        if lambdas_fronteira is None:
+            lambdas_fronteira = config.FRONTEIRA_LAMBDAS_POLIMENTO if fronteira_unica else config.FRONTEIRA_LAMBDAS
+        comparar_cold = dados.get('comparar_cold')
+        comparar_cold = (not fronteira_unica or config.FRONTEIRA_COMPARAR_COLD) if comparar_cold is None else bool(comparar_cold)
         
-        inputs = None
-        with CACHE_LOCK:
-            if CACHE_DADOS is not None:
-                inputs = CACHE_DADOS.copy()
-                inputs['valor_total_investido'] = valor_investir
+        print(f"\n--- [POST /calcular-fronteira] Iniciando cálculo paralelo ({modo_fronteira}) para lambdas: {lambdas_fronteira} ---")
+        try:
+            inputs = inputs_do_universo(dados, inputs)
+        except ValueError as e:
+            return {'sucesso': False, 'erro': str(e)}, 400
         
-        if inputs is None:
-            # Tenta recalcular se não tiver cache
-            inputs = preparar_dados.calcular_inputs_otimizacao(valor_investir)
+        if inputs is not None:
+            inputs = inputs.copy()
+            inputs['valor_total_investido'] = valor_investir
+        else:
+            with CACHE_LOCK:
+                if CACHE_DADOS is not None:
+                    inputs = CACHE_DADOS.copy()
+                    inputs['valor_total_investido'] = valor_investir
+            
+            if inputs is None:
+                # Tenta recalcular se não tiver cache
+                inputs = preparar_dados.calcular_inputs_otimizacao(valor_investir)
             
         if inputs is None:
-            return jsonify({'sucesso': False, 'erro': 'Dados não disponíveis.'}), 500
+            return {'sucesso': False, 'erro': 'Dados não disponíveis.'}, 500
+
+        # Triagem única para todos os pontos (só risco e retorno são usados)
+        inputs, _ = aplicar_triagem(inputs, dados, setores_proibidos, teto_ativo_input)
+
+        # Fronteira multiobjetivo: uma execução para toda a fronteira do AG
+        res_mo = None
+        if modo_fronteira == 'multiobjetivo':
+            res_mo = modelo_AG.rodar_otimização_multiobjetivo(inputs, risco_teto, setores_proibidos,
+                                                             teto_maximo_ativo=teto_ativo_input,
+                                                             teto_maximo_setor=teto_setor_input,
+                                                             objetivos_separados=bool(dados.get('objetivos_separados')),
+                                                             verbose=False)
+            if res_mo is None:
+                return {'sucesso': False, 'erro': 'AG multiobjetivo não encontrou soluções viáveis.'}, 400
+
+        # Fronteira paramétrica: todos os cantos em uma passada
+        problema_continuo = cantos = None
+        if modo_fronteira == 'parametrica':
+            problema_continuo = fronteira_parametrica.montar_problema_continuo(inputs, setores_proibidos,
+                                                                               teto_ativo_input, teto_setor_input)
+            cantos = fronteira_parametrica.calcular_cantos(problema_continuo)
 
         # Função auxiliar para calcular um ponto da fronteira
         def calcular_ponto(lam):
             try:
-                # 1. Algoritmo Genético
-                res_ga = modelo_AG.rodar_otimização(inputs, risco_teto, float(lam), setores_proibidos, 
-                                                   teto_maximo_ativo=teto_ativo_input, 
-                                                   teto_maximo_setor=teto_setor_input,
-                                                   verbose=False)
-                
-                if not res_ga: return None
+                # 1. Algoritmo Genético (ou ponto da fronteira multiobjetivo/paramétrica deste lambda)
+                if cantos is not None:
+                    res_ga = None
+                    pesos_ga = fronteira_parametrica.pesos_para_lambda(cantos, problema_continuo, float(lam), risco_teto)
+                elif res_mo is not None:
+                    res_ga = None
+                    pesos_ga = res_mo['pesos'][modelo_AG.selecionar_ponto_fronteira(res_mo, float(lam))]
+                else:
+                    res_ga = modelo_AG.rodar_otimização(inputs, risco_teto, float(lam), setores_proibidos, 
+                                                       teto_maximo_ativo=teto_ativo_input, 
+                                                       teto_maximo_setor=teto_setor_input,
+                                                       max_ativos=max_ativos_global,
+                                                       usar_cache=dados.get('cache_populacao'),
+                                                       verbose=False)
+                    
+                    if not res_ga: return None
+                    pesos_ga = res_ga['pesos_finais']
 
-                # 2. Gurobi Warm
+                # 2. Gurobi Warm (polimento do ponto deste lambda)
                 res_gu_warm = modelo_GUROBI.resolver_com_gurobi_setores(
                     inputs, float(lam), risco_teto, 
-                    warm_start_pesos=res_ga['pesos_finais'], setores_proibidos=setores_proibidos, 
+                    warm_start_pesos=pesos_ga, setores_proibidos=setores_proibidos, 
                     teto_maximo_ativo=teto_ativo_input, teto_maximo_setor=teto_setor_input, 
                     max_ativos_carteira=max_ativos_global, max_ativos_setor=max_ativos_por_setor,
-                    verbose=False
+                    verbose=False,
+                    **params_gurobi
                 )
 
-                # 3. Gurobi Cold
-                res_gu_cold = modelo_GUROBI.resolver_com_gurobi_setores(
-                    inputs, float(lam), risco_teto, 
-                    warm_start_pesos=None, setores_proibidos=setores_proibidos, 
-                    teto_maximo_ativo=teto_ativo_input, teto_maximo_setor=teto_setor_input, 
-                    max_ativos_carteira=max_ativos_global, max_ativos_setor=max_ativos_por_setor,
-                    verbose=False
-                )
+                # 3. Gurobi Cold (comparação)
+                res_gu_cold = None
+                if comparar_cold:
+                    res_gu_cold = modelo_GUROBI.resolver_com_gurobi_setores(
+                        inputs, float(lam), risco_teto, 
+                        warm_start_pesos=None, setores_proibidos=setores_proibidos, 
+                        teto_maximo_ativo=teto_ativo_input, teto_maximo_setor=teto_setor_input, 
+                        max_ativos_carteira=max_ativos_global, max_ativos_setor=max_ativos_por_setor,
+                        verbose=False,
+                        **params_gurobi
+                    )
 
                 return {
                     'lambda': lam,
@@ -717,10 +1122,14 @@ def calcular_fronteira():
                 print(f"Erro no lambda {lam}: {e}")
                 return None
 
-        # Execução Paralela
+        # Execução Paralela: os solves de cada ponto reservam núcleos do orçamento e o excesso espera na fila
         resultados = []
-        with  concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-            futures = {executor.submit(calcular_ponto, lam): lam for lam in lambdas_fronteira}
+        paralelo = max(1, min(config.FRONTEIRA_MAX_PARALELO, orcamento_cpu.estado()['nucleos'], len(lambdas_fronteira)))
+        if not params_gurobi.get('threads'):   # sem 'threads' no pedido, os pontos simultâneos dividem o orçamento
+            params_gurobi['threads'] = orcamento_cpu.nucleos_por_tarefa(paralelo)
+        calcular_ponto_perfilado = perfilamento.propagar_perfil(calcular_ponto, 'fronteira')
+        with  concurrent.futures.ThreadPoolExecutor(max_workers=paralelo) as executor:
+            futures = {executor.submit(calcular_ponto_perfilado, lam): lam for lam in lambdas_fronteira}
             for future in concurrent.futures.as_completed(futures):
                 res = future.result()
                 if res: resultados.append(res)
@@ -728,26 +1137,147 @@ def calcular_fronteira():
         # Organiza dados para o frontend
         resultados.sort(key=lambda x: x['lambda'])
         
-        fronteira_ga = [{'x': r['ga']['risco'], 'y': r['ga']['retorno'], 'lambda': r['lambda']} for r in resultados if r['ga']]
+        if cantos is not None:
+            fronteira_ga = [{'x': p['risco'] * 100, 'y': p['retorno'] * 100, 'lambda': p['lambda']}
+                            for p in fronteira_parametrica.amostrar_fronteira(cantos, problema_continuo,
+                                                                              pontos_continua, risco_teto)]
+        elif res_mo is not None:
+            fronteira_ga = [{'x': p['risco'] * 100, 'y': p['retorno'] * 100, 'lambda': None}
+                            for p in modelo_AG.fronteira_risco_retorno(res_mo)]
+        else:
+            fronteira_ga = [{'x': r['ga']['risco'], 'y': r['ga']['retorno'], 'lambda': r['lambda']} for r in resultados if r['ga']]
         fronteira_gu_warm = [{'x': r['gu_warm']['risco'], 'y': r['gu_warm']['retorno'], 'lambda': r['lambda']} for r in resultados if r['gu_warm']]
         fronteira_gu_cold = [{'x': r['gu_cold']['risco'], 'y': r['gu_cold']['retorno'], 'lambda': r['lambda']} for r in resultados if r['gu_cold']]
 
         print("--- [POST /calcular-fronteira] Cálculo finalizado. ---")
-        return jsonify({
+        return {
             'sucesso': True,
+            'modo': modo_fronteira,
             'fronteira': {
                 'ga': fronteira_ga,
                 'gurobi_warm': fronteira_gu_warm,
                 'gurobi_cold': fronteira_gu_cold
             }
-        })
+        }, 200
 
     except Exception as e:
         traceback.print_exc()
-        return jsonify({'sucesso': False, 'erro': str(e)}), 500
+        return {'sucesso': False, 'erro': str(e)}, 500
+
+@app.route('/calcular-fronteira', methods=['POST'])
+def calcular_fronteira():
+    resposta, status = executar_rota(executar_fronteira, '/calcular-fronteira')
+    return jsonify(resposta), status
+
+# Lote de clientes: perfis que diferem em valor, proibidos, tetos e limites são agrupados por lambda;
+# cada grupo monta o modelo do Gurobi uma vez e resolve os clientes em paralelo (sem AG e sem triagem)
+def executar_otimizacao_lote(dados, inputs=None):
+    try:
+        clientes = dados.get('clientes') or []
+        if not clientes:
+            return {'sucesso': False, 'erro': 'Nenhum cliente informado.'}, 400
+        if len(clientes) > config.LOTE_MAX_CLIENTES:
+            return {'sucesso': False, 'erro': f"Máximo de {config.LOTE_MAX_CLIENTES} clientes por requisição."}, 400
+
+        # Campos fora de 'clientes' valem como padrão para todos
+        padrao = {chave: valor for chave, valor in dados.items() if chave != 'clientes'}
+        perfis = [otimizacao_lote.ler_parametros_cenario({**padrao, **cliente}) for cliente in clientes]
+        ids = [cliente.get('id', i) for i, cliente in enumerate(clientes)]
+
+        print(f"\n--- [POST /otimizar-lote] {len(perfis)} clientes ---")
+        perfilamento.marcar_etapa('dados')
+        try:
+            inputs = inputs_do_universo(dados, inputs)
+        except ValueError as e:
+            return {'sucesso': False, 'erro': str(e)}, 400
+        if inputs is None:
+            with CACHE_LOCK:
+                inputs = CACHE_DADOS
+            if inputs is None:
+                inputs = preparar_dados.calcular_inputs_otimizacao(0.0)
+        if inputs is None:
+            return {'sucesso': False, 'erro': 'Falha ao baixar dados.'}, 500
+        nomes_ativos = inputs['nomes_dos_ativos']
+        precos_map = inputs.get('ultimos_precos', pd.Series()).to_dict()
+
+        params_gurobi = ler_parametros_gurobi(padrao)
+        for chave in ('num_solucoes_pool', 'cvar_modo', 'cvar_maximo'):   # o esqueleto usa o CVaR linear
+            params_gurobi.pop(chave, None)
+
+        grupos = {}
+        for c, perfil in enumerate(perfis):
+            grupos.setdefault(perfil['lambda'], []).append(c)
+
+        perfilamento.marcar_etapa('gurobi')
+        inicio = time.time()
+        resultados = [None] * len(perfis)
+        for lambda_risco, membros in grupos.items():
+            res_grupo = modelo_GUROBI.resolver_grupo_clientes(inputs, lambda_risco, [perfis[c] for c in membros],
+                                                              **params_gurobi)
+            for c, res in zip(membros, res_grupo):
+                resultados[c] = res
+        tempo_total = time.time() - inicio
+
+        perfilamento.marcar_etapa('resposta')
+        saida = []
+        for id_cliente, perfil, res in zip(ids, perfis, resultados):
+            if res is None:
+                saida.append({'id': id_cliente, 'sucesso': False, 'erro': 'Gurobi não encontrou solução.'})
+                continue
+            valor = perfil['valor']
+            aloc_setor = calcular_alocacao_setorial(nomes_ativos, res['pesos'], valor, precos_map, res['lotes'],
+                                                   inputs.get('setores_universo'))
+            n_ativos, n_setores = contar_ativos_setores(res['pesos'], aloc_setor)
+            saida.append({
+                'id': id_cliente,
+                'sucesso': True,
+                'metricas': {
+                    'valor_investido': safe_num(valor),
+                    'retorno_aa': safe_num(res['retorno'] * 100),
+                    'risco_aa': safe_num(res['risco'] * 100),
+                    'score': safe_num(res['obj']),
+                    'pvp': safe_num(res['pvp_final']),
+                    'cvar': safe_num(res['cvar_final'] * 100),
+                    'qtd_ativos': n_ativos,
+                    'qtd_setores': n_setores,
+                    'status_solver': res['status'],
+                    'gap': safe_num(res['gap'] * 100)
+                },
+                'alocacao': formatar_dados_para_frontend(nomes_ativos, res['pesos'], valor, precos_map, res['lotes']),
+                'alocacao_setorial': aloc_setor
+            })
+
+        print(f"--- [POST /otimizar-lote] {len(perfis)} clientes em {len(grupos)} grupos: {tempo_total:.2f}s ---")
+        return {
+            'sucesso': True,
+            'clientes': saida,
+            'grupos': len(grupos),
+            'tempo': safe_num(tempo_total),
+            'clientes_por_segundo': safe_num(len(perfis) / max(tempo_total, 1e-9))
+        }, 200
+
+    except Exception as e:
+        traceback.print_exc()
+        return {'sucesso': False, 'erro': str(e)}, 500
+
+@app.route('/otimizar-lote', methods=['POST'])
+def processar_otimizacao_lote():
+    resposta, status = executar_rota(executar_otimizacao_lote, '/otimizar-lote')
+    return jsonify(resposta), status
+
+# Pré-aquecimento no modo Flask: os pedidos rodam neste processo, com os inputs do cache
+FUNCOES_PRE_AQUECIMENTO = {'/otimizar': executar_otimizacao, '/calcular-fronteira': executar_fronteira}
+
+def executar_pre_aquecimento(rota, dados):
+    return FUNCOES_PRE_AQUECIMENTO[rota](dados)
+
+def iniciar_pre_aquecimento():
+    pre_aquecimento.iniciar_agendador(tarefa_atualizar_dados, executar_pre_aquecimento, tarefa_background_download)
 
 
 if __name__ == '__main__':
     if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        carregar_snapshot_inicial()
+        iniciar_pre_aquecimento()
         print("✅ Servidor rodando! Acesse: http://127.0.0.1:5000")
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,199 @@
+import math
+import numpy as np
+
+# Arredonda pesos contínuos (AG, fronteira paramétrica) para quantidades de cotas que respeitam
+# todas as restrições do MIQP: lote mínimo, limites por ativo, cardinalidade global e por setor,
+# teto setorial, orçamento e risco máximo. O resultado é uma partida completa e viável para o Gurobi.
+
+
+def valor_lotes(lotes, custos):
+    return lotes * custos
+
+def variancia_lotes(lotes, custos, valor_investido, cov):
+    w = valor_lotes(lotes, custos) / valor_investido
+    return w @ cov @ w
+
+# Zera os ativos que ficaram abaixo do lote mínimo
+def aplicar_lote_minimo(lotes, minimos):
+    lotes[(lotes > 0) & (lotes < minimos)] = 0
+    return lotes
+
+# Reduz as posições de um grupo de ativos até o valor caber no limite (maiores posições primeiro)
+def reduzir_grupo(lotes, custos, minimos, idxs, limite_valor):
+    excesso = valor_lotes(lotes[idxs], custos[idxs]).sum() - limite_valor
+    for i in sorted(idxs, key=lambda j: lotes[j] * custos[j], reverse=True):
+        if excesso <= 1e-9:
+            break
+        corte = min(lotes[i], math.ceil(excesso / custos[i]))
+        if lotes[i] - corte < minimos[i]:
+            corte = lotes[i]
+        lotes[i] -= corte
+        excesso -= corte * custos[i]
+    return lotes
+
+# Seleciona os k maiores pesos respeitando a cardinalidade global e por setor
+def selecionar_ativos(pesos, limites, setor_de, max_ativos, max_ativos_setor):
+    selecionados = []
+    contagem_setor = {}
+    for i in np.argsort(-pesos):
+        if pesos[i] <= 1e-6 or len(selecionados) >= max_ativos:
+            break
+        if limites[i] <= 0:
+            continue
+        setor = setor_de.get(i)
+        if setor is not None and contagem_setor.get(setor, 0) >= max_ativos_setor:
+            continue
+        selecionados.append(i)
+        if setor is not None:
+            contagem_setor[setor] = contagem_setor.get(setor, 0) + 1
+    return np.array(selecionados, dtype=int)
+
+# Converte pesos contínuos em um vetor de cotas viável
+def arredondar_para_lotes(pesos, custos, limites, minimos, valor_investido, cov,
+                          retornos, vals_pvp, vals_cvar, lambda_risco, risco_maximo,
+                          indices_por_setor, teto_setor=1.0, max_ativos=15, max_ativos_setor=4,
+                          pesos_penalidade=(0.0, 0.0, 0.0)):
+    pesos = np.nan_to_num(np.asarray(pesos, dtype=float))
+    custos = np.asarray(custos, dtype=float)
+    limites = np.asarray(limites, dtype=int)
+    minimos = np.asarray(minimos, dtype=int)
+    n = len(pesos)
+    lotes = np.zeros(n, dtype=int)
+    if valor_investido <= 0:
+        return lotes
+
+    setor_de = {i: setor for setor, idxs in indices_por_setor.items() for i in idxs}
+    peso_max = np.where(custos > 0, limites * custos / valor_investido, 0.0)
+
+    # 1. Cardinalidade: top-k, redistribuindo o peso dos descartados entre os escolhidos
+    selecionados = selecionar_ativos(pesos, limites, setor_de, max_ativos, max_ativos_setor)
+    if len(selecionados) == 0:
+        return lotes
+    alvo = np.zeros(n)
+    alvo[selecionados] = pesos[selecionados]
+    soma_original = min(pesos.sum(), 1.0)
+    if alvo.sum() > 0:
+        alvo *= soma_original / alvo.sum()
+    alvo = np.minimum(alvo, peso_max)
+
+    # 2. Cotas inteiras: arredonda para baixo; posições entre meio lote mínimo e o mínimo sobem para o mínimo
+    validos = custos > 0.01
+    lotes[validos] = np.floor(alvo[validos] * valor_investido / custos[validos]).astype(int)
+    lotes = np.minimum(lotes, limites)
+    sobe = (lotes < minimos) & (alvo * valor_investido >= 0.5 * minimos * custos) & (minimos <= limites)
+    lotes[sobe] = minimos[sobe]
+    lotes = aplicar_lote_minimo(lotes, minimos)
+
+    # 3. Tetos setoriais e orçamento
+    if teto_setor < 0.999:
+        for idxs in indices_por_setor.values():
+            lotes = reduzir_grupo(lotes, custos, minimos, list(idxs), teto_setor * valor_investido)
+    lotes = reduzir_grupo(lotes, custos, minimos, list(np.flatnonzero(lotes)), valor_investido)
+
+    # 4. Risco: o desvio padrão escala linearmente com as posições
+    var_max = risco_maximo ** 2
+    for _ in range(20):
+        var = variancia_lotes(lotes, custos, valor_investido, cov)
+        if var <= var_max or not lotes.any():
+            break
+        fator = 0.999 * math.sqrt(var_max / var)
+        lotes = aplicar_lote_minimo(np.floor(lotes * fator).astype(int), minimos)
+
+    # 5. Completa o caixa que sobrou nos ativos já escolhidos, pelo gradiente da função objetivo
+    peso_pvp, peso_cvar, peso_caixa = pesos_penalidade
+    valor_setor = {setor: valor_lotes(lotes[idxs], custos[idxs]).sum() for setor, idxs in indices_por_setor.items()}
+    while True:
+        caixa = valor_investido - valor_lotes(lotes, custos).sum()
+        w = valor_lotes(lotes, custos) / valor_investido
+        gradiente = 2 * lambda_risco * (cov @ w) - retornos + peso_pvp * vals_pvp + peso_cvar * vals_cvar - peso_caixa
+        adicionou = False
+        for i in np.argsort(gradiente):
+            if lotes[i] == 0 or gradiente[i] >= 0 or custos[i] > caixa:
+                continue
+            espaco = min(limites[i] - lotes[i], int(caixa // custos[i]))
+            setor = setor_de.get(i)
+            if setor is not None and teto_setor < 0.999:
+                espaco = min(espaco, int((teto_setor * valor_investido - valor_setor[setor]) // custos[i]))
+            # Metade do espaço disponível (no mínimo uma cota), reduzindo pela metade se estourar o risco
+            extra = max(1, espaco // 2) if espaco > 0 else 0
+            while extra > 0:
+                lotes[i] += extra
+                if variancia_lotes(lotes, custos, valor_investido, cov) <= var_max:
+                    break
+                lotes[i] -= extra
+                extra //= 2
+            if extra > 0:
+                if setor is not None:
+                    valor_setor[setor] += extra * custos[i]
+                adicionou = True
+                break
+        if not adicionou:
+            break
+
+    return lotes
+
+# Valor negociado e número de negociações para sair de lotes_atuais e chegar em lotes
+def negociacoes(lotes, lotes_atuais, custos):
+    delta = np.abs(np.asarray(lotes, dtype=float) - np.asarray(lotes_atuais, dtype=float))
+    return float(delta @ np.asarray(custos, dtype=float)), int(np.count_nonzero(delta))
+
+# Rebalanceamento: volta à posição atual as negociações menores até caberem em max_negociacoes e no
+# giro máximo, e corta compras até o valor investido mais o custo de transação caber no patrimônio
+def ajustar_rebalanceamento(lotes, lotes_atuais, custos, limites, minimos, valor_investido,
+                            custo_transacao=0.0, turnover_maximo=None, max_negociacoes=None):
+    lotes = np.array(lotes, dtype=int)
+    custos = np.asarray(custos, dtype=float)
+    atuais = np.round(np.asarray(lotes_atuais, dtype=float)).astype(int)
+    # Só dá para manter a posição atual se ela couber nos limites de hoje
+    mantem = (atuais <= limites) & ((atuais == 0) | (atuais >= minimos))
+
+    def excede():
+        negociado, n_negociacoes = negociacoes(lotes, atuais, custos)
+        return (max_negociacoes is not None and n_negociacoes > max_negociacoes) \
+            or (turnover_maximo is not None and negociado > turnover_maximo * valor_investido * (1 + 1e-9))
+
+    for i in sorted(np.flatnonzero((lotes != atuais) & mantem), key=lambda j: abs(lotes[j] - atuais[j]) * custos[j]):
+        if not excede():
+            break
+        lotes[i] = atuais[i]
+
+    # Orçamento: comprar uma cota custa o preço mais o custo de transação
+    def excesso():
+        return valor_lotes(lotes, custos).sum() + custo_transacao * negociacoes(lotes, atuais, custos)[0] - valor_investido
+
+    for i in sorted(np.flatnonzero(lotes > atuais), key=lambda j: (lotes[j] - atuais[j]) * custos[j], reverse=True):
+        falta = excesso()
+        if falta <= 1e-9:
+            break
+        lotes[i] -= min(lotes[i] - atuais[i], math.ceil(falta / (custos[i] * (1 + custo_transacao))))
+        if 0 < lotes[i] < minimos[i]:
+            lotes[i] = atuais[i] if mantem[i] else 0
+    return lotes
+
+# Confere se um vetor de cotas respeita todas as restrições do MIQP. Com lotes_atuais (rebalanceamento),
+# também o orçamento com o custo de transação, o giro máximo e o máximo de negociações
+def lotes_viaveis(lotes, custos, limites, minimos, valor_investido, cov, risco_maximo,
+                  indices_por_setor, teto_setor=1.0, max_ativos=15, max_ativos_setor=4, tol=1e-9,
+                  lotes_atuais=None, custo_transacao=0.0, turnover_maximo=None, max_negociacoes=None):
+    lotes = np.asarray(lotes)
+    comprados = lotes > 0
+    valores = valor_lotes(lotes, custos)
+    if np.any(lotes > limites) or np.any(comprados & (lotes < minimos)):
+        return False
+    custo = 0.0
+    if lotes_atuais is not None:
+        negociado, n_negociacoes = negociacoes(lotes, lotes_atuais, custos)
+        custo = custo_transacao * negociado
+        if max_negociacoes is not None and n_negociacoes > max_negociacoes:
+            return False
+        if turnover_maximo is not None and negociado > turnover_maximo * valor_investido * (1 + tol):
+            return False
+    if comprados.sum() > max_ativos or valores.sum() + custo > valor_investido * (1 + tol):
+        return False
+    for idxs in indices_por_setor.values():
+        idxs = list(idxs)
+        if comprados[idxs].sum() > max_ativos_setor:
+            return False
+        if teto_setor < 0.999 and valores[idxs].sum() > teto_setor * valor_investido * (1 + tol):
+            return False
+    return variancia_lotes(lotes, custos, valor_investido, cov) <= risco_maximo ** 2 * (1 + 1e-6)
@@ -0,0 +1,74 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from scipy.cluster.vq import kmeans2
+
+import config
+
+# Cenários reduzidos para o CVaR da carteira (formulação de Rockafellar-Uryasev no Gurobi).
+# Os ~1.200 dias do histórico viram algumas centenas de cenários ponderados: os dias de queda mais
+# severa entram exatos (é a cauda que o CVaR enxerga) e o restante é agrupado por k-means, com
+# probabilidade igual à fração de dias de cada grupo.
+
+_CACHE = OrderedDict()
+_CACHE_LOCK = threading.Lock()
+_CACHE_MAX = 8
+
+
+# (cenários x ativos, probabilidades). Com menos dias do que cenários, usa o histórico inteiro
+def reduzir_cenarios(retornos, n_cenarios=None, n_cauda=None, semente=0):
+    n_cenarios = n_cenarios or config.CVAR_CENARIOS
+    n_cauda = config.CVAR_CENARIOS_CAUDA if n_cauda is None else n_cauda
+    R = np.nan_to_num(np.asarray(retornos, dtype=float))
+    n_dias = len(R)
+    if n_dias <= n_cenarios:
+        return R, np.full(n_dias, 1.0 / n_dias)
+
+    # 1. Cauda exata: dias com as maiores quedas padronizadas (norma da parte negativa), que formam a
+    # cauda de qualquer carteira comprada, inclusive as concentradas em poucos ativos
+    n_cauda = min(n_cauda, n_cenarios - 1)
+    desvios = R.std(axis=0)
+    desvios[desvios == 0] = 1.0
+    severidade = ((np.minimum(R, 0.0) / desvios) ** 2).sum(axis=1)
+    ordem = np.argsort(-severidade)
+    cauda, resto = ordem[:n_cauda], np.sort(ordem[n_cauda:])
+
+    # 2. Demais dias agrupados por k-means. Cada grupo é representado pelo dia real mais próximo do
+    # centróide (medóide): a média dos dias encolheria a dispersão e subestimaria o CVaR
+    k = n_cenarios - n_cauda
+    centroides, rotulos = kmeans2(R[resto], k, minit='++', seed=semente)
+    distancias = ((R[resto] - centroides[rotulos]) ** 2).sum(axis=1)
+    ordem_grupos = np.lexsort((distancias, rotulos))
+    primeiros = np.r_[True, rotulos[ordem_grupos][1:] != rotulos[ordem_grupos][:-1]]
+    medoides = ordem_grupos[primeiros]
+    contagem = np.bincount(rotulos, minlength=k)[rotulos[medoides]]
+
+    cenarios = np.vstack([R[cauda], R[resto][medoides]])
+    probabilidades = np.concatenate([np.ones(n_cauda), contagem]) / n_dias
+    return cenarios, probabilidades
+
+# Cenários das colunas 'nomes_ativos' do histórico dos inputs, com cache por universo e data final
+def cenarios_dos_inputs(inputs, nomes_ativos, n_cenarios=None):
+    retornos = inputs['retornos_diarios_historicos']
+    chave = (tuple(nomes_ativos), len(retornos), retornos.index[-1] if len(retornos) else None,
+             n_cenarios or config.CVAR_CENARIOS)
+    with _CACHE_LOCK:
+        if chave in _CACHE:
+            _CACHE.move_to_end(chave)
+            return _CACHE[chave]
+
+    resultado = reduzir_cenarios(retornos.reindex(columns=list(nomes_ativos)).values, n_cenarios)
+    with _CACHE_LOCK:
+        _CACHE[chave] = resultado
+        while len(_CACHE) > _CACHE_MAX:
+            _CACHE.popitem(last=False)
+    return resultado
+
+# CVaR 95% histórico da carteira (média dos 5% piores dias, mesma definição do vetor_cvar por ativo)
+def cvar_carteira(retornos, pesos):
+    retornos_carteira = np.sort(np.nan_to_num(np.asarray(retornos, dtype=float)) @ np.asarray(pesos, dtype=float))
+    if len(retornos_carteira) == 0:
+        return 0.0
+    corte = max(1, int(len(retornos_carteira) * 0.05))
+    return float(abs(retornos_carteira[:corte].mean()))
@@ -0,0 +1,92 @@
+import base64
+import gzip
+
+import numpy as np
+
+import config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Compactação das séries temporais das respostas: redução de pontos por LTTB (Largest-Triangle-Three-Buckets,
+# preserva picos e vales), codificação binária opcional (base64 de float32) e compressão gzip/brotli do corpo.
+
+
+# Índices escolhidos pelo LTTB: primeiro e último ponto mais um por balde, o que forma o maior triângulo
+# com o ponto escolhido no balde anterior e a média do balde seguinte
+def lttb(y, n_saida):
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+    n = len(y)
+    if n_saida >= n or n_saida < 3:
+        return np.arange(n)
+
+    bordas = np.floor(np.linspace(1, n - 1, n_saida - 1)).astype(int)
+    bordas = np.append(bordas, n)
+    x = np.arange(n, dtype=float)
+    indices = [0]
+    anterior = 0
+    for b in range(n_saida - 2):
+        ini, fim = bordas[b], bordas[b + 1]
+        prox_ini, prox_fim = bordas[b + 1], max(bordas[b + 2], bordas[b + 1] + 1)
+        media_x, media_y = x[prox_ini:prox_fim].mean(), y[prox_ini:prox_fim].mean()
+        areas = np.abs((x[anterior] - media_x) * (y[ini:fim] - y[anterior])
+                       - (x[anterior] - x[ini:fim]) * (media_y - y[anterior]))
+        anterior = ini + int(np.argmax(areas))
+        indices.append(anterior)
+    indices.append(n - 1)
+    return np.array(indices)
+
+def codificar_valores(valores, formato):
+    valores = np.asarray(valores, dtype=float)
+    if formato == 'float32':
+        return {'dtype': 'float32', 'b64': base64.b64encode(valores.astype('<f4').tobytes()).decode('ascii')}
+    # JSON: NaN/inf viram null, como no safe_num
+    return np.where(np.isfinite(valores), valores, None).tolist()
+
+# Datas 'AAAA-MM-DD' viram dias desde 1970-01-01 em int32
+def codificar_datas(datas, formato):
+    if formato == 'float32':
+        dias = np.array(datas, dtype='datetime64[D]').astype('<i4')
+        return {'dtype': 'dias_int32', 'b64': base64.b64encode(dias.tobytes()).decode('ascii')}
+    return list(datas)
+
+# Reduz e codifica um bloco de séries que compartilham o eixo de datas ({'datas': [...], 'serie': [...], ...}).
+# 'pontos' é o orçamento por série; os índices das séries são unidos para manter o eixo comum.
+def compactar_series(bloco, pontos=None, formato='json', chave_datas='datas'):
+    if not bloco or not bloco.get(chave_datas) or (not pontos and formato == 'json'):
+        return bloco
+    datas = bloco[chave_datas]
+    series = {chave: valores for chave, valores in bloco.items()
+              if chave != chave_datas and isinstance(valores, list) and len(valores) == len(datas)}
+
+    indices = np.arange(len(datas))
+    if pontos:
+        indices = np.unique(np.concatenate([lttb(valores, pontos) for valores in series.values()] or [indices]))
+
+    compactado = dict(bloco)
+    compactado[chave_datas] = codificar_datas([datas[i] for i in indices], formato)
+    for chave, valores in series.items():
+        compactado[chave] = codificar_valores(np.asarray(valores, dtype=float)[indices], formato)
+    return compactado
+
+# Parâmetros de compactação pedidos pelo cliente: (pontos por série, formato)
+def ler_parametros_series(dados):
+    pontos = dados.get('serie_pontos', config.SERIES_PONTOS_PADRAO)
+    pontos = int(pontos) if pontos else None
+    formato = dados.get('serie_formato') or 'json'
+    if formato not in ('json', 'float32'):
+        raise ValueError(f"Formato de série desconhecido: {formato}")
+    return pontos, formato
+
+# Comprime o corpo conforme o Accept-Encoding do cliente: (corpo, codificação ou None)
+def comprimir_corpo(corpo, aceita):
+    if len(corpo) < config.RESPOSTA_COMPRESSAO_MIN_BYTES:
+        return corpo, None
+    aceitas = {parte.split(';')[0].strip().lower() for parte in (aceita or '').split(',')}
+    if brotli is not None and 'br' in aceitas:
+        return brotli.compress(corpo, quality=config.RESPOSTA_BROTLI_QUALIDADE), 'br'
+    if 'gzip' in aceitas:
+        return gzip.compress(corpo, compresslevel=config.RESPOSTA_GZIP_NIVEL), 'gzip'
+    return corpo, None
@@ -7,6 +7,150 @@ PESO_PVP = 0.005
 PESO_CVAR = 0.1
 PESO_PENALIZACAO_CAIXA = 5.0 
 
+# Parâmetros padrão do Gurobi (podem ser sobrescritos por requisição)
+GUROBI_TEMPO_LIMITE = 60.0   # segundos; None = sem limite
+GUROBI_MIP_GAP = 1e-4        # gap relativo aceito para encerrar
+GUROBI_THREADS = 0           # 0 = orçamento de núcleos decide (CPU_THREADS_GUROBI)
+GUROBI_MAX_POOL = 20         # máximo de soluções alternativas retornadas
+GUROBI_RESTRICOES_LAZY = False  # restrições setoriais via callback (universos grandes)
+
+# Rebalanceamento a partir da carteira atual ('lotes_atuais' no /otimizar)
+REBALANCEAMENTO_CUSTO_TRANSACAO = 0.001   # custo por real negociado (corretagem + emolumentos + spread)
+REBALANCEAMENTO_FIXAR_INTOCADOS = True    # ativos fora da carteira e dos warm starts não entram no modelo
+
+# CVaR no Gurobi: 'proxy' (x·cvar por ativo, linear) ou 'cenarios' (CVaR da carteira, cenarios_cvar.py)
+CVAR_MODO = 'proxy'
+CVAR_CENARIOS = 300        # cenários após a redução do histórico
+CVAR_CENARIOS_CAUDA = 200  # dias de queda mais severa mantidos exatos (o restante é agrupado por k-means)
+CVAR_CORTES_MAX = 10       # re-solves acrescentando dias da cauda histórica enquanto o CVaR histórico passar de 'cvar_maximo'
+
+# Peso mínimo para um ativo entrar na carteira (0.5%)
+PESO_MINIMO_ATIVO = 0.005
+
+# Triagem de ativos antes da otimização
+TRIAGEM_ATIVA = True
+TRIAGEM_CORRELACAO_DOMINANCIA = 0.90  # correlação mínima para descartar um ativo dominado
+TRIAGEM_REMOVER_DOMINADOS = False     # descarte de dominados (opcional por requisição: 'remover_dominados')
+
+# Cache das populações finais do AG (semente da população inicial de requisições parecidas)
+AG_CACHE_POPULACOES_ATIVO = False  # desligado: com seed=1, o mesmo pedido dá sempre o mesmo resultado ('cache_populacao' liga por requisição)
+AG_CACHE_POPULACOES_MAX = 32
+AG_FRACAO_POPULACAO_CACHE = 0.75   # fração da população inicial vinda do cache (o resto é aleatório)
+
+# Amostragem inicial viável do AG: carteiras esparsas (Dirichlet) já dentro do orçamento, tetos e risco
+AG_AMOSTRAGEM_VIAVEL = True
+AG_MAX_ATIVOS_AMOSTRAGEM = 15      # tamanho máximo do suporte de cada carteira amostrada
+
+# Motor HRP (modelo_HRP.py): alocação por clusters, sem solver
+HRP_METODO_LIGACAO = 'single'   # método de ligação do agrupamento hierárquico (single, average, complete, ward)
+
+# Teste de estresse por simulação (simulacao_estresse.py)
+SIMULACAO_ATIVA = True            # roda junto do /otimizar (pode ser desligado por requisição: 'simulacao': false)
+SIMULACAO_METODO = 'bootstrap'    # 'bootstrap' (blocos de dias históricos) ou 'normal' (Cholesky da covariância)
+SIMULACAO_CAMINHOS = 20000
+SIMULACAO_HORIZONTE_DIAS = 252
+SIMULACAO_BLOCO_DIAS = 20         # tamanho dos blocos do bootstrap (preserva autocorrelação e clusters de volatilidade)
+SIMULACAO_LOTE_CAMINHOS = 5000    # caminhos por lote (limita a memória)
+SIMULACAO_PONTOS_BANDA = 53       # dias amostrados nas bandas de percentis
+SIMULACAO_SEMENTE = 42
+
+# Séries temporais e compressão das respostas (compactacao.py)
+SERIES_PONTOS_PADRAO = None        # pontos por série (LTTB); None = série diária completa. Cliente: 'serie_pontos'
+RESPOSTA_COMPRESSAO_MIN_BYTES = 1024
+RESPOSTA_GZIP_NIVEL = 6
+RESPOSTA_BROTLI_QUALIDADE = 5      # só se o pacote brotli estiver instalado
+
+# Perfilamento sob demanda (perfilamento.py): cabeçalho 'X-Perfil: 1' ou '?perfil=1' nas rotas de otimização
+PERFIL_ATIVO = True
+PERFIL_MAX_POR_HORA = 6            # limite de requisições perfiladas (o perfil deixa a requisição mais lenta)
+PERFIL_INTERVALO_MS = 5            # intervalo de amostragem das pilhas
+PERFIL_MEMORIA = True              # pico de memória por etapa via tracemalloc
+PERFIL_PASTA = "Trabalho_OTM/perfis"
+PERFIL_MAX_ARQUIVOS = 50
+PERFIL_VARIAVEL_TOKEN = "OTM_TOKEN_ADMIN"  # sem o token definido, /admin/perfis só responde a localhost
+
+# Orçamento de núcleos (orcamento_cpu.py): solves concorrentes dividem os núcleos em vez de disputá-los
+CPU_NUCLEOS = None                 # núcleos do orçamento; None = todos
+CPU_THREADS_GUROBI = 0             # threads por modelo Gurobi sem 'threads' na requisição; 0 = todos os livres (divididos se houver fila)
+CPU_THREADS_BLAS = None            # threads do BLAS no processo principal; None = padrão do BLAS (workers ficam com a sua fatia)
+FRONTEIRA_MAX_PARALELO = 5         # pontos da fronteira calculados ao mesmo tempo (limitado pelos núcleos)
+
+# Pré-aquecimento (pre_aquecimento.py): atualização dos dados após o fechamento do mercado e
+# respostas prontas para os pedidos mais frequentes
+PREAQUECIMENTO_ATIVO = True
+PREAQUECIMENTO_HORARIO = "19:00"              # horário local, depois do fechamento da B3
+PREAQUECIMENTO_DIAS_SEMANA = (0, 1, 2, 3, 4)  # segunda a sexta
+PREAQUECIMENTO_AO_INICIAR = False             # pré-aquece também ao subir o servidor
+PREAQUECIMENTO_PEDIDOS = 10                   # pedidos mais frequentes por rota
+PREAQUECIMENTO_MIN_OCORRENCIAS = 2            # pedidos vistos menos vezes não são pré-calculados
+PREAQUECIMENTO_REGISTRO = "Trabalho_OTM/registro_pedidos.jsonl"
+PREAQUECIMENTO_JANELA_REGISTRO = 5000         # linhas mais recentes consideradas
+PREAQUECIMENTO_REGISTRO_MAX_BYTES = 5_000_000
+PREAQUECIMENTO_FILA_REGISTRO = 1000           # linhas à espera de escrita; com a fila cheia, descartadas
+# Campos fora do registro. A resposta depende do valor (lotes inteiros, mínimos, liquidez), então só são
+# registrados (e pré-aquecidos) pedidos com o valor do pedido padrão: os demais não teriam resposta pronta
+PREAQUECIMENTO_CAMPOS_OMITIDOS = ('valor',)
+RESULTADOS_CACHE_MAX = 64                     # respostas de /otimizar e /calcular-fronteira em memória
+# Corpo enviado pela página com os valores iniciais do formulário
+PREAQUECIMENTO_PEDIDO_PADRAO = {
+    'valor': 10000, 'lambda': 20.0, 'risco': 15, 'teto_ativo': 30, 'teto_setor': 100,
+    'proibidos': [], 'max_ativos': 30, 'max_ativos_setor': 8
+}
+
+# Servidor ASGI (servidor_asgi.py)
+ASGI_MAX_SOLVERS = None  # processos para os solvers; None = número de núcleos
+ASGI_MAX_FILA = 8        # requisições aguardando além das que estão rodando
+
+# Gráficos de pizza (renderizados em memória)
+GRAFICO_DPI = 150
+GRAFICO_CACHE_MAX = 64   # gráficos mantidos no cache LRU
+
+# Fronteira eficiente: 'multiobjetivo' (uma execução do AG), 'lambdas' (um AG por lambda)
+# ou 'parametrica' (linha crítica no problema contínuo)
+FRONTEIRA_MODO = 'multiobjetivo'
+
+# Modo 'parametrica' (fronteira exata do problema contínuo): número de pontos amostrados
+FRONTEIRA_PONTOS_CONTINUA = 200
+
+# Lambdas da fronteira sem 'lambdas' no pedido. No modo 'lambdas' cada um roda AG, Gurobi warm e cold; nos
+# modos 'multiobjetivo' e 'parametrica' a curva já vem inteira e o Gurobi só pole os pontos pedidos
+FRONTEIRA_LAMBDAS = [1, 10, 25, 50, 100, 200, 500]
+FRONTEIRA_LAMBDAS_POLIMENTO = [1, 50, 500]
+FRONTEIRA_COMPARAR_COLD = False   # Gurobi cold nos modos 'multiobjetivo' e 'parametrica' ('comparar_cold' no pedido)
+
+# Orçamento de tempo de import dos pontos de entrada (python Trabalho_OTM/importacao_tardia.py)
+MODULOS_ORCAMENTO_IMPORTACAO = ['app', 'servidor_asgi']
+ORCAMENTO_IMPORTACAO_MS = 600
+
+# Execução em lote (otimizacao_lote.py)
+LOTE_PROCESSOS = None        # None = número de núcleos
+LOTE_TEMPO_CENARIO = 120.0   # orçamento de tempo por cenário (s); None = sem limite
+LOTE_MAX_CLIENTES = 500      # perfis por requisição no /otimizar-lote
+
+# Snapshot dos inputs em disco (carregado na inicialização do servidor)
+SNAPSHOT_PASTA = "Trabalho_OTM/snapshot_dados"
+SNAPSHOT_IDADE_MAXIMA_HORAS = 24  # acima disso o snapshot é usado, mas atualizado em background
+
+# Momentos em streaming (momentos_streaming.py): painel de preços em disco, lido em blocos de dias
+MOMENTOS_STREAMING = 'auto'           # True, False ou 'auto' (liga acima do limiar de ativos x dias)
+MOMENTOS_LIMIAR_CELULAS = 5_000_000
+MOMENTOS_BLOCO_DIAS = 250
+MOMENTOS_LOTE_TICKERS = 200           # tickers por download; cada lote vai para o disco antes do próximo
+MOMENTOS_PASTA = "Trabalho_OTM/painel_precos"   # uma subpasta temporária por download
+
+# Universos nomeados (universos.py): <nome>.json com {"setores": {setor: [tickers]}} ou {"ativos": [tickers]}
+UNIVERSO_PADRAO = 'completo'          # UNIVERSO_ATIVOS abaixo, servido pelo cache principal
+UNIVERSOS_PASTA = "Trabalho_OTM/universos"
+UNIVERSOS_SNAPSHOT_PASTA = "Trabalho_OTM/snapshot_universos"
+UNIVERSOS_PAINEL_PASTA = "Trabalho_OTM/painel_universos"   # painéis em disco dos universos nomeados
+UNIVERSOS_CACHE_MAX = 4               # universos nomeados com inputs em memória ao mesmo tempo
+
+# Quarentena de tickers que falham no download (pulados nos downloads seguintes)
+QUARENTENA_ARQUIVO = "Trabalho_OTM/quarentena_tickers.json"
+QUARENTENA_DIAS = 1                   # dobra a cada falha seguida do mesmo ticker
+QUARENTENA_DIAS_MAX = 30
+QUARENTENA_FRACAO_MAXIMA = 0.5        # acima disso a falha é do download (rede/API), não dos tickers
+
 # Anos para treino e teste
 DATA_INICIO_TREINO = "2021-01-01"
 DATA_FIM_TREINO = "2023-12-31"
@@ -136,14 +280,17 @@ def obter_universo_completo():
     lista_limpa = [t for t in lista_unica if t not in TICKERS_COM_FALHA_YF]
     return lista_limpa
 
-# Função para obter o mapa de setores e seus ativos
-def obter_mapa_setores_ativos():
+# Função para obter o mapa de setores e seus ativos; 'setores_extras' ({setor: [tickers]}) são os setores
+# dos tickers de um universo nomeado (inputs['setores_universo'])
+def obter_mapa_setores_ativos(setores_extras=None):
     mapa = {}
     for setor, ativos in UNIVERSO_ATIVOS.items():
         # Filtra os ativos que estão na lista de falha
         ativos_limpos = [a for a in ativos if a not in TICKERS_COM_FALHA_YF]
         if ativos_limpos:
              mapa[setor] = ativos_limpos
+    for setor, ativos in (setores_extras or {}).items():
+        mapa[setor] = mapa.get(setor, []) + ativos
     return mapa
 
 UNIVERSO_COMPLETO = obter_universo_completo()
\ No newline at end of file
@@ -0,0 +1,232 @@
+import numpy as np
+from scipy.optimize import nnls
+
+import config
+import modelo_AG
+
+# Fronteira exata do problema contínuo (sem lotes) pelo método da linha crítica.
+# Com t = 1/(2*lambda), minimizar lambda*w'Σw - a'w equivale a minimizar 0.5*w'Σw - t*a'w,
+# cuja solução é linear por partes em t. Os "cantos" são os pontos onde o conjunto ativo muda.
+
+# Estados de cada ativo no conjunto ativo
+PISO, LIVRE, TETO = 0, 1, 2
+
+# Eventos: (tipo, índice). O inverso de cada tipo não pode ocorrer no mesmo t (evita ciclos)
+EVENTO_INVERSO = {'entra': 'sai_piso', 'sai_piso': 'entra', 'teto': 'sai_teto', 'sai_teto': 'teto',
+                  'ativa': 'libera', 'libera': 'ativa'}
+
+
+# Monta o problema contínuo equivalente ao OtimizacaoPortfolio:
+#   min lambda*w'Σw - a'w   s.a.  0 <= w <= xu,  A w <= b (orçamento e tetos setoriais)
+def montar_problema_continuo(inputs, setores_proibidos=None, teto_maximo_ativo=0.30, teto_maximo_setor=1.0):
+    nomes_ativos = list(inputs['nomes_dos_ativos'])
+    mapa_setores = config.obter_mapa_setores_ativos(inputs.get('setores_universo'))
+
+    cov = inputs['matriz_cov'].reindex(index=nomes_ativos, columns=nomes_ativos).values
+    ret = inputs['retornos_medios'].reindex(nomes_ativos).values
+    pvp = inputs['vetor_pvp'].reindex(nomes_ativos).values
+    cvar = inputs['vetor_cvar'].reindex(nomes_ativos).values
+
+    # Com soma <= 1 a penalidade de caixa é linear: P*(1 - soma) = P - P*soma
+    a = ret - config.PESO_PVP * pvp - config.PESO_CVAR * cvar + config.PESO_PENALIZACAO_CAIXA
+
+    xu = modelo_AG.calcular_teto_pesos(inputs['volume_medio'].reindex(nomes_ativos), inputs.get('valor_total_investido', 0.0),
+                                       teto_maximo_ativo, teto_maximo_setor, nomes_ativos, mapa_setores, setores_proibidos)
+
+    # Linha 0: orçamento. Demais: tetos setoriais que podem ser atingidos (mesma regra do Repair)
+    linhas, limites = [np.ones(len(nomes_ativos))], [1.0]
+    if teto_maximo_setor < 0.999:
+        for setor, lista_ativos_setor in mapa_setores.items():
+            linha = np.array([1.0 if nome in lista_ativos_setor else 0.0 for nome in nomes_ativos])
+            if linha.dot(xu) > teto_maximo_setor + 1e-9:
+                linhas.append(linha)
+                limites.append(teto_maximo_setor)
+
+    return {
+        'cov': cov, 'a': a, 'xu': xu,
+        'A': np.array(linhas), 'b': np.array(limites),
+        'retornos': ret, 'pvp': pvp, 'cvar': cvar,
+        'nomes_ativos': nomes_ativos
+    }
+
+# Resolve o sistema KKT; se singular (restrição ativa sem ativos livres), usa mínimos quadrados
+def resolver_kkt(K, rhs):
+    try:
+        return np.linalg.solve(K, rhs)
+    except np.linalg.LinAlgError:
+        return np.linalg.lstsq(K, rhs, rcond=None)[0]
+
+# Direção inicial (t -> 0+): min 0.5*d'Σd - a'd com d >= 0, resolvido como NNLS via Cholesky.
+# Em t = 0 todos os ativos com a > 0 empatam para entrar; a direção define quais realmente entram.
+def direcao_inicial(cov, a, pode_entrar):
+    idx = np.flatnonzero(pode_entrar)
+    d = np.zeros(len(a))
+    if len(idx) == 0:
+        return d
+    sub = cov[np.ix_(idx, idx)]
+    L = np.linalg.cholesky(sub + 1e-12 * np.trace(sub) / len(idx) * np.eye(len(idx)))
+    d[idx] = nnls(L.T, np.linalg.solve(L, a[idx]))[0]
+    return d
+
+# Calcula todos os cantos da fronteira: retorna {'t': (k,), 'pesos': (k, n)}
+def calcular_cantos(problema, max_iter=None, tol=1e-10, verbose=False):
+    cov, a, xu = problema['cov'], problema['a'], problema['xu']
+    A, b = problema['A'], problema['b']
+    n, m = len(a), len(b)
+
+    estado = np.full(n, PISO)
+    ativas = np.zeros(m, dtype=bool)
+    pode_entrar = xu > tol
+    estado[direcao_inicial(cov, a, pode_entrar) > tol] = LIVRE
+
+    t = 0.0
+    ts, pesos = [0.0], [np.zeros(n)]
+    bloqueados = set()
+
+    for _ in range(max_iter or 20 * (n + m)):
+        F = np.flatnonzero(estado == LIVRE)
+        U = np.flatnonzero(estado == TETO)
+        R = np.flatnonzero(ativas)
+        nF = len(F)
+
+        # Trecho atual: w(t) = w0 + w1*t e multiplicadores mu(t) = mu0 + mu1*t
+        w_fixo = np.zeros(n)
+        w_fixo[U] = xu[U]
+        K = np.zeros((nF + len(R), nF + len(R)))
+        K[:nF, :nF] = cov[np.ix_(F, F)]
+        K[:nF, nF:] = A[np.ix_(R, F)].T
+        K[nF:, :nF] = A[np.ix_(R, F)]
+        rhs = np.column_stack([
+            np.concatenate([-cov[F] @ w_fixo, b[R] - A[R] @ w_fixo]),
+            np.concatenate([a[F], np.zeros(len(R))])
+        ])
+        sol = resolver_kkt(K, rhs) if len(rhs) else np.zeros((0, 2))
+
+        w0, w1 = w_fixo.copy(), np.zeros(n)
+        w0[F], w1[F] = sol[:nF, 0], sol[:nF, 1]
+        mu0, mu1 = np.zeros(m), np.zeros(m)
+        mu0[R], mu1[R] = sol[nF:, 0], sol[nF:, 1]
+
+        # Gradiente g(t) = Σw - t*a + A'mu e folgas das restrições s(t) = A w
+        g0, g1 = cov @ w0 + A.T @ mu0, cov @ w1 - a + A.T @ mu1
+        s0, s1 = A @ w0, A @ w1
+
+        # Instante de cada evento possível (inf quando não ocorre)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            livre = estado == LIVRE
+            eventos = {
+                'sai_piso': np.where(livre & (w1 < -tol), -w0 / w1, np.inf),
+                'teto': np.where(livre & (w1 > tol), (xu - w0) / w1, np.inf),
+                'entra': np.where((estado == PISO) & pode_entrar & (g1 < -tol), -g0 / g1, np.inf),
+                'sai_teto': np.where((estado == TETO) & (g1 > tol), -g0 / g1, np.inf),
+                'ativa': np.where(~ativas & (s1 > tol), (b - s0) / s1, np.inf),
+                'libera': np.where(ativas & (mu1 < -tol), -mu0 / mu1, np.inf),
+            }
+
+        proximo = None
+        for tipo, instantes in eventos.items():
+            for i in np.flatnonzero(np.isfinite(instantes)):
+                if (tipo, i) in bloqueados:
+                    continue
+                t_evento = max(instantes[i], t)
+                if proximo is None or t_evento < proximo[0]:
+                    proximo = (t_evento, tipo, i)
+
+        # Sem eventos: o último canto vale para qualquer t maior
+        if proximo is None:
+            break
+
+        t_evento, tipo, i = proximo
+        if t_evento > t + tol:
+            bloqueados.clear()
+        t = t_evento
+
+        w = np.clip(w0 + w1 * t, 0.0, xu)
+        if t - ts[-1] <= tol:
+            ts[-1], pesos[-1] = t, w
+        else:
+            ts.append(t)
+            pesos.append(w)
+
+        # Atualiza o conjunto ativo
+        if tipo == 'entra' or tipo == 'sai_teto':
+            estado[i] = LIVRE
+        elif tipo == 'sai_piso':
+            estado[i] = PISO
+        elif tipo == 'teto':
+            estado[i] = TETO
+        else:
+            ativas[i] = tipo == 'ativa'
+        bloqueados.add((EVENTO_INVERSO[tipo], i))
+
+    if verbose:
+        print(f"[CLA] {len(ts)} cantos (t final = {t:.4g})")
+
+    return {'t': np.array(ts), 'pesos': np.array(pesos)}
+
+# Pesos exatos para um t qualquer (interpolação linear entre cantos)
+def pesos_para_t(cantos, t):
+    ts, pesos = cantos['t'], cantos['pesos']
+    if t >= ts[-1]:
+        return pesos[-1].copy()
+    k = max(np.searchsorted(ts, t, side='right') - 1, 0)
+    frac = (t - ts[k]) / (ts[k + 1] - ts[k])
+    return pesos[k] + frac * (pesos[k + 1] - pesos[k])
+
+# Maior t cujo risco não passa do máximo (o risco cresce com t ao longo da fronteira)
+def t_maximo_para_risco(cantos, cov, risco_maximo):
+    ts, pesos = cantos['t'], cantos['pesos']
+    var_max = risco_maximo ** 2
+    variancias = np.einsum('ki,ij,kj->k', pesos, cov, pesos)
+    acima = np.flatnonzero(variancias > var_max)
+    if len(acima) == 0:
+        return np.inf
+    k = acima[0]
+    if k == 0:
+        return 0.0
+
+    # No trecho [k-1, k]: w = p + s*d, var(s) = var_max → equação do 2º grau em s
+    p, d = pesos[k - 1], pesos[k] - pesos[k - 1]
+    qa, qb, qc = d @ cov @ d, 2 * (p @ cov @ d), p @ cov @ p - var_max
+    s = 1.0 if qa <= 0 else (-qb + np.sqrt(max(qb ** 2 - 4 * qa * qc, 0.0))) / (2 * qa)
+    return ts[k - 1] + float(np.clip(s, 0.0, 1.0)) * (ts[k] - ts[k - 1])
+
+# Solução exata do problema contínuo para um lambda, respeitando o risco máximo
+def pesos_para_lambda(cantos, problema, lambda_risco, risco_maximo=None):
+    t = 1.0 / (2.0 * lambda_risco) if lambda_risco > 0 else np.inf
+    if risco_maximo is not None:
+        t = min(t, t_maximo_para_risco(cantos, problema['cov'], risco_maximo))
+    return pesos_para_t(cantos, t)
+
+# Métricas de uma ou mais carteiras do problema contínuo
+def metricas_continuas(problema, pesos):
+    pesos = np.atleast_2d(pesos)
+    variancias = np.einsum('ki,ij,kj->k', pesos, problema['cov'], pesos)
+    return {
+        'retornos': pesos @ problema['retornos'],
+        'riscos': np.sqrt(np.maximum(variancias, 0.0)),
+        'pvp': pesos @ problema['pvp'],
+        'cvar': pesos @ problema['cvar']
+    }
+
+# Amostra a fronteira com a densidade desejada (os cantos sempre entram)
+def amostrar_fronteira(cantos, problema, n_pontos=None, risco_maximo=None):
+    n_pontos = n_pontos or config.FRONTEIRA_PONTOS_CONTINUA
+    ts = cantos['t']
+    t_fim = ts[-1]
+    if risco_maximo is not None:
+        t_fim = min(t_fim, t_maximo_para_risco(cantos, problema['cov'], risco_maximo))
+
+    # Grade uniforme em t a partir do primeiro canto totalmente investido
+    investidos = np.flatnonzero(cantos['pesos'].sum(axis=1) >= 1.0 - 1e-6)
+    t_ini = ts[investidos[0]] if len(investidos) else ts[min(1, len(ts) - 1)]
+    t_ini = min(t_ini, t_fim)
+    grade = np.union1d(np.linspace(t_ini, t_fim, n_pontos), ts[(ts >= t_ini) & (ts <= t_fim)])
+
+    pesos = np.array([pesos_para_t(cantos, t) for t in grade])
+    metricas = metricas_continuas(problema, pesos)
+    return [
+        {'risco': float(metricas['riscos'][k]), 'retorno': float(metricas['retornos'][k]),
+         'lambda': float(1.0 / (2.0 * grade[k])) if grade[k] > 0 else None}
+        for k in range(len(grade))
+    ]
@@ -0,0 +1,91 @@
+import importlib
+import os
+import subprocess
+import sys
+import threading
+
+import config
+
+# Carregamento tardio de módulos pesados (yfinance, pymoo, gurobipy, matplotlib...):
+# o import real só acontece no primeiro acesso a um atributo do módulo.
+
+
+class ModuloTardio:
+    def __init__(self, nome, ao_carregar=None):
+        object.__setattr__(self, '_nome', nome)
+        object.__setattr__(self, '_ao_carregar', ao_carregar)
+        object.__setattr__(self, '_modulo', None)
+        object.__setattr__(self, '_lock', threading.Lock())
+
+    # Importa uma única vez, mesmo com várias threads acessando ao mesmo tempo
+    def _carregar(self):
+        if self._modulo is None:
+            with self._lock:
+                if self._modulo is None:
+                    modulo = importlib.import_module(self._nome)
+                    if self._ao_carregar:
+                        self._ao_carregar(modulo)
+                    object.__setattr__(self, '_modulo', modulo)
+        return self._modulo
+
+    def __getattr__(self, atributo):
+        return getattr(self._carregar(), atributo)
+
+    def __setattr__(self, atributo, valor):
+        setattr(self._carregar(), atributo, valor)
+
+    def __dir__(self):
+        return dir(self._carregar())
+
+    def __repr__(self):
+        estado = 'carregado' if self._modulo is not None else 'não carregado'
+        return f"<módulo tardio '{self._nome}' ({estado})>"
+
+def importar_tardio(nome, ao_carregar=None):
+    return ModuloTardio(nome, ao_carregar)
+
+
+# Mede o tempo de import de um módulo em um processo novo (python -X importtime)
+def medir_importacao(modulo):
+    pasta = os.path.dirname(os.path.abspath(__file__))
+    saida = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {modulo}'],
+                           cwd=os.path.dirname(pasta), env=dict(os.environ, PYTHONPATH=pasta),
+                           capture_output=True, text=True)
+    if saida.returncode != 0:
+        raise RuntimeError(f"Falha ao importar '{modulo}': {saida.stderr.strip().splitlines()[-1]}")
+
+    # Linhas no formato "import time: self [us] | cumulative | nome"; o nível vem da indentação
+    # e os filhos aparecem antes do módulo que os importou
+    total_ms, diretos, pendentes = None, [], []
+    for linha in saida.stderr.splitlines():
+        if not linha.startswith('import time:') or 'cumulative' in linha:
+            continue
+        _, acumulado, nome = linha[len('import time:'):].split('|')
+        nivel = (len(nome) - len(nome.lstrip()) - 1) // 2
+        if nivel == 1:
+            pendentes.append((nome.strip(), int(acumulado) / 1000))
+        elif nivel == 0:
+            if nome.strip() == modulo:
+                total_ms, diretos = int(acumulado) / 1000, pendentes
+            pendentes = []
+    return total_ms, sorted(diretos, key=lambda d: d[1], reverse=True)
+
+# Confere se os módulos de entrada importam dentro do orçamento (ms)
+def verificar_orcamento_importacao(modulos=None, orcamento_ms=None):
+    modulos = modulos or config.MODULOS_ORCAMENTO_IMPORTACAO
+    orcamento_ms = config.ORCAMENTO_IMPORTACAO_MS if orcamento_ms is None else orcamento_ms
+
+    dentro = True
+    for modulo in modulos:
+        tempo_ms, diretos = medir_importacao(modulo)
+        ok = tempo_ms <= orcamento_ms
+        dentro &= ok
+        print(f"{'✅' if ok else '❌'} import {modulo}: {tempo_ms:.0f} ms (orçamento {orcamento_ms:.0f} ms)")
+        for nome, ms in diretos[:5]:
+            print(f"     {nome}: {ms:.0f} ms")
+    return dentro
+
+
+if __name__ == '__main__':
+    # Uso: python Trabalho_OTM/importacao_tardia.py [modulo ...]
+    sys.exit(0 if verificar_orcamento_importacao(sys.argv[1:]) else 1)
@@ -1,17 +1,37 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
 import pandas as pd
 import numpy as np
 from pymoo.optimize import minimize
 from pymoo.algorithms.soo.nonconvex.ga import GA
+from pymoo.algorithms.moo.nsga2 import NSGA2
+from pymoo.algorithms.moo.nsga3 import NSGA3
+from pymoo.util.ref_dirs import get_reference_directions
 from pymoo.core.repair import Repair
+from pymoo.core.duplicate import DuplicateElimination
+from pymoo.core.sampling import Sampling
+from pymoo.operators.sampling.rnd import FloatRandomSampling
 from pymoo.core.problem import Problem
-from pymoo.termination.default import DefaultSingleObjectiveTermination
+from pymoo.termination.default import DefaultSingleObjectiveTermination, DefaultMultiObjectiveTermination
+from pymoo.termination.collection import TerminationCollection
+from pymoo.termination.max_time import TimeBasedTermination
 
 import config
+import orcamento_cpu
 
 # Parâmetros do Algoritmo Genético
 POPULACAO_SIZE = 100
 NUM_GERACOES = 1500
 
+# Passo de quantização dos pesos na detecção de duplicatas
+PASSO_DUPLICATAS = 1e-4
+
+# Cache LRU das populações finais: assinatura das restrições -> matriz de pesos
+CACHE_POPULACOES = OrderedDict()
+CACHE_POPULACOES_LOCK = threading.Lock()
+
 TERMINATION = DefaultSingleObjectiveTermination(
     ftol=1e-9,         
     period=100,        
@@ -20,6 +40,51 @@ TERMINATION = DefaultSingleObjectiveTermination(
     cvtol=1e-20        
 )
 
+# Parâmetros do modo multiobjetivo (NSGA-II com 2 objetivos, NSGA-III com 4)
+POPULACAO_MO = 100
+PARTICOES_REFERENCIA = 8   # direções de referência Das-Dennis para 4 objetivos (165 direções)
+NUM_GERACOES_MO = 500
+
+TERMINATION_MO = DefaultMultiObjectiveTermination(
+    ftol=1e-6,
+    period=50,
+    n_max_gen=NUM_GERACOES_MO
+)
+
+
+# Teto de peso por ativo: liquidez, teto individual, teto setorial e setores proibidos
+def calcular_teto_pesos(volume_medio, valor_investido, teto_maximo_ativo=0.30, teto_maximo_setor=1.0,
+                        nomes_ativos=None, mapa_setores=None, setores_proibidos=None):
+
+    # 1. Cálculo do Teto por Liquidez
+    vol_values = np.nan_to_num(volume_medio.values, nan=0.0)
+    teto_financeiro_liquidez = 0.1 * vol_values
+    
+    # 2. Converte para teto em peso
+    inv = valor_investido if valor_investido > 0 else 1.0
+    max_peso_liquidez = teto_financeiro_liquidez / inv
+    
+    # 3. O teto final é o mínimo entre os tetos definidos
+    xu = np.minimum(teto_maximo_ativo, max_peso_liquidez)
+    xu = np.minimum(xu, teto_maximo_setor) 
+    
+    # Setores Proibidos: Zera os pesos desses ativos
+    if setores_proibidos and nomes_ativos and mapa_setores:
+        ticker_to_idx = {ticker: i for i, ticker in enumerate(nomes_ativos)}
+        for setor in setores_proibidos:
+            if setor in mapa_setores:
+                for ativo in mapa_setores[setor]:
+                    # Remove espaços em branco extras para garantir o match
+                    ativo_limpo = ativo.strip()
+                    # Procura o ativo na lista de nomes (também limpa)
+                    if ativo_limpo in ticker_to_idx:
+                        idx = ticker_to_idx[ativo_limpo]
+                        xu[idx] = 0.0
+                        
+    # Garante que não ficou nada negativo
+    xu = np.maximum(0.0, xu)
+    return xu
+
 
 class OtimizacaoPortfolio(Problem):
     def __init__(self, retornos_medios, matriz_cov, 
@@ -42,41 +107,14 @@ class OtimizacaoPortfolio(Problem):
         n_ativos = len(retornos_medios)
         
         xl = np.full(n_ativos, 0.0)
-        
-        
-        # 1. Cálculo do Teto por Liquidez
-        vol_values = np.nan_to_num(volume_medio.values, nan=0.0)
-        teto_financeiro_liquidez = 0.1 * vol_values
-        
-        # 2. Converte para teto em peso
-        inv = valor_investido if valor_investido > 0 else 1.0
-        max_peso_liquidez = teto_financeiro_liquidez / inv
-        
-        # 3. O teto final é o mínimo entre os tetos definidos
-        xu = np.minimum(teto_maximo_ativo, max_peso_liquidez)
-        xu = np.minimum(xu, teto_maximo_setor) 
-        
-        # Setores Proibidos: Zera os pesos desses ativos
-        if setores_proibidos and nomes_ativos and mapa_setores:
-            ticker_to_idx = {ticker: i for i, ticker in enumerate(nomes_ativos)}
-            for setor in setores_proibidos:
-                if setor in mapa_setores:
-                    for ativo in mapa_setores[setor]:
-                        # Remove espaços em branco extras para garantir o match
-                        ativo_limpo = ativo.strip()
-                        # Procura o ativo na lista de nomes (também limpa)
-                        if ativo_limpo in ticker_to_idx:
-                            idx = ticker_to_idx[ativo_limpo]
-                            xu[idx] = 0.0
-                            
-        # Garante que não ficou nada negativo
-        xu = np.maximum(0.0, xu)
+        xu = calcular_teto_pesos(volume_medio, valor_investido, teto_maximo_ativo, teto_maximo_setor,
+                                 nomes_ativos, mapa_setores, setores_proibidos)
 
         # Inicializa o problema
         super().__init__(n_var=n_ativos, n_obj=1, n_constr=2, n_eq_constr=0, xl=xl, xu=xu)
 
-    # Função de Avaliação
-    def _evaluate(self, x, out, *args, **kwargs):
+    # Componentes da carteira usados nos objetivos e restrições
+    def calcular_componentes(self, x):
 
         # 1. Retorno Esperado
         retorno_port = x.dot(self.retornos_medios)
@@ -94,6 +132,19 @@ class OtimizacaoPortfolio(Problem):
         caixa_nao_investido = np.maximum(0.0, 1.0 - soma_pesos)
         penalidade_caixa = config.PESO_PENALIZACAO_CAIXA * caixa_nao_investido
 
+        return retorno_port, variancia, risco_vol, pvp_port, cvar_port, penalidade_caixa
+
+    # Restrições: risco <= máximo do usuário e soma dos pesos <= 1.0
+    def calcular_restricoes(self, x, risco_vol):
+        g1 = risco_vol - self.risco_maximo_usuario
+        g2 = np.sum(x, axis=1) - 1.0
+        return np.column_stack([g1, g2])
+
+    # Função de Avaliação
+    def _evaluate(self, x, out, *args, **kwargs):
+
+        retorno_port, variancia, risco_vol, pvp_port, cvar_port, penalidade_caixa = self.calcular_componentes(x)
+
         # Função Objetivo (Multiobjetivo Scalarizado)
         # Minimizamos: (Risco * Lambda) - Retorno + Custo P/VP + Custo CVaR + Penalidade Caixa
         obj = (self.lambda_aversao_risco * variancia) - retorno_port \
@@ -104,17 +155,146 @@ class OtimizacaoPortfolio(Problem):
         out["F"] = obj
         
         # Restrições
+        out["G"] = self.calcular_restricoes(x, risco_vol)
 
-        # 1. Risco <= Risco Máximo 
-        g1 = risco_vol - self.risco_maximo_usuario
-        
-        # 2. Soma dos Pesos <= 1.0 
-        g2 = np.sum(x, axis=1) - 1.0
-        
-        # Empilha as restrições na saída "G"
-        out["G"] = np.column_stack([g1, g2])
 
+# Versão multiobjetivo. Por padrão usa 2 objetivos: variância e retorno ajustado (P/VP, CVaR e caixa
+# são lineares como o retorno, então todo ótimo da função escalarizada para qualquer lambda está nessa fronteira).
+# Com objetivos_separados=True, retorno, variância, P/VP e CVaR viram 4 objetivos independentes.
+class OtimizacaoPortfolioMultiobjetivo(OtimizacaoPortfolio):
+    def __init__(self, *args, objetivos_separados=False, **kwargs):
+        kwargs.setdefault('lambda_aversao_risco', 0.0)
+        super().__init__(*args, **kwargs)
+        self.objetivos_separados = objetivos_separados
+        self.n_obj = 4 if objetivos_separados else 2
+
+    def _evaluate(self, x, out, *args, **kwargs):
+
+        retorno_port, variancia, risco_vol, pvp_port, cvar_port, penalidade_caixa = self.calcular_componentes(x)
+
+        # Todos minimizados
+        if self.objetivos_separados:
+            out["F"] = np.column_stack([-retorno_port + penalidade_caixa, variancia, pvp_port, cvar_port])
+        else:
+            retorno_ajustado = retorno_port - (config.PESO_PVP * pvp_port) - (config.PESO_CVAR * cvar_port) - penalidade_caixa
+            out["F"] = np.column_stack([-retorno_ajustado, variancia])
+        out["G"] = self.calcular_restricoes(x, risco_vol)
+
+
+
+
+# Eliminação de duplicatas por hash dos pesos quantizados: O(pop·n) em vez das distâncias par a par O(pop²·n).
+# Como o Repair zera pesos abaixo do mínimo, carteiras iguais a menos de ruído caem na mesma chave.
+class EliminacaoDuplicatasHash(DuplicateElimination):
+    def __init__(self, passo=PASSO_DUPLICATAS):
+        super().__init__()
+        self.passo = passo
+
+    def chaves(self, pop):
+        X = np.nan_to_num(np.asarray(self.func(pop), dtype=float))
+        Q = np.ascontiguousarray(np.rint(X / self.passo).astype(np.int64))
+        return [linha.tobytes() for linha in Q]
+
+    # Marca como duplicado quem já apareceu antes na própria população ou existe em 'other'
+    def _do(self, pop, other, is_duplicate):
+        vistos = set() if other is None else set(self.chaves(other))
+        for i, chave in enumerate(self.chaves(pop)):
+            if chave in vistos:
+                is_duplicate[i] = True
+            elif other is None:
+                vistos.add(chave)
+        return is_duplicate
+
+
+# Assinatura das restrições que definem o espaço de busca (universo, tetos por ativo e setor, proibidos).
+# Lambda e risco máximo ficam de fora: populações de requisições vizinhas continuam boas sementes.
+def assinatura_restricoes(nomes_ativos, xu, teto_maximo_setor, setores_proibidos):
+    conteudo = hashlib.sha1()
+    conteudo.update('|'.join(map(str, nomes_ativos)).encode('utf-8'))
+    conteudo.update(np.round(np.asarray(xu, dtype=float), 8).tobytes())
+    conteudo.update(f"{teto_maximo_setor:.6f}|{'|'.join(sorted(setores_proibidos or []))}".encode('utf-8'))
+    return conteudo.hexdigest()
+
+def obter_populacao_cache(assinatura):
+    with CACHE_POPULACOES_LOCK:
+        X = CACHE_POPULACOES.get(assinatura)
+        if X is not None:
+            CACHE_POPULACOES.move_to_end(assinatura)
+        return X
+
+def guardar_populacao_cache(assinatura, X):
+    with CACHE_POPULACOES_LOCK:
+        CACHE_POPULACOES[assinatura] = np.array(X, dtype=float)
+        CACHE_POPULACOES.move_to_end(assinatura)
+        while len(CACHE_POPULACOES) > config.AG_CACHE_POPULACOES_MAX:
+            CACHE_POPULACOES.popitem(last=False)
+
+# Amostragem inicial semeada com uma população em cache; o restante vem da amostragem complementar
+class AmostragemPopulacaoCache(Sampling):
+    def __init__(self, X_cache, fracao=None, complementar=None):
+        super().__init__()
+        self.X_cache = X_cache
+        self.fracao = config.AG_FRACAO_POPULACAO_CACHE if fracao is None else fracao
+        self.complementar = complementar or FloatRandomSampling()
+
+    def _do(self, problem, n_samples, *args, random_state=None, **kwargs):
+        n_cache = min(len(self.X_cache), int(round(n_samples * self.fracao)))
+        X_cache = np.clip(self.X_cache[:n_cache], problem.xl, problem.xu)
+        X_resto = self.complementar._do(problem, n_samples - n_cache, random_state=random_state)
+        return np.vstack([X_cache, X_resto])
+
+# Amostragem perto da região viável: cada indivíduo é uma carteira esparsa com suporte aleatório
+# (até max_ativos ativos), pesos Dirichlet somando 1, cortada nos tetos por ativo e por setor
+# e reduzida proporcionalmente até caber no risco máximo
+class AmostragemViavel(Sampling):
+    def __init__(self, indices_setores, teto_setor=1.0, max_ativos=None):
+        super().__init__()
+        self.indices_setores = indices_setores
+        self.teto_setor = teto_setor
+        self.max_ativos = max_ativos or config.AG_MAX_ATIVOS_AMOSTRAGEM
+
+    # Corta no teto e redistribui a sobra entre os ativos do suporte que ainda têm folga
+    @staticmethod
+    def cortar_no_teto(w, teto, suporte):
+        for _ in range(len(suporte)):
+            w[suporte] = np.minimum(w[suporte], teto[suporte])
+            sobra = 1.0 - w.sum()
+            folga = suporte[w[suporte] < teto[suporte] - 1e-12]
+            if sobra <= 1e-9 or len(folga) == 0:
+                break
+            w[folga] += sobra * w[folga] / w[folga].sum()
+        return w
+
+    def _do(self, problem, n_samples, *args, random_state=None, **kwargs):
+        rng = random_state if random_state is not None else np.random.default_rng()
+        xu = problem.xu
+        elegiveis = np.flatnonzero(xu >= config.PESO_MINIMO_ATIVO)
+        X = np.zeros((n_samples, problem.n_var))
+        if len(elegiveis) == 0:
+            return X
+
+        var_max = problem.risco_maximo_usuario ** 2
+        k_max = min(self.max_ativos, len(elegiveis))
+        for linha in range(n_samples):
+            k = rng.integers(1, k_max + 1)
+            suporte = np.sort(rng.choice(elegiveis, size=k, replace=False))
+            w = np.zeros(problem.n_var)
+            w[suporte] = rng.dirichlet(np.ones(k))
+            w = self.cortar_no_teto(w, xu, suporte)
+
+            if self.teto_setor < 0.999:
+                for idxs in self.indices_setores:
+                    soma_setor = w[idxs].sum()
+                    if soma_setor > self.teto_setor:
+                        w[idxs] *= self.teto_setor / soma_setor
 
+            variancia = w @ problem.matriz_cov @ w
+            if variancia > var_max:
+                w *= np.sqrt(var_max / variancia)
+
+            w[w < config.PESO_MINIMO_ATIVO] = 0.0
+            X[linha] = w
+        return X
 
 
 # Função Repair personalizada para impor tetos setoriais
@@ -140,7 +320,7 @@ class SectorCapRepair(Repair):
         X = np.nan_to_num(X, nan=0.0, posinf=0.0, neginf=0.0)
         
         # 2. Restrição de Mínimo de Peso (0.5%)
-        X[X < 0.005] = 0.0
+        X[X < config.PESO_MINIMO_ATIVO] = 0.0
         
         # 3. Restrição de Teto Individual (xu)
         if self.xu is not None:
@@ -171,16 +351,72 @@ class SectorCapRepair(Repair):
                 X[:, idxs] *= fatores
         
         # 6. Reaplica o mínimo de peso (0.5%) após ajustes
-        X[X < 0.005] = 0.0
+        X[X < config.PESO_MINIMO_ATIVO] = 0.0
 
         return X
 
+# Métricas e formato de saída comuns aos motores de pesos contínuos (AG, HRP).
+# Sem função objetivo própria do motor, usa o score padrão.
+def montar_resultado(pesos_otimos, inputs, risco_maximo_usuario, lambda_aversao_risco, utility_score=None):
+    matriz_cov = inputs['matriz_cov']
+    retornos_medios = inputs['retornos_medios']
+    vetor_pvp = inputs['vetor_pvp']
+    vetor_cvar = inputs['vetor_cvar']
+    nomes_dos_ativos = inputs['nomes_dos_ativos']
+
+    # Métricas Finais
+    variancia = pesos_otimos.dot(matriz_cov).dot(pesos_otimos)
+    risco_otimo = np.sqrt(variancia)
+    retorno_otimo = pesos_otimos.dot(retornos_medios)
+    pvp_final = pesos_otimos.dot(vetor_pvp)
+    cvar_final = pesos_otimos.dot(vetor_cvar)
+    
+    # Recalcula a função objetivo padrão para comparação justa com Gurobi
+    penalidade_caixa = config.PESO_PENALIZACAO_CAIXA * max(0.0, 1.0 - pesos_otimos.sum())
+    
+    utility_score_reporting = (lambda_aversao_risco * (risco_otimo ** 2)) - retorno_otimo \
+                              + (config.PESO_PVP * pvp_final) \
+                              + (config.PESO_CVAR * cvar_final) \
+                              + penalidade_caixa
+    if utility_score is None:
+        utility_score = utility_score_reporting
+    
+    # DataFrame para retorno (usado pelo app.py)
+    df_pesos = pd.DataFrame([pesos_otimos], columns=nomes_dos_ativos)
+    df_objetivos = pd.DataFrame({
+        'Risco_Alvo': [risco_maximo_usuario],
+        'Risco_Encontrado_Anual': [risco_otimo],
+        'Retorno_Encontrado_Anual': [retorno_otimo]
+    })
+    df_final = pd.concat([df_objetivos, df_pesos], axis=1)
+    
+    # Retorno dos Resultados
+    return {
+        "metricas": {
+            "retorno_aa": retorno_otimo * 100,
+            "risco_aa": risco_otimo * 100,
+            "score": utility_score_reporting,
+            "funcao_objetivo": utility_score,
+            "lambda_risco": lambda_aversao_risco,
+            "pvp_final": pvp_final,   
+            "cvar_final": cvar_final
+        },
+        "dataframe_resultado": df_final,
+        "pesos_finais": pesos_otimos,
+        "risco_final": risco_otimo,
+        "retorno_final": retorno_otimo,
+        "funcao_objetivo": utility_score
+    }
+
 # Função principal para rodar a otimização via AG
 def rodar_otimização(inputs, risco_maximo_usuario, lambda_aversao_risco, 
                      setores_proibidos=None, 
                      teto_maximo_ativo=0.30, 
                      teto_maximo_setor=1.0,
-                     verbose=True):
+                     verbose=True,
+                     tempo_limite=None,
+                     usar_cache=None,
+                     max_ativos=None):
     
     # 1. Extração dos Inputs
     retornos_medios = inputs['retornos_medios']
@@ -193,7 +429,7 @@ def rodar_otimização(inputs, risco_maximo_usuario, lambda_aversao_risco,
     volume_medio = inputs['volume_medio']
     
     # Obtém o mapa de setores para passar ao Repair
-    mapa_setores = config.obter_mapa_setores_ativos()
+    mapa_setores = config.obter_mapa_setores_ativos(inputs.get('setores_universo'))
 
     if verbose:
         print("\n[GA] Inicializando Modelo Multiobjetivo...")
@@ -225,32 +461,57 @@ def rodar_otimização(inputs, risco_maximo_usuario, lambda_aversao_risco,
             
         print(f"[GA] Rodando Evolução ({NUM_GERACOES} gerações)...")
     
+    reparo = SectorCapRepair(
+        mapa_setores=mapa_setores, 
+        nomes_ativos=nomes_dos_ativos, 
+        teto_setor=teto_maximo_setor,
+        xu=problema.xu 
+    )
+
+    # População inicial: carteiras esparsas já viáveis (ou uniforme, se desativado),
+    # semeada pelo cache quando uma requisição com as mesmas restrições já rodou
+    amostragem = FloatRandomSampling()
+    if config.AG_AMOSTRAGEM_VIAVEL:
+        amostragem = AmostragemViavel(reparo.indices_setores, teto_maximo_setor, max_ativos)
+    assinatura = assinatura_restricoes(nomes_dos_ativos, problema.xu, teto_maximo_setor, setores_proibidos)
+    # Opcional: a população inicial passa a depender das requisições anteriores (perde a reprodutibilidade da semente)
+    usar_cache = config.AG_CACHE_POPULACOES_ATIVO if usar_cache is None else usar_cache
+    X_cache = obter_populacao_cache(assinatura) if usar_cache else None
+    if X_cache is not None:
+        amostragem = AmostragemPopulacaoCache(X_cache, complementar=amostragem)
+        if verbose:
+            print(f"[GA] População inicial semeada pelo cache ({len(X_cache)} indivíduos disponíveis)")
+
     # 3. Configura o Algoritmo com o novo Repair
     algoritmo = GA(
         pop_size=POPULACAO_SIZE,
-        eliminate_duplicates=True,
-        repair=SectorCapRepair(
-            mapa_setores=mapa_setores, 
-            nomes_ativos=nomes_dos_ativos, 
-            teto_setor=teto_maximo_setor,
-            xu=problema.xu 
-        )
+        sampling=amostragem,
+        eliminate_duplicates=EliminacaoDuplicatasHash(),
+        repair=reparo
     )
 
-    # 4. Executa a Otimização
-    res = minimize(
-        problem=problema,
-        algorithm=algoritmo,
-        termination=TERMINATION,
-        seed=1,
-        verbose=False 
-    )
+    # 4. Executa a Otimização (com limite de tempo opcional, o que ocorrer primeiro)
+    terminacao = TERMINATION
+    if tempo_limite is not None:
+        terminacao = TerminationCollection(TERMINATION, TimeBasedTermination(tempo_limite))
+
+    # O AG é de uma thread só: reserva um núcleo do orçamento
+    with orcamento_cpu.reservar(1):
+        res = minimize(
+            problem=problema,
+            algorithm=algoritmo,
+            termination=terminacao,
+            seed=1,
+            verbose=False 
+        )
 
     # 5. Processa Resultados
     if res and res.X is not None:
         if verbose:
             print(f"Otimização concluída após {res.algorithm.n_gen} gerações.")
             print()
+        if usar_cache and res.pop is not None:
+            guardar_populacao_cache(assinatura, res.pop.get("X"))
         pesos_otimos = res.X
         utility_score = res.F[0]
         
@@ -259,50 +520,109 @@ def rodar_otimização(inputs, risco_maximo_usuario, lambda_aversao_risco,
         if soma_pesos < 0.99 and verbose:
             print(f"[GA] Aviso: Restrições impediram 100% de alocação. Investido: {soma_pesos:.1%}")
         
-        # Métricas Finais
-        variancia = pesos_otimos.dot(matriz_cov).dot(pesos_otimos)
-        risco_otimo = np.sqrt(variancia)
-        retorno_otimo = pesos_otimos.dot(retornos_medios)
-        pvp_final = pesos_otimos.dot(vetor_pvp)
-        cvar_final = pesos_otimos.dot(vetor_cvar)
-        
-        # Recalcula a função objetivo padrão para comparação justa com Gurobi
-        penalidade_caixa = config.PESO_PENALIZACAO_CAIXA * max(0.0, 1.0 - pesos_otimos.sum())
-        
-        utility_score_reporting = (lambda_aversao_risco * (risco_otimo ** 2)) - retorno_otimo \
-                                  + (config.PESO_PVP * pvp_final) \
-                                  + (config.PESO_CVAR * cvar_final) \
-                                  + penalidade_caixa
-        
-        # DataFrame para retorno (usado pelo app.py)
-        df_pesos = pd.DataFrame([pesos_otimos], columns=nomes_dos_ativos)
-        df_objetivos = pd.DataFrame({
-            'Risco_Alvo': [risco_maximo_usuario],
-            'Risco_Encontrado_Anual': [risco_otimo],
-            'Retorno_Encontrado_Anual': [retorno_otimo]
-        })
-        df_final = pd.concat([df_objetivos, df_pesos], axis=1)
-        
         # 6. Retorno dos Resultados
-        return {
-            "metricas": {
-                "retorno_aa": retorno_otimo * 100,
-                "risco_aa": risco_otimo * 100,
-                "score": utility_score_reporting,
-                "funcao_objetivo": utility_score,
-                "lambda_risco": lambda_aversao_risco,
-                "pvp_final": pvp_final,   
-                "cvar_final": cvar_final
-            },
-            "dataframe_resultado": df_final,
-            "pesos_finais": pesos_otimos,
-            "risco_final": risco_otimo,
-            "retorno_final": retorno_otimo,
-            "funcao_objetivo": utility_score
-        }
+        return montar_resultado(pesos_otimos, inputs, risco_maximo_usuario, lambda_aversao_risco, utility_score)
             
     else:
         if verbose:
             print("\nALERTA: Otimização não convergiu para uma solução viável.")
         return None
 
+
+# Roda o AG multiobjetivo uma única vez e retorna toda a fronteira não dominada
+def rodar_otimização_multiobjetivo(inputs, risco_maximo_usuario,
+                                   setores_proibidos=None,
+                                   teto_maximo_ativo=0.30,
+                                   teto_maximo_setor=1.0,
+                                   objetivos_separados=False,
+                                   verbose=True):
+
+    nomes_dos_ativos = inputs['nomes_dos_ativos']
+    mapa_setores = config.obter_mapa_setores_ativos(inputs.get('setores_universo'))
+
+    problema = OtimizacaoPortfolioMultiobjetivo(
+        retornos_medios=inputs['retornos_medios'],
+        matriz_cov=inputs['matriz_cov'],
+        vetor_pvp=inputs['vetor_pvp'],
+        vetor_cvar=inputs['vetor_cvar'],
+        volume_medio=inputs['volume_medio'],
+        valor_investido=inputs.get('valor_total_investido', 0.0),
+        risco_maximo_usuario=risco_maximo_usuario,
+        nomes_ativos=nomes_dos_ativos,
+        mapa_setores=mapa_setores,
+        setores_proibidos=setores_proibidos,
+        teto_maximo_ativo=teto_maximo_ativo,
+        teto_maximo_setor=teto_maximo_setor,
+        objetivos_separados=objetivos_separados,
+        verbose=verbose
+    )
+
+    # Mesmo Repair do GA mono-objetivo
+    repair = SectorCapRepair(
+        mapa_setores=mapa_setores,
+        nomes_ativos=nomes_dos_ativos,
+        teto_setor=teto_maximo_setor,
+        xu=problema.xu
+    )
+
+    if objetivos_separados:
+        ref_dirs = get_reference_directions("das-dennis", 4, n_partitions=PARTICOES_REFERENCIA)
+        algoritmo = NSGA3(ref_dirs=ref_dirs, pop_size=len(ref_dirs) + (4 - len(ref_dirs) % 4) % 4,
+                          eliminate_duplicates=EliminacaoDuplicatasHash(), repair=repair)
+        nome_algoritmo = "NSGA-III"
+    else:
+        algoritmo = NSGA2(pop_size=POPULACAO_MO, eliminate_duplicates=EliminacaoDuplicatasHash(), repair=repair)
+        nome_algoritmo = "NSGA-II"
+
+    if verbose:
+        print(f"\n[{nome_algoritmo}] Rodando fronteira multiobjetivo (até {NUM_GERACOES_MO} gerações)...")
+
+    # O AG é de uma thread só: reserva um núcleo do orçamento
+    with orcamento_cpu.reservar(1):
+        res = minimize(
+            problem=problema,
+            algorithm=algoritmo,
+            termination=TERMINATION_MO,
+            seed=1,
+            verbose=False
+        )
+
+    if res is None or res.X is None:
+        if verbose:
+            print(f"\nALERTA: {nome_algoritmo} não encontrou soluções viáveis.")
+        return None
+
+    pesos = np.atleast_2d(res.X)
+    retornos, variancias, riscos, pvp, cvar, penalidade_caixa = problema.calcular_componentes(pesos)
+
+    if verbose:
+        print(f"[{nome_algoritmo}] {len(pesos)} carteiras não dominadas após {res.algorithm.n_gen} gerações.")
+
+    return {
+        'pesos': pesos,
+        'retornos': retornos,
+        'variancias': variancias,
+        'riscos': riscos,
+        'pvp': pvp,
+        'cvar': cvar,
+        'penalidade_caixa': penalidade_caixa
+    }
+
+# Escolhe o ponto da fronteira que minimiza a função escalarizada para um dado lambda
+def selecionar_ponto_fronteira(res_mo, lambda_aversao_risco):
+    score = (lambda_aversao_risco * res_mo['variancias']) - res_mo['retornos'] \
+            + (config.PESO_PVP * res_mo['pvp']) \
+            + (config.PESO_CVAR * res_mo['cvar']) \
+            + res_mo['penalidade_caixa']
+    return int(np.argmin(score))
+
+# Projeta a fronteira no plano risco x retorno (mantém só os pontos não dominados, ordenados por risco)
+def fronteira_risco_retorno(res_mo):
+    ordem = np.lexsort((-res_mo['retornos'], res_mo['riscos']))
+    pontos = []
+    melhor_retorno = -np.inf
+    for i in ordem:
+        if res_mo['retornos'][i] > melhor_retorno + 1e-9:
+            pontos.append({'risco': res_mo['riscos'][i], 'retorno': res_mo['retornos'][i], 'indice': int(i)})
+            melhor_retorno = res_mo['retornos'][i]
+    return pontos
@@ -3,9 +3,13 @@ from gurobipy import GRB
 import pandas as pd
 import numpy as np
 import math
+import concurrent.futures
 
-import preparar_dados
 import config
+import orcamento_cpu
+import arredondamento_lotes
+import cenarios_cvar
+import perfilamento
 
 # Função segura para converter valores para float
 def safe_float(val):
@@ -18,6 +22,82 @@ def safe_float(val):
 def limpar_string(s):
     return str(s).strip().upper()
 
+# Converte quantidades de cotas em pesos sobre o valor investido
+def calcular_pesos_lotes(lotes, nomes_ativos, precos_atuais, valor_investido):
+    w = np.zeros(len(nomes_ativos))
+    if valor_investido > 0:
+        for i, ticker in enumerate(nomes_ativos):
+            preco = safe_float(precos_atuais.get(ticker, 0.0))
+            w[i] = (lotes[i] * preco) / valor_investido
+    return w
+
+# Calcula retorno, variância, P/VP e CVaR de uma carteira
+def calcular_metricas_carteira(w, retornos, cov_matrix, vals_pvp, vals_cvar):
+    ret_final = np.dot(w, retornos)
+    var_final = np.dot(w, np.dot(cov_matrix, w))
+    pvp_final = np.dot(w, vals_pvp)
+    cvar_final = np.dot(w, vals_cvar)
+    return ret_final, var_final, pvp_final, cvar_final
+
+# Índices dos ativos de cada setor (na ordem de nomes_ativos)
+def mapear_setores(nomes_ativos, setores_extras=None):
+    mapa_setores = config.obter_mapa_setores_ativos(setores_extras)
+    indices_por_setor = {setor: [] for setor in mapa_setores}
+
+    # Faz o mapeamento reverso de ativo para setor
+    ativo_para_setor = {}
+    for setor, lista_ativos in mapa_setores.items():
+        for ativo in lista_ativos:
+            ativo_para_setor[limpar_string(ativo)] = setor
+
+    # Preenche os índices por setor
+    for i, ticker in enumerate(nomes_ativos):
+        setor = ativo_para_setor.get(limpar_string(ticker))
+        if setor is not None:
+            indices_por_setor[setor].append(i)
+    return indices_por_setor
+
+# Tickers (normalizados) dos setores proibidos
+def ativos_proibidos(setores_proibidos, setores_extras=None):
+    mapa_setores = config.obter_mapa_setores_ativos(setores_extras)
+    proibidos = set()
+    for setor in setores_proibidos or []:
+        if setor in mapa_setores:
+            proibidos.update(limpar_string(a) for a in mapa_setores[setor])
+    return proibidos
+
+# Máximo de cotas (menor entre teto e liquidez) e mínimo de cotas para comprar um ativo; (0, 0) se não dá para comprar
+def limites_cotas(custo_acao, vol, valor_investido, teto_maximo_ativo, proibido):
+    teto_financeiro_ativo = 0.0 if proibido else min(valor_investido * teto_maximo_ativo, 0.1 * vol)
+    max_unidades = 0 if custo_acao <= 0.01 else int(teto_financeiro_ativo / custo_acao)
+    min_cotas = math.ceil(valor_investido * config.PESO_MINIMO_ATIVO / (custo_acao + 0.0001))
+    if min_cotas > max_unidades:
+        return 0, 0
+    return max_unidades, min_cotas
+
+# Cotas em carteira na ordem de nomes_ativos, a partir de {ticker: cotas}. Posição fora do universo não
+# tem preço nem variável no modelo: em vez de ignorá-la (o patrimônio mudaria sem aviso), ValueError
+def alinhar_lotes(lotes_por_ticker, nomes_ativos):
+    atuais = {limpar_string(t): safe_float(q) for t, q in (lotes_por_ticker or {}).items()}
+    conhecidos = {limpar_string(t) for t in nomes_ativos}
+    sem_preco = sorted(t for t, q in atuais.items() if q and t not in conhecidos)
+    if sem_preco:
+        raise ValueError(f"Posições fora do universo de ativos (sem preço): {', '.join(sem_preco)}")
+    return np.array([atuais.get(limpar_string(t), 0.0) for t in nomes_ativos])
+
+# Ordens do rebalanceamento (cotas a comprar e vender), giro e custo de transação em R$
+def resumir_negociacoes(lotes_atuais, lotes_alvo, nomes_ativos, custos_acoes, custo_transacao, valor_investido):
+    delta = np.round(np.asarray(lotes_alvo, dtype=float)) - np.round(lotes_atuais)
+    valor_negociado = float(np.abs(delta) @ np.asarray(custos_acoes, dtype=float))
+    return {
+        'compras': {nomes_ativos[i]: int(delta[i]) for i in np.flatnonzero(delta > 0)},
+        'vendas': {nomes_ativos[i]: int(-delta[i]) for i in np.flatnonzero(delta < 0)},
+        'negociacoes': int(np.count_nonzero(delta)),
+        'valor_negociado': valor_negociado,
+        'giro': valor_negociado / valor_investido if valor_investido > 0 else 0.0,
+        'custo_transacao': custo_transacao * valor_negociado
+    }
+
 # Função principal para resolver o problema com Gurobi e restrições setoriais
 def resolver_com_gurobi_setores(inputs, lambda_risk, risco_max_usuario, 
                                 warm_start_pesos, setores_proibidos,
@@ -25,11 +105,25 @@ def resolver_com_gurobi_setores(inputs, lambda_risk, risco_max_usuario,
                                 teto_maximo_setor=1.0,
                                 max_ativos_carteira=15, 
                                 max_ativos_setor=4,     
-                                verbose=True):          
+                                verbose=True,
+                                tempo_limite=None,
+                                mip_gap=None,
+                                threads=None,
+                                num_solucoes_pool=0,
+                                restricoes_lazy=None,
+                                lotes_atuais=None,
+                                custo_transacao=None,
+                                max_negociacoes=None,
+                                turnover_maximo=None,
+                                fixar_intocados=None,
+                                cvar_modo=None,
+                                cvar_maximo=None):          
     
-    # Variável mínima de peso para considerar compra
-    MIN_PESO_SE_COMPRAR = 0.005
- 
+    # Rebalanceamento: com 'lotes_atuais' (cotas em carteira, na ordem de nomes_ativos) o modelo parte da
+    # carteira atual, cobra custo de transação sobre o valor negociado e limita giro e número de negociações.
+    # 'valor_total_investido' deve ser o patrimônio total (caixa + posições a preço atual)
+    rebalanceamento = lotes_atuais is not None
+
     # 1. Extração dos Inputs
     retornos = inputs['retornos_medios'].values
     cov_matrix = inputs['matriz_cov'].values
@@ -51,31 +145,23 @@ def resolver_com_gurobi_setores(inputs, lambda_risk, risco_max_usuario,
     if verbose:
         print(f"\n[GUROBI] Iniciando... Max Global: {max_ativos_carteira} | Max/Setor: {max_ativos_setor}")
 
-    # 2. Mapeamento de Setores
-    mapa_setores = config.obter_mapa_setores_ativos()
-    indices_por_setor = {}
-    ativo_para_setor = {}
+    if rebalanceamento:
+        lotes_atuais = np.nan_to_num(np.asarray(lotes_atuais, dtype=float))
+        custo_transacao = config.REBALANCEAMENTO_CUSTO_TRANSACAO if custo_transacao is None else custo_transacao
+        fixar_intocados = config.REBALANCEAMENTO_FIXAR_INTOCADOS if fixar_intocados is None else fixar_intocados
 
-    # Faz o mapeamento reverso de ativo para setor
-    for setor, lista_ativos in mapa_setores.items():
-        if setor not in indices_por_setor: indices_por_setor[setor] = []
-        for ativo in lista_ativos:
-            ativo_limpo = limpar_string(ativo)
-            ativo_para_setor[ativo_limpo] = setor
+    # Ativos que podem ser negociados. Com fixar_intocados, quem não está em carteira nem no suporte dos
+    # warm starts fica fora do modelo (a posição zero não é tocada), o que encolhe o MIP do rebalanceamento
+    candidatos = None
+    if rebalanceamento and fixar_intocados and warm_start_pesos is not None:
+        suporte = np.atleast_2d(np.nan_to_num(np.asarray(warm_start_pesos, dtype=float))) > 1e-6
+        candidatos = suporte.any(axis=0) | (lotes_atuais > 0)
 
-    # Preenche os índices por setor
-    for i, ticker in enumerate(nomes_ativos):
-        ticker_limpo = limpar_string(ticker)
-        if ticker_limpo in ativo_para_setor:
-            setor = ativo_para_setor[ticker_limpo]
-            indices_por_setor[setor].append(i)
+    # 2. Mapeamento de Setores
+    indices_por_setor = mapear_setores(nomes_ativos, inputs.get('setores_universo'))
 
     # Constrói o conjunto de ativos proibidos com base nos setores proibidos
-    ativos_proibidos_set = set()
-    if setores_proibidos:
-        for setor in setores_proibidos:
-            if setor in mapa_setores:
-                ativos_proibidos_set.update([limpar_string(a) for a in mapa_setores[setor]])
+    ativos_proibidos_set = ativos_proibidos(setores_proibidos, inputs.get('setores_universo'))
 
     # 3. Construção do Modelo Gurobi
     model = gp.Model("Portfolio_Dinamico")
@@ -85,31 +171,31 @@ def resolver_com_gurobi_setores(inputs, lambda_risk, risco_max_usuario,
     pesos = []
     vars_lotes = []
     vars_binarias = [] 
+    custos_acoes = []
+    limites_unidades = []
+    minimos_cotas = []
 
     # Loop para criar variáveis por ativo
     for i, ticker in enumerate(nomes_ativos):
         ticker_limpo = limpar_string(ticker)
         
-        preco_unitario = safe_float(precos_atuais.get(ticker, 0.0))
-        custo_acao = preco_unitario
+        custo_acao = safe_float(precos_atuais.get(ticker, 0.0))
         vol = safe_float(volume_medio.get(ticker, 0.0))
-        
-        # Cálculo do teto financeiro baseado no menor entre teto e liquidez
-        teto_financeiro_ativo = min(valor_investido * teto_maximo_ativo, 0.1 * vol)
-        if ticker_limpo in ativos_proibidos_set: teto_financeiro_ativo = 0.0
-            
-        if custo_acao <= 0.01: 
-            max_unidades = 0
-        else:
-            max_unidades = int(teto_financeiro_ativo / custo_acao)
-        
-        # Cálculo da quantidade mínima de cotas para comprar
-        min_financeiro_ativo = valor_investido * MIN_PESO_SE_COMPRAR
-        min_cotas = math.ceil(min_financeiro_ativo / (custo_acao + 0.0001))
+        max_unidades, min_cotas = limites_cotas(custo_acao, vol, valor_investido, teto_maximo_ativo,
+                                                ticker_limpo in ativos_proibidos_set)
+        if candidatos is not None and not candidatos[i]:
+            max_unidades, min_cotas = 0, 0
+
+        custos_acoes.append(custo_acao)
+        limites_unidades.append(max_unidades)
+        minimos_cotas.append(min_cotas)
 
-        if min_cotas > max_unidades:
-            max_unidades = 0
-            min_cotas = 0
+        # Pré-filtro: ativos sem unidades compráveis (liquidez, proibidos ou preço) ficam fora do modelo
+        if max_unidades == 0:
+            vars_binarias.append(None)
+            vars_lotes.append(None)
+            pesos.append(0.0)
+            continue
 
         z = model.addVar(vtype=GRB.BINARY, name=f"bin_{ticker}")
         vars_binarias.append(z)
@@ -117,30 +203,6 @@ def resolver_com_gurobi_setores(inputs, lambda_risk, risco_max_usuario,
         n_cotas = model.addVar(lb=0, ub=max_unidades, vtype=GRB.INTEGER, name=f"qtd_{ticker}")
         vars_lotes.append(n_cotas)
 
-        if warm_start_pesos is not None:
-            peso_ga = warm_start_pesos[i]
-            
-            if peso_ga > 1e-6: 
-                valor_sugerido = peso_ga * valor_investido
-                
-                # Cálculo da quantidade sugerida com base no preço atual
-                if custo_acao > 0.01:
-                    qtd_sugerida = int(valor_sugerido / custo_acao)
-                    
-                    if qtd_sugerida > max_unidades: qtd_sugerida = max_unidades
-                    
-                    # Define o valor inicial para a variável de quantidade
-                    n_cotas.Start = qtd_sugerida
-
-                    if qtd_sugerida >= min_cotas and qtd_sugerida > 0:
-                        z.Start = 1.0
-                    else:
-                        z.Start = 0.0
-                else:
-                    z.Start = 0.0
-            else:
-                z.Start = 0.0 # Garante que o Warm Start não force a compra se o peso for zero
-
         model.addConstr(n_cotas <= max_unidades * z, f"link_max_{ticker}")
         model.addConstr(n_cotas >= min_cotas * z, f"link_min_{ticker}")
 
@@ -152,62 +214,253 @@ def resolver_com_gurobi_setores(inputs, lambda_risk, risco_max_usuario,
         
     model.update()
 
+    # Índices dos ativos que realmente entraram no modelo
+    idx_modelo = [i for i in range(n_ativos) if vars_lotes[i] is not None]
+    indices_por_setor = {setor: [i for i in idxs if vars_lotes[i] is not None] for setor, idxs in indices_por_setor.items()}
+    indices_por_setor = {setor: idxs for setor, idxs in indices_por_setor.items() if idxs}
+
+    if verbose:
+        print(f"   > Ativos no modelo: {len(idx_modelo)} de {n_ativos}")
+
+    # Negociações do rebalanceamento: compra - venda = alvo - atual. Posições fora do modelo são vendidas
+    # inteiras (entram como constantes no giro, no custo e na contagem de negociações)
+    vars_compra, vars_venda, vars_negocia = {}, {}, {}
+    valor_negociado = 0.0
+    negociacoes_fixas = 0
+    if rebalanceamento:
+        for i in range(n_ativos):
+            if lotes_atuais[i] > 0 and vars_lotes[i] is None:
+                valor_negociado += lotes_atuais[i] * custos_acoes[i]
+                negociacoes_fixas += 1
+        for i in idx_modelo:
+            vars_compra[i] = model.addVar(lb=0, ub=limites_unidades[i], name=f"compra_{nomes_ativos[i]}")
+            vars_venda[i] = model.addVar(lb=0, ub=lotes_atuais[i], name=f"venda_{nomes_ativos[i]}")
+            model.addConstr(vars_lotes[i] - vars_compra[i] + vars_venda[i] == lotes_atuais[i], f"negocia_{nomes_ativos[i]}")
+            if max_negociacoes is not None:
+                vars_negocia[i] = model.addVar(vtype=GRB.BINARY, name=f"neg_{nomes_ativos[i]}")
+                limite_negocio = max(limites_unidades[i], lotes_atuais[i])
+                model.addConstr(vars_compra[i] + vars_venda[i] <= limite_negocio * vars_negocia[i], f"link_neg_{nomes_ativos[i]}")
+        valor_negociado = valor_negociado + gp.quicksum((vars_compra[i] + vars_venda[i]) * custos_acoes[i] for i in idx_modelo)
+        model.update()
+
+    # Carteira atual como partida do MIP (o que estiver acima dos limites de hoje é cortado)
+    partida_atual = None
+    if rebalanceamento:
+        partida_atual = np.array([min(lotes_atuais[i], limites_unidades[i]) if vars_lotes[i] is not None else 0.0
+                                  for i in range(n_ativos)])
+        partida_atual[partida_atual < np.array(minimos_cotas)] = 0.0
+
+    # Warm Start: aceita um vetor de pesos ou uma matriz (várias partidas para o MIP), mais a carteira atual
+    partidas = [] if warm_start_pesos is None else list(np.atleast_2d(np.asarray(warm_start_pesos, dtype=float)))
+    if partidas or partida_atual is not None:
+        # Cada partida é arredondada para um vetor de cotas viável (cardinalidade, tetos, orçamento e risco; no
+        # rebalanceamento também custo de transação, giro e negociações); as que ainda violarem alguma dessas
+        # restrições são descartadas. O teto de CVaR por cenários fica a cargo do Gurobi
+        lotes_partidas = [arredondamento_lotes.arredondar_para_lotes(
+            pesos_partida, custos_acoes, limites_unidades, minimos_cotas, valor_investido, cov_matrix,
+            retornos, vals_pvp, vals_cvar, lambda_risk, risco_max_usuario, indices_por_setor,
+            teto_setor=teto_maximo_setor, max_ativos=max_ativos_carteira, max_ativos_setor=max_ativos_setor,
+            pesos_penalidade=(config.PESO_PVP, config.PESO_CVAR, config.PESO_PENALIZACAO_CAIXA)
+        ) for pesos_partida in partidas]
+        restricoes_rebalanceamento = {}
+        if rebalanceamento:
+            # O arredondamento usa o patrimônio inteiro: aqui entram custo de transação, giro e negociações
+            restricoes_rebalanceamento = {'custo_transacao': custo_transacao, 'turnover_maximo': turnover_maximo,
+                                          'max_negociacoes': max_negociacoes}
+            lotes_partidas = [arredondamento_lotes.ajustar_rebalanceamento(
+                lotes, lotes_atuais, custos_acoes, limites_unidades, minimos_cotas, valor_investido,
+                **restricoes_rebalanceamento) for lotes in lotes_partidas]
+            restricoes_rebalanceamento['lotes_atuais'] = lotes_atuais
+        n_arredondadas = len(lotes_partidas)
+        lotes_partidas = [lotes for lotes in lotes_partidas if arredondamento_lotes.lotes_viaveis(
+            lotes, custos_acoes, limites_unidades, minimos_cotas, valor_investido, cov_matrix, risco_max_usuario,
+            indices_por_setor, teto_setor=teto_maximo_setor, max_ativos=max_ativos_carteira,
+            max_ativos_setor=max_ativos_setor, **restricoes_rebalanceamento)]
+        if len(lotes_partidas) < n_arredondadas:
+            print(f"   > {n_arredondadas - len(lotes_partidas)} partidas inviáveis após o arredondamento descartadas")
+        if partida_atual is not None:
+            lotes_partidas.append(partida_atual)
+
+        model.NumStart = len(lotes_partidas)
+        model.update()
+
+        for k, lotes_partida in enumerate(lotes_partidas):
+            model.setParam('StartNumber', k)
+            for i in idx_modelo:
+                vars_lotes[i].Start = lotes_partida[i]
+                vars_binarias[i].Start = 1.0 if lotes_partida[i] > 0 else 0.0
+                if rebalanceamento:
+                    vars_compra[i].Start = max(lotes_partida[i] - lotes_atuais[i], 0.0)
+                    vars_venda[i].Start = max(lotes_atuais[i] - lotes_partida[i], 0.0)
+                    if i in vars_negocia:
+                        vars_negocia[i].Start = 1.0 if lotes_partida[i] != lotes_atuais[i] else 0.0
+
     # 4. Função Objetivo e Restrições
 
     # Restrição de Orçamento que pode ser menor que 1.0 (permitindo Caixa)
-    expr_ret = gp.quicksum(pesos[i] * retornos[i] for i in range(n_ativos))
+    expr_ret = gp.quicksum(pesos[i] * retornos[i] for i in idx_modelo)
     # Restrição de Risco que deve ser menor que o máximo do usuário
-    expr_var = gp.quicksum(pesos[i] * cov_matrix[i, j] * pesos[j] for i in range(n_ativos) for j in range(n_ativos))
+    expr_var = gp.quicksum(pesos[i] * cov_matrix[i, j] * pesos[j] for i in idx_modelo for j in idx_modelo)
     # Restrições de Teto Setorial que limitam o peso total por setor
-    expr_pvp = gp.quicksum(pesos[i] * vals_pvp[i] for i in range(n_ativos))
+    expr_pvp = gp.quicksum(pesos[i] * vals_pvp[i] for i in idx_modelo)
     # Métrica CVaR que deve ser minimizada
-    expr_cvar = gp.quicksum(pesos[i] * vals_cvar[i] for i in range(n_ativos))
+    expr_cvar = gp.quicksum(pesos[i] * vals_cvar[i] for i in idx_modelo)
     # Restrição de Soma dos Pesos que deve ser menor que 1.0
-    expr_soma_pesos = gp.quicksum(pesos)
+    expr_soma_pesos = gp.quicksum(pesos[i] for i in idx_modelo)
+
+    # CVaR da carteira por cenários (Rockafellar-Uryasev): CVaR = zeta + E[max(perda - zeta, 0)] / 5%.
+    # No modo 'cenarios' substitui o proxy linear x·cvar no objetivo; 'cvar_maximo' (diário) vira restrição
+    cvar_modo = config.CVAR_MODO if cvar_modo is None else cvar_modo
+    if cvar_modo not in ('proxy', 'cenarios'):
+        raise ValueError(f"Modo de CVaR desconhecido: {cvar_modo}")
+    expr_cvar_carteira = None
+    adicionar_corte_cvar = None
+    if (cvar_modo == 'cenarios' or cvar_maximo is not None) and idx_modelo and valor_investido > 0:
+        cenarios, probabilidades = cenarios_cvar.cenarios_dos_inputs(inputs, [nomes_ativos[i] for i in idx_modelo])
+        lotes_modelo = [vars_lotes[i] for i in idx_modelo]
+        custos_modelo = np.array([custos_acoes[i] for i in idx_modelo]) / valor_investido
+        zeta = model.addVar(lb=-GRB.INFINITY, name="cvar_zeta")
+        excessos = model.addVars(len(probabilidades), lb=0.0, name="cvar_excesso")
+        for s, retorno_cenario in enumerate(cenarios):
+            perda = gp.LinExpr((-retorno_cenario * custos_modelo).tolist(), lotes_modelo)
+            model.addConstr(excessos[s] >= perda - zeta, f"cvar_cenario_{s}")
+        expr_cvar_carteira = zeta + gp.quicksum(probabilidades[s] * excessos[s] for s in range(len(probabilidades))) / 0.05
+        if cvar_modo == 'cenarios':
+            expr_cvar = expr_cvar_carteira
+        if cvar_maximo is not None:
+            model.addConstr(expr_cvar_carteira <= cvar_maximo, "CVaR")
+
+        # A cauda dos cenários é escolhida pelas quedas de cada ativo, não da carteira: o CVaR histórico da
+        # solução pode passar do teto. Nesse caso entra o CVaR histórico exato (média das perdas nos 5% piores
+        # dias, Rockafellar-Uryasev com zeta próprio) só com os dias da cauda das soluções já encontradas:
+        # com menos dias a soma é menor, então a restrição nunca corta carteira viável, e cada rodada
+        # acrescenta os dias da cauda da nova solução até o CVaR histórico caber no teto
+        historico = inputs.get('retornos_diarios_historicos')
+        if cvar_maximo is not None and historico is not None and len(historico):
+            historico_modelo = np.nan_to_num(historico.reindex(columns=[nomes_ativos[i] for i in idx_modelo]).values)
+            n_piores = max(1, int(len(historico_modelo) * 0.05))
+            corte_historico = {'dias': set(), 'restricao': None, 'zeta': None}
+
+            def adicionar_corte_cvar(n_corte):
+                posicoes = np.array([v.X for v in lotes_modelo]) * custos_modelo
+                piores = np.argsort(historico_modelo @ posicoes)[:n_piores]
+                if -(historico_modelo[piores] @ posicoes).mean() <= cvar_maximo * (1 + 1e-4):
+                    return False
+                if corte_historico['restricao'] is None:
+                    corte_historico['zeta'] = model.addVar(lb=-GRB.INFINITY, name="cvar_hist_zeta")
+                    corte_historico['restricao'] = model.addConstr(corte_historico['zeta'] <= cvar_maximo, "CVaR_historico")
+                for d in piores:
+                    if d in corte_historico['dias']:
+                        continue
+                    corte_historico['dias'].add(d)
+                    excesso = model.addVar(lb=0.0, name=f"cvar_hist_{d}")
+                    perda = gp.LinExpr((-historico_modelo[d] * custos_modelo).tolist(), lotes_modelo)
+                    model.addConstr(excesso >= perda - corte_historico['zeta'], f"cvar_hist_dia_{d}")
+                    model.chgCoeff(corte_historico['restricao'], excesso, 1.0 / n_piores)
+                return True
     
     # Função Objetivo (Multiobjetivo Scalarizado) dado pelo usuário
     # Minimizar: (Risco * Lambda) - Retorno + Custo P/VP + Custo CVaR + Penalidade Caixa
     obj = (lambda_risk * expr_var) - expr_ret + (config.PESO_PVP * expr_pvp) + (config.PESO_CVAR * expr_cvar) + (config.PESO_PENALIZACAO_CAIXA * (1.0 - expr_soma_pesos))
+    # Rebalanceamento: o custo de transação sai do caixa e entra no objetivo (fração do patrimônio)
+    expr_custo = 0.0
+    if rebalanceamento:
+        expr_custo = custo_transacao * valor_negociado / valor_investido
+        obj = obj + expr_custo
     model.setObjective(obj, GRB.MINIMIZE)
     
-    model.addConstr(expr_soma_pesos <= 1.0, "orcamento")
+    model.addConstr(expr_soma_pesos + expr_custo <= 1.0, "orcamento")
     model.addConstr(expr_var <= risco_max_usuario ** 2, "Risco")
+
+    if rebalanceamento and turnover_maximo is not None:
+        model.addConstr(valor_negociado <= turnover_maximo * valor_investido, "Giro")
+    if rebalanceamento and max_negociacoes is not None:
+        model.addConstr(gp.quicksum(vars_negocia.values()) + negociacoes_fixas <= max_negociacoes, "Negociacoes")
     
-    # Restrições de Teto Setorial
-    if teto_maximo_setor < 0.999:
+    # Restrições setoriais que podem ser violadas (as demais nunca ficam ativas e são descartadas)
+    setores_teto = []
+    if teto_maximo_setor < 0.999 and valor_investido > 0:
         for setor, idxs in indices_por_setor.items():
-            if idxs:
-                model.addConstr(gp.quicksum(pesos[i] for i in idxs) <= teto_maximo_setor, f"TetoFin_{setor}")
+            peso_maximo_setor = sum(limites_unidades[i] * custos_acoes[i] for i in idxs) / valor_investido
+            if peso_maximo_setor > teto_maximo_setor:
+                setores_teto.append(setor)
+    setores_card = [setor for setor, idxs in indices_por_setor.items() if len(idxs) > max_ativos_setor]
 
     # Restrições de Cardinalidade
 
     # 1. Global
-    model.addConstr(gp.quicksum(vars_binarias) <= max_ativos_carteira, "Card_Global")
+    if len(idx_modelo) > max_ativos_carteira:
+        model.addConstr(gp.quicksum(vars_binarias[i] for i in idx_modelo) <= max_ativos_carteira, "Card_Global")
 
-    # 2. Por Setor
-    for setor, idxs in indices_por_setor.items():
-        if idxs:
-            model.addConstr(gp.quicksum(vars_binarias[i] for i in idxs) <= max_ativos_setor, f"Card_Setor_{setor}")
+    restricoes_lazy = config.GUROBI_RESTRICOES_LAZY if restricoes_lazy is None else restricoes_lazy
+    callback = None
 
-    model.optimize()
+    if restricoes_lazy:
+        # Modo Lazy: tetos e cardinalidades setoriais só entram quando uma solução inteira os viola
+        model.setParam('LazyConstraints', 1)
+
+        def callback(modelo_cb, where):
+            if where != GRB.Callback.MIPSOL:
+                return
+            for setor in setores_teto:
+                idxs = indices_por_setor[setor]
+                lotes_setor = modelo_cb.cbGetSolution([vars_lotes[i] for i in idxs])
+                peso_setor = sum(q * custos_acoes[i] for q, i in zip(lotes_setor, idxs)) / valor_investido
+                if peso_setor > teto_maximo_setor + 1e-6:
+                    modelo_cb.cbLazy(gp.quicksum(pesos[i] for i in idxs) <= teto_maximo_setor)
+            for setor in setores_card:
+                idxs = indices_por_setor[setor]
+                z_setor = modelo_cb.cbGetSolution([vars_binarias[i] for i in idxs])
+                if sum(z_setor) > max_ativos_setor + 0.5:
+                    modelo_cb.cbLazy(gp.quicksum(vars_binarias[i] for i in idxs) <= max_ativos_setor)
+    else:
+        # Restrições de Teto Setorial
+        for setor in setores_teto:
+            model.addConstr(gp.quicksum(pesos[i] for i in indices_por_setor[setor]) <= teto_maximo_setor, f"TetoFin_{setor}")
+
+        # 2. Por Setor
+        for setor in setores_card:
+            model.addConstr(gp.quicksum(vars_binarias[i] for i in indices_por_setor[setor]) <= max_ativos_setor, f"Card_Setor_{setor}")
+
+    # Parâmetros de parada: tempo e gap (as threads vêm do orçamento de núcleos)
+    tempo_limite = config.GUROBI_TEMPO_LIMITE if tempo_limite is None else tempo_limite
+    mip_gap = config.GUROBI_MIP_GAP if mip_gap is None else mip_gap
+    threads = config.GUROBI_THREADS if threads is None else threads
+
+    if tempo_limite: model.setParam('TimeLimit', float(tempo_limite))
+    if mip_gap is not None: model.setParam('MIPGap', float(mip_gap))
+
+    # Pool de soluções: guarda as K melhores carteiras encontradas
+    num_solucoes_pool = min(int(num_solucoes_pool or 0), config.GUROBI_MAX_POOL)
+    if num_solucoes_pool > 0:
+        model.setParam('PoolSolutions', num_solucoes_pool + 1)
+        model.setParam('PoolSearchMode', 2)
+
+    # Reserva os núcleos (o pedido explícito ou CPU_THREADS_GUROBI) e usa exatamente o que foi concedido;
+    # sem núcleos livres, espera na fila
+    with orcamento_cpu.reservar(threads or None) as nucleos:
+        model.setParam('Threads', int(nucleos))
+        model.optimize(callback)
+        if adicionar_corte_cvar is not None:
+            for n_corte in range(config.CVAR_CORTES_MAX):
+                if model.SolCount == 0 or not adicionar_corte_cvar(n_corte):
+                    break
+                model.optimize(callback)
     
     # 5. Extração dos Resultados
-    if model.Status == GRB.OPTIMAL:
-        w_otimo = np.zeros(n_ativos)
-        lotes_otimos = np.zeros(n_ativos)
-        
-        for i in range(n_ativos):
-            qtd = vars_lotes[i].X
-            preco = safe_float(precos_atuais.get(nomes_ativos[i], 0.0))
-            if valor_investido > 0:
-                w_otimo[i] = (qtd * preco) / valor_investido
-            lotes_otimos[i] = qtd
+    # Aceita a melhor solução incumbente mesmo quando o limite de tempo é atingido
+    if model.SolCount > 0:
+        lotes_otimos = np.array([v.X if v is not None else 0.0 for v in vars_lotes])
+        w_otimo = calcular_pesos_lotes(lotes_otimos, nomes_ativos, precos_atuais, valor_investido)
         
         # Cálculo das métricas finais
-        ret_final = np.dot(w_otimo, retornos)
-        var_final = np.dot(w_otimo, np.dot(cov_matrix, w_otimo))
-        pvp_final = np.dot(w_otimo, vals_pvp)
-        cvar_final = np.dot(w_otimo, vals_cvar)
+        ret_final, var_final, pvp_final, cvar_final = calcular_metricas_carteira(
+            w_otimo, retornos, cov_matrix, vals_pvp, vals_cvar
+        )
+        # CVaR histórico da carteira (todos os dias) e o valor nos cenários reduzidos, quando usados
+        historico = inputs.get('retornos_diarios_historicos')
+        cvar_historico = cenarios_cvar.cvar_carteira(historico.reindex(columns=list(nomes_ativos)).values, w_otimo) \
+            if historico is not None else None
         
         investido_real = w_otimo.sum() * valor_investido
 
@@ -217,13 +470,33 @@ def resolver_com_gurobi_setores(inputs, lambda_risk, risco_max_usuario,
         
         sobra = valor_investido - investido_real
 
-        qtd_ativos_selecionados = int(sum(vars_binarias[i].X for i in range(n_ativos)))
+        qtd_ativos_selecionados = int(round(sum(vars_binarias[i].X for i in idx_modelo)))
+        gap_final = model.MIPGap if model.IsMIP else 0.0
         
         # Impressão dos resultados
         if verbose:
+            if model.Status != GRB.OPTIMAL:
+                print(f"   > [AVISO] Status {model.Status}: usando melhor solução encontrada (gap {gap_final:.2%})")
             print(f"   > [SUCESSO] Inv: R$ {investido_real:.2f} | Sobra: R$ {sobra:.2f} | Ativos: {qtd_ativos_selecionados}")
         if verbose:
             print()
+
+        # Soluções alternativas do pool (a de índice 0 é a própria ótima)
+        solucoes_pool = []
+        for k in range(1, min(model.SolCount, num_solucoes_pool + 1)):
+            model.setParam('SolutionNumber', k)
+            lotes_k = np.array([v.Xn if v is not None else 0.0 for v in vars_lotes])
+            w_k = calcular_pesos_lotes(lotes_k, nomes_ativos, precos_atuais, valor_investido)
+            ret_k, var_k, pvp_k, cvar_k = calcular_metricas_carteira(w_k, retornos, cov_matrix, vals_pvp, vals_cvar)
+            solucoes_pool.append({
+                'pesos': w_k,
+                'lotes': lotes_k,
+                'obj': model.PoolObjVal,
+                'retorno': ret_k,
+                'risco': np.sqrt(var_k),
+                'pvp_final': pvp_k,
+                'cvar_final': cvar_k
+            })
         
         # 6. Retorno dos Resultados
         return {
@@ -233,9 +506,183 @@ def resolver_com_gurobi_setores(inputs, lambda_risk, risco_max_usuario,
             'retorno': ret_final,
             'risco': np.sqrt(var_final),
             'pvp_final': pvp_final,
-            'cvar_final': cvar_final
+            'cvar_final': cvar_final,
+            'cvar_carteira': cvar_historico,
+            'cvar_cenarios': expr_cvar_carteira.getValue() if expr_cvar_carteira is not None else None,
+            # Teto de CVaR ainda violado no histórico (cortes esgotados ou limite de tempo)
+            'cvar_excedido': cvar_maximo is not None and cvar_historico is not None
+                             and cvar_historico > cvar_maximo * (1 + 1e-4),
+            'status': 'otimo' if model.Status == GRB.OPTIMAL else 'limite',
+            'gap': gap_final,
+            'solucoes_pool': solucoes_pool,
+            'rebalanceamento': resumir_negociacoes(lotes_atuais, lotes_otimos, nomes_ativos, custos_acoes,
+                                                   custo_transacao, valor_investido) if rebalanceamento else None
         }
     else:
         if verbose:
             print(f"[GUROBI] Falha. Status: {model.Status}")
-        return None
\ No newline at end of file
+        return None
+
+
+# --- Lote de clientes: um esqueleto de modelo compartilhado ---
+# Clientes com o mesmo lambda diferem só em valor, proibidos, tetos e limites de cardinalidade. O esqueleto
+# monta uma única vez a expressão de risco, o objetivo e as restrições setoriais sobre pesos contínuos
+# (w = cotas * preço / valor); cada cliente só muda limites, coeficientes do elo cotas-peso e lados direitos.
+
+# Monta o esqueleto com todos os ativos de preço válido. Ordem das restrições: link_max, link_min, peso
+# (uma por ativo), orçamento, cardinalidade global, tetos setoriais e cardinalidades setoriais
+def montar_esqueleto(inputs, lambda_risk):
+    nomes_ativos = inputs['nomes_dos_ativos']
+    precos_atuais = inputs['ultimos_precos']
+    custos = np.array([safe_float(precos_atuais.get(t, 0.0)) for t in nomes_ativos])
+    idx_modelo = [i for i in range(len(nomes_ativos)) if custos[i] > 0.01]
+    posicao = {i: k for k, i in enumerate(idx_modelo)}
+    setores = [(setor, [posicao[i] for i in idxs if i in posicao])
+               for setor, idxs in mapear_setores(nomes_ativos, inputs.get('setores_universo')).items()]
+    setores = [(setor, pos) for setor, pos in setores if pos]
+
+    retornos = inputs['retornos_medios'].values[idx_modelo]
+    cov = inputs['matriz_cov'].values[np.ix_(idx_modelo, idx_modelo)]
+    vals_pvp = inputs['vetor_pvp'].values[idx_modelo]
+    vals_cvar = inputs['vetor_cvar'].values[idx_modelo]
+    k = len(idx_modelo)
+
+    model = gp.Model("Portfolio_Esqueleto")
+    model.setParam('OutputFlag', 0)
+    cotas = model.addMVar(k, lb=0, vtype=GRB.INTEGER, name="qtd")
+    binarias = model.addMVar(k, vtype=GRB.BINARY, name="bin")
+    pesos = model.addMVar(k, lb=0, ub=1, name="peso")
+
+    # Coeficientes provisórios (1.0): ajustados por cliente
+    model.addConstr(cotas - binarias <= 0, "link_max")
+    model.addConstr(cotas - binarias >= 0, "link_min")
+    model.addConstr(pesos - cotas == 0, "peso")
+    model.addConstr(pesos.sum() <= 1.0, "orcamento")
+    model.addConstr(binarias.sum() <= k, "Card_Global")
+    for setor, pos in setores:
+        model.addConstr(pesos[pos].sum() <= 1.0, f"TetoFin_{setor}")
+    for setor, pos in setores:
+        model.addConstr(binarias[pos].sum() <= len(pos), f"Card_Setor_{setor}")
+    expr_var = pesos @ cov @ pesos
+    model.addConstr(expr_var <= 1.0, "Risco")
+
+    # Mesmo objetivo de resolver_com_gurobi_setores
+    custo_linear = -retornos + config.PESO_PVP * vals_pvp + config.PESO_CVAR * vals_cvar - config.PESO_PENALIZACAO_CAIXA
+    model.setObjective(lambda_risk * expr_var + custo_linear @ pesos + config.PESO_PENALIZACAO_CAIXA, GRB.MINIMIZE)
+    model.update()
+
+    return {
+        'modelo': model,
+        'idx_modelo': idx_modelo,
+        'custos': custos[idx_modelo],
+        'volumes': np.array([safe_float(inputs['volume_medio'].get(nomes_ativos[i], 0.0)) for i in idx_modelo]),
+        'tickers': [limpar_string(nomes_ativos[i]) for i in idx_modelo],
+        'setores': setores,
+        'setores_universo': inputs.get('setores_universo'),
+        'retornos': retornos, 'cov': cov, 'pvp': vals_pvp, 'cvar': vals_cvar,
+        'n_ativos': len(nomes_ativos)
+    }
+
+# Ajusta uma cópia do esqueleto para um cliente: limites das cotas, coeficientes e lados direitos
+def ajustar_cliente(esqueleto, model, cliente):
+    k = len(esqueleto['idx_modelo'])
+    variaveis = model.getVars()
+    cotas, binarias, pesos = variaveis[:k], variaveis[k:2 * k], variaveis[2 * k:]
+    restricoes = model.getConstrs()
+    link_max, link_min, elo_peso = restricoes[:k], restricoes[k:2 * k], restricoes[2 * k:3 * k]
+    n_setores = len(esqueleto['setores'])
+    card_global = restricoes[3 * k + 1]
+    tetos_setor = restricoes[3 * k + 2:3 * k + 2 + n_setores]
+    cards_setor = restricoes[3 * k + 2 + n_setores:]
+
+    valor = cliente['valor'] or 1.0
+    proibidos = ativos_proibidos(cliente['proibidos'], esqueleto['setores_universo'])
+    limites = [limites_cotas(custo, vol, valor, cliente['teto_ativo'], ticker in proibidos)
+               for custo, vol, ticker in zip(esqueleto['custos'], esqueleto['volumes'], esqueleto['tickers'])]
+    for p in range(k):
+        max_unidades, min_cotas = limites[p]
+        cotas[p].UB = max_unidades
+        binarias[p].UB = 1.0 if max_unidades > 0 else 0.0
+        model.chgCoeff(link_max[p], binarias[p], -max_unidades)
+        model.chgCoeff(link_min[p], binarias[p], -min_cotas)
+        model.chgCoeff(elo_peso[p], cotas[p], -esqueleto['custos'][p] / valor)
+
+    card_global.RHS = cliente['max_ativos']
+    for restricao in tetos_setor:
+        restricao.RHS = min(cliente['teto_setor'], 1.0)
+    for restricao in cards_setor:
+        restricao.RHS = cliente['max_ativos_setor']
+    model.getQConstrs()[0].QCRHS = cliente['risco'] ** 2
+    return cotas
+
+# Resolve um cliente numa cópia do esqueleto; mesmo formato de resultado de resolver_com_gurobi_setores
+def resolver_cliente(esqueleto, model, cliente, tempo_limite=None, mip_gap=None, threads=None):
+    cotas = ajustar_cliente(esqueleto, model, cliente)
+    tempo_limite = config.GUROBI_TEMPO_LIMITE if tempo_limite is None else tempo_limite
+    mip_gap = config.GUROBI_MIP_GAP if mip_gap is None else mip_gap
+    threads = config.GUROBI_THREADS if threads is None else threads
+    # A cópia do modelo é reaproveitada entre clientes: sem limite, volta ao padrão do Gurobi
+    model.setParam('TimeLimit', float(tempo_limite) if tempo_limite else GRB.INFINITY)
+    model.setParam('MIPGap', float(mip_gap) if mip_gap is not None else 1e-4)
+
+    with orcamento_cpu.reservar(threads or None) as nucleos:
+        model.setParam('Threads', int(nucleos))
+        model.optimize()
+    if model.SolCount == 0:
+        return None
+
+    valor = cliente['valor'] or 1.0
+    lotes_otimos = np.zeros(esqueleto['n_ativos'])
+    lotes_otimos[esqueleto['idx_modelo']] = np.round([v.X for v in cotas])
+    w = lotes_otimos[esqueleto['idx_modelo']] * esqueleto['custos'] / valor
+    ret_final, var_final, pvp_final, cvar_final = calcular_metricas_carteira(
+        w, esqueleto['retornos'], esqueleto['cov'], esqueleto['pvp'], esqueleto['cvar']
+    )
+    w_otimo = np.zeros(esqueleto['n_ativos'])
+    w_otimo[esqueleto['idx_modelo']] = w
+    return {
+        'pesos': w_otimo,
+        'lotes': lotes_otimos,
+        'obj': model.ObjVal,
+        'retorno': ret_final,
+        'risco': np.sqrt(var_final),
+        'pvp_final': pvp_final,
+        'cvar_final': cvar_final,
+        'status': 'otimo' if model.Status == GRB.OPTIMAL else 'limite',
+        'gap': model.MIPGap,
+        'solucoes_pool': []
+    }
+
+# Resolve um grupo de clientes (mesmo lambda) em paralelo: cada thread trabalha numa cópia do esqueleto
+# e resolve a sua fatia dos clientes em sequência. Resultados na ordem de 'clientes' (None = sem solução).
+# O 'gurobi' de cada cliente (tempo_limite, mip_gap, threads) tem prioridade sobre params_gurobi
+def resolver_grupo_clientes(inputs, lambda_risk, clientes, paralelo=None, **params_gurobi):
+    esqueleto = montar_esqueleto(inputs, lambda_risk)
+    paralelo = max(1, min(paralelo or orcamento_cpu.estado()['nucleos'], len(clientes)))
+    if not params_gurobi.get('threads'):   # sem 'threads', as fatias simultâneas dividem o orçamento
+        params_gurobi['threads'] = orcamento_cpu.nucleos_por_tarefa(paralelo)
+    resultados = [None] * len(clientes)
+
+    # Modelos resolvidos ao mesmo tempo precisam de ambientes separados: cada fatia tem o seu
+    def resolver_fatia(inicio):
+        env = gp.Env(empty=True)
+        env.setParam('OutputFlag', 0)
+        env.start()
+        model = None
+        try:
+            model = esqueleto['modelo'].copy(env=env)
+            for c in range(inicio, len(clientes), paralelo):
+                try:
+                    resultados[c] = resolver_cliente(esqueleto, model, clientes[c],
+                                                     **{**params_gurobi, **clientes[c].get('gurobi', {})})
+                except gp.GurobiError as e:
+                    print(f"[GUROBI] Erro no cliente {c}: {e}")
+        finally:
+            if model is not None:
+                model.dispose()
+            env.dispose()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=paralelo) as executor:
+        list(executor.map(perfilamento.propagar_perfil(resolver_fatia, 'lote'), range(paralelo)))
+    esqueleto['modelo'].dispose()
+    return resultados
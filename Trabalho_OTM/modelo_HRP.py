@@ -0,0 +1,125 @@
+import numpy as np
+from scipy.cluster.hierarchy import linkage, leaves_list
+from scipy.spatial.distance import squareform
+
+import config
+import modelo_AG
+
+# Hierarchical Risk Parity (López de Prado): agrupa os ativos pela correlação, ordena a matriz
+# de covariância em forma quase diagonal e divide o capital por bisseção recursiva, inversamente
+# à variância de cada metade. Sem solver: O(n² log n), útil para prévias e universos grandes.
+
+
+# Distância de correlação: d = sqrt((1 - ρ) / 2)
+def distancia_correlacao(cov):
+    desvios = np.sqrt(np.maximum(np.diag(cov), 1e-16))
+    corr = np.clip(cov / np.outer(desvios, desvios), -1.0, 1.0)
+    dist = np.sqrt(np.maximum(0.5 * (1.0 - corr), 0.0))
+    np.fill_diagonal(dist, 0.0)
+    return dist
+
+# Ordem quase diagonal: folhas do dendrograma, ativos parecidos ficam vizinhos
+def ordenar_por_cluster(cov, metodo=None):
+    if len(cov) < 2:
+        return np.arange(len(cov))
+    ligacoes = linkage(squareform(distancia_correlacao(cov), checks=False), method=metodo or config.HRP_METODO_LIGACAO)
+    return leaves_list(ligacoes)
+
+# Variância de um cluster com pesos de variância inversa dentro dele
+def variancia_cluster(cov, idxs):
+    sub = cov[np.ix_(idxs, idxs)]
+    ivp = 1.0 / np.maximum(np.diag(sub), 1e-16)
+    ivp /= ivp.sum()
+    return ivp @ sub @ ivp
+
+# Bisseção recursiva sobre a ordem quase diagonal
+def bissecao_recursiva(cov, ordem):
+    pesos = np.ones(len(cov))
+    pilha = [np.asarray(ordem)]
+    while pilha:
+        cluster = pilha.pop()
+        if len(cluster) < 2:
+            continue
+        meio = len(cluster) // 2
+        esquerda, direita = cluster[:meio], cluster[meio:]
+        var_esq, var_dir = variancia_cluster(cov, esquerda), variancia_cluster(cov, direita)
+        alfa = 1.0 - var_esq / (var_esq + var_dir)
+        pesos[esquerda] *= alfa
+        pesos[direita] *= 1.0 - alfa
+        pilha += [esquerda, direita]
+    return pesos
+
+# Corta nos tetos por ativo e por setor
+def cortar_nos_tetos(pesos, xu, indices_setores, teto_setor):
+    pesos = np.minimum(pesos, xu)
+    if teto_setor < 0.999:
+        for idxs in indices_setores:
+            soma_setor = pesos[idxs].sum()
+            if soma_setor > teto_setor:
+                pesos[idxs] *= teto_setor / soma_setor
+    return pesos
+
+# Impõe os tetos redistribuindo o excedente entre os ativos com folga, na proporção dos pesos HRP
+def aplicar_tetos(pesos_hrp, xu, indices_setores, teto_setor, max_iter=50):
+    pesos = cortar_nos_tetos(pesos_hrp.copy(), xu, indices_setores, teto_setor)
+    for _ in range(max_iter):
+        sobra = 1.0 - pesos.sum()
+        folga = (pesos_hrp > 0) & (pesos < xu - 1e-12)
+        if teto_setor < 0.999:
+            for idxs in indices_setores:
+                if pesos[idxs].sum() >= teto_setor - 1e-12:
+                    folga[idxs] = False
+        if sobra <= 1e-9 or not folga.any():
+            break
+        pesos[folga] += sobra * pesos_hrp[folga] / pesos_hrp[folga].sum()
+        pesos = cortar_nos_tetos(pesos, xu, indices_setores, teto_setor)
+    return pesos
+
+# Função principal: mesma assinatura e formato de resultado de modelo_AG.rodar_otimização
+def rodar_hrp(inputs, risco_maximo_usuario, lambda_aversao_risco,
+              setores_proibidos=None,
+              teto_maximo_ativo=0.30,
+              teto_maximo_setor=1.0,
+              verbose=True):
+
+    nomes_dos_ativos = list(inputs['nomes_dos_ativos'])
+    cov = inputs['matriz_cov'].reindex(index=nomes_dos_ativos, columns=nomes_dos_ativos).values
+    mapa_setores = config.obter_mapa_setores_ativos(inputs.get('setores_universo'))
+
+    xu = modelo_AG.calcular_teto_pesos(inputs['volume_medio'].reindex(nomes_dos_ativos), inputs.get('valor_total_investido', 0.0),
+                                       teto_maximo_ativo, teto_maximo_setor, nomes_dos_ativos, mapa_setores, setores_proibidos)
+    indices_setores = [idxs for idxs in
+                       ([i for i, nome in enumerate(nomes_dos_ativos) if nome in lista] for lista in mapa_setores.values())
+                       if idxs]
+
+    # 1. HRP só entre os ativos que podem receber o peso mínimo
+    elegiveis = np.flatnonzero(xu >= config.PESO_MINIMO_ATIVO)
+    if len(elegiveis) == 0:
+        if verbose:
+            print("\n[HRP] Nenhum ativo elegível com as restrições informadas.")
+        return None
+
+    cov_elegiveis = cov[np.ix_(elegiveis, elegiveis)]
+    pesos_hrp = np.zeros(len(nomes_dos_ativos))
+    pesos_hrp[elegiveis] = bissecao_recursiva(cov_elegiveis, ordenar_por_cluster(cov_elegiveis))
+
+    # 2. Tetos por ativo e setor. Abaixo do peso mínimo, sai a metade menor e o restante é
+    # redistribuído (em universos grandes quase todos começam abaixo do mínimo)
+    pesos = aplicar_tetos(pesos_hrp, xu, indices_setores, teto_maximo_setor)
+    while True:
+        abaixo = np.flatnonzero((pesos > 0) & (pesos < config.PESO_MINIMO_ATIVO))
+        if len(abaixo) == 0:
+            break
+        pesos_hrp[abaixo[np.argsort(pesos[abaixo])[:max(1, len(abaixo) // 2)]]] = 0.0
+        pesos = aplicar_tetos(pesos_hrp, xu, indices_setores, teto_maximo_setor)
+
+    # 3. Risco máximo: reduz a carteira proporcionalmente (o restante fica em caixa)
+    variancia = pesos @ cov @ pesos
+    if variancia > risco_maximo_usuario ** 2:
+        pesos *= risco_maximo_usuario / np.sqrt(variancia)
+        pesos[pesos < config.PESO_MINIMO_ATIVO] = 0.0
+
+    if verbose:
+        print(f"[HRP] {np.count_nonzero(pesos)} ativos, investido {pesos.sum():.1%}")
+
+    return modelo_AG.montar_resultado(pesos, inputs, risco_maximo_usuario, lambda_aversao_risco)
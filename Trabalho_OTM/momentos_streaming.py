@@ -0,0 +1,147 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+import config
+
+# Momentos do histórico sem carregar o painel inteiro na memória: preços e volumes ficam em .npy
+# no disco (memmap) e são lidos em blocos de dias. Uma única passada acumula média e covariância
+# (combinação de Chan entre blocos), as caudas do CVaR e os últimos preços. Pico de memória:
+# O(n² + bloco·n), mais o buffer de cauda de 5% dos dias.
+
+DIAS_UTEIS_ANO = 252
+JANELA_VOLUME = 126
+PASTA_PARTES = "partes"
+
+
+def caminho(pasta, nome):
+    return os.path.join(pasta, f"{nome}.npy")
+
+# Salva um lote de tickers já baixado (preços e volumes com as datas do próprio lote)
+def salvar_parte(pasta, k, precos, volumes):
+    pasta_partes = os.path.join(pasta, PASTA_PARTES)
+    os.makedirs(pasta_partes, exist_ok=True)
+    np.save(caminho(pasta_partes, f"{k}_precos"), precos.values.astype(float), allow_pickle=False)
+    np.save(caminho(pasta_partes, f"{k}_volumes"), volumes.reindex(precos.index).values.astype(float), allow_pickle=False)
+    np.save(caminho(pasta_partes, f"{k}_datas"), precos.index.values.astype('datetime64[ns]'), allow_pickle=False)
+    np.save(caminho(pasta_partes, f"{k}_nomes"), np.array(list(precos.columns), dtype=str), allow_pickle=False)
+
+# Junta as partes em um painel único (datas = união de todas), coluna a coluna no memmap.
+# Preenchimento igual ao download em lote: preços ffill/bfill e volumes ausentes = 0
+def montar_painel(pasta):
+    pasta_partes = os.path.join(pasta, PASTA_PARTES)
+    partes = sorted({int(nome.split('_')[0]) for nome in os.listdir(pasta_partes)})
+    if not partes:
+        return None
+
+    datas = pd.DatetimeIndex(np.unique(np.concatenate([np.load(caminho(pasta_partes, f"{k}_datas")) for k in partes])))
+    nomes_partes = [[str(n) for n in np.load(caminho(pasta_partes, f"{k}_nomes"))] for k in partes]
+    nomes = [n for lista in nomes_partes for n in lista]
+
+    formato = (len(datas), len(nomes))
+    precos = np.lib.format.open_memmap(caminho(pasta, 'precos'), mode='w+', dtype=float, shape=formato)
+    volumes = np.lib.format.open_memmap(caminho(pasta, 'volumes'), mode='w+', dtype=float, shape=formato)
+    coluna = 0
+    for k, nomes_parte in zip(partes, nomes_partes):
+        indice = pd.DatetimeIndex(np.load(caminho(pasta_partes, f"{k}_datas")))
+        fim = coluna + len(nomes_parte)
+        precos[:, coluna:fim] = pd.DataFrame(np.load(caminho(pasta_partes, f"{k}_precos"), mmap_mode='r'),
+                                             index=indice).reindex(datas).ffill().bfill().values
+        volumes[:, coluna:fim] = pd.DataFrame(np.load(caminho(pasta_partes, f"{k}_volumes"), mmap_mode='r'),
+                                              index=indice).reindex(datas).fillna(0).values
+        coluna = fim
+    precos.flush()
+    volumes.flush()
+    del precos, volumes
+
+    np.save(caminho(pasta, 'datas'), datas.values.astype('datetime64[ns]'), allow_pickle=False)
+    np.save(caminho(pasta, 'nomes'), np.array(nomes, dtype=str), allow_pickle=False)
+    shutil.rmtree(pasta_partes, ignore_errors=True)
+    return abrir_painel(pasta)
+
+def abrir_painel(pasta):
+    return {
+        'precos': np.load(caminho(pasta, 'precos'), mmap_mode='r'),
+        'volumes': np.load(caminho(pasta, 'volumes'), mmap_mode='r'),
+        'datas': pd.DatetimeIndex(np.load(caminho(pasta, 'datas'))),
+        'nomes': [str(n) for n in np.load(caminho(pasta, 'nomes'))],
+        'pasta': pasta
+    }
+
+# Acumulador de média e covariância por blocos (Chan et al.): numericamente estável, O(n²) de memória
+class AcumuladorMomentos:
+    def __init__(self, n):
+        self.total = 0
+        self.media = np.zeros(n)
+        self.m2 = np.zeros((n, n))
+
+    def adicionar(self, X):
+        n_bloco = len(X)
+        if n_bloco == 0:
+            return
+        media_bloco = X.mean(axis=0)
+        centrado = X - media_bloco
+        m2_bloco = centrado.T @ centrado
+        novo_total = self.total + n_bloco
+        delta = media_bloco - self.media
+        self.m2 += m2_bloco + np.outer(delta, delta) * (self.total * n_bloco / novo_total)
+        self.media += delta * (n_bloco / novo_total)
+        self.total = novo_total
+
+    def covariancia(self):
+        return self.m2 / (self.total - 1) if self.total > 1 else np.full_like(self.m2, np.nan)
+
+# Uma passada pelo painel. Mesmas definições do cálculo em memória: retornos simples, só os dias em que
+# todos os ativos têm retorno finito, CVaR 95% histórico e volume financeiro médio dos últimos 126 dias.
+# Os retornos diários válidos são gravados em disco e devolvidos como DataFrame sobre o memmap.
+def calcular_momentos(painel, bloco_dias=None):
+    bloco_dias = bloco_dias or config.MOMENTOS_BLOCO_DIAS
+    precos, volumes, datas, nomes = painel['precos'], painel['volumes'], painel['datas'], painel['nomes']
+    n_dias, n = precos.shape
+    if n_dias < 2:
+        return None
+
+    acumulador = AcumuladorMomentos(n)
+    tamanho_cauda = max(1, int((n_dias - 1) * 0.05))   # cobre o corte do CVaR para qualquer número de dias válidos
+    cauda = np.empty((0, n))
+    retornos_disco = np.lib.format.open_memmap(caminho(painel['pasta'], 'retornos'), mode='w+', dtype=float,
+                                               shape=(n_dias - 1, n))
+    linhas_validas = []
+
+    for inicio in range(1, n_dias, bloco_dias):
+        fim = min(inicio + bloco_dias, n_dias)
+        P = np.asarray(precos[inicio - 1:fim])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            R = P[1:] / P[:-1] - 1.0
+        completos = np.isfinite(R).all(axis=1)
+        R = R[completos]
+
+        retornos_disco[len(linhas_validas):len(linhas_validas) + len(R)] = R
+        linhas_validas.extend(np.flatnonzero(completos) + inicio)
+        acumulador.adicionar(R)
+
+        cauda = np.concatenate([cauda, R])
+        if len(cauda) > tamanho_cauda:
+            cauda = np.partition(cauda, tamanho_cauda - 1, axis=0)[:tamanho_cauda]
+    retornos_disco.flush()
+
+    total = acumulador.total
+    if total == 0:
+        return None
+    corte = max(1, int(total * 0.05))
+    cvar = np.abs(np.sort(cauda, axis=0)[:corte].mean(axis=0))
+
+    preco_medio = np.asarray(precos[-JANELA_VOLUME:]).mean(axis=0)
+    vol_qtd = np.asarray(volumes[-JANELA_VOLUME:]).mean(axis=0)
+
+    retornos = pd.DataFrame(retornos_disco[:total], index=datas[np.array(linhas_validas, dtype=int)], columns=nomes, copy=False)
+    return {
+        'retornos_medios': pd.Series(acumulador.media * DIAS_UTEIS_ANO, index=nomes),
+        'matriz_cov': pd.DataFrame(acumulador.covariancia() * DIAS_UTEIS_ANO, index=nomes, columns=nomes),
+        'vetor_cvar': pd.Series(cvar, index=nomes),
+        'volume_financeiro': pd.Series(np.nan_to_num(vol_qtd * preco_medio), index=nomes),
+        'ultimos_precos': pd.Series(np.nan_to_num(np.asarray(precos[-1])), index=nomes),
+        'retornos_diarios': retornos
+    }
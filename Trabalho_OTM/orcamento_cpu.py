@@ -0,0 +1,115 @@
+import contextlib
+import itertools
+import os
+import threading
+
+import config
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
+# Orçamento de núcleos do processo: cada solve (AG, Gurobi) reserva núcleos antes de rodar e o
+# Gurobi recebe 'Threads' igual ao que foi reservado. Sem pedido explícito, um solve sozinho leva
+# todos os núcleos livres e, com outros esperando, divide os livres com eles. Quando o orçamento
+# acaba, os pedidos seguintes esperam na fila (ordem de chegada) em vez de disputar os mesmos núcleos.
+# As threads do BLAS (NumPy) são limitadas por processo: variáveis de ambiente para os processos
+# filhos e threadpoolctl, se instalado, para o processo atual.
+
+VARIAVEIS_BLAS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                  'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS')
+
+_ATUAL = threading.local()
+
+
+class OrcamentoNucleos:
+    def __init__(self, total):
+        self.total = max(1, int(total))
+        self.livres = self.total
+        self.condicao = threading.Condition()
+        self.senhas = itertools.count()
+        self.proxima = 0   # senha da vez: só ela pode reservar (fila justa)
+        self.na_fila = 0
+
+    # Bloqueia até haver pelo menos um núcleo livre e a vez chegar; reserva min(pedido, livres).
+    # pedido 0/None = automático: todos os livres, ou a parte igual deles se houver fila
+    def reservar(self, pedido=None):
+        with self.condicao:
+            senha = next(self.senhas)
+            self.na_fila += 1
+            self.condicao.wait_for(lambda: self.proxima == senha and self.livres > 0)
+            if pedido:
+                concedidos = min(max(1, int(pedido)), self.livres)
+            else:
+                concedidos = max(1, self.livres // self.na_fila)
+            self.livres -= concedidos
+            self.na_fila -= 1
+            self.proxima += 1
+            self.condicao.notify_all()
+        return concedidos
+
+    def liberar(self, nucleos):
+        with self.condicao:
+            self.livres = min(self.total, self.livres + nucleos)
+            self.condicao.notify_all()
+
+    def estado(self):
+        with self.condicao:
+            return {'nucleos': self.total, 'em_uso': self.total - self.livres, 'na_fila': self.na_fila}
+
+
+def nucleos_configurados():
+    return config.CPU_NUCLEOS or os.cpu_count() or 1
+
+ORCAMENTO = OrcamentoNucleos(nucleos_configurados())
+
+# Redefine o orçamento do processo (ex.: worker do ASGI com sua fatia dos núcleos)
+def definir_nucleos(total):
+    global ORCAMENTO
+    ORCAMENTO = OrcamentoNucleos(total)
+
+# Reserva núcleos para o trecho; reservas aninhadas na mesma thread reaproveitam a de fora
+@contextlib.contextmanager
+def reservar(pedido=None):
+    atual = getattr(_ATUAL, 'nucleos', None)
+    if atual is not None:
+        yield atual
+        return
+    orcamento = ORCAMENTO
+    concedidos = orcamento.reservar(pedido or config.CPU_THREADS_GUROBI or None)
+    _ATUAL.nucleos = concedidos
+    try:
+        yield concedidos
+    finally:
+        _ATUAL.nucleos = None
+        orcamento.liberar(concedidos)
+
+# Núcleos reservados pela thread atual (None fora de uma reserva)
+def nucleos_atuais():
+    return getattr(_ATUAL, 'nucleos', None)
+
+# Threads de BLAS do processo. As variáveis de ambiente só valem para processos criados depois
+# (ou antes do import do NumPy); no processo atual o limite depende do threadpoolctl.
+# Sem 'threads' nem CPU_THREADS_BLAS, o BLAS fica com o padrão dele
+def limitar_blas(threads=None):
+    threads = threads or config.CPU_THREADS_BLAS
+    if not threads:
+        return None
+    threads = max(1, int(threads))
+    for variavel in VARIAVEIS_BLAS:
+        os.environ[variavel] = str(threads)
+    if threadpool_limits is not None:
+        threadpool_limits(limits=threads)
+    return threads
+
+# Parte de cada tarefa quando 'paralelo' tarefas dividem o orçamento do processo
+def nucleos_por_tarefa(paralelo):
+    return max(1, ORCAMENTO.total // max(1, paralelo))
+
+# Divide o orçamento entre processos: núcleos de cada processo
+def nucleos_por_processo(processos):
+    return max(1, nucleos_configurados() // max(1, processos))
+
+def estado():
+    return ORCAMENTO.estado()
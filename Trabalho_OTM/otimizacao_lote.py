@@ -0,0 +1,286 @@
+# Execução em lote, sem o servidor:
+#   python Trabalho_OTM/otimizacao_lote.py cenarios.csv resultados.jsonl [--processos 4] [--tempo-cenario 60]
+# Cada linha do arquivo de cenários usa as mesmas chaves do /otimizar
+# (valor, lambda, risco, teto_ativo, teto_setor, proibidos, max_ativos, max_ativos_setor, tempo_limite, mip_gap, threads).
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+import config
+import snapshot_dados
+import triagem_ativos
+import orcamento_cpu
+from importacao_tardia import importar_tardio
+
+preparar_dados = importar_tardio('preparar_dados')
+modelo_AG = importar_tardio('modelo_AG')
+modelo_GUROBI = importar_tardio('modelo_GUROBI')
+
+# Inputs de mercado de cada processo (enviados uma vez, no initializer)
+INPUTS_WORKER = None
+
+MODELOS = ['ga', 'gurobi_warm', 'gurobi_cold']
+COLUNAS_METRICAS = ['retorno_aa', 'risco_aa', 'pvp', 'cvar', 'score', 'qtd_ativos']
+
+
+# Lê os cenários de um CSV (proibidos separados por ';') ou JSONL
+def ler_cenarios(caminho):
+    if caminho.endswith('.jsonl'):
+        with open(caminho, encoding='utf-8') as f:
+            cenarios = [json.loads(linha) for linha in f if linha.strip()]
+    else:
+        df = pd.read_csv(caminho, dtype=str, keep_default_na=False)
+        cenarios = df.to_dict(orient='records')
+        for cenario in cenarios:
+            proibidos = cenario.get('proibidos', '')
+            cenario['proibidos'] = [s.strip() for s in proibidos.split(';') if s.strip()] if proibidos else []
+
+    for i, cenario in enumerate(cenarios):
+        if cenario.get('id') in (None, ''):
+            cenario['id'] = i
+    return cenarios
+
+# Converte um cenário para os parâmetros dos modelos (mesmas unidades e padrões do /otimizar)
+def ler_parametros_cenario(dados):
+    params_gurobi = {}
+    if dados.get('tempo_limite') not in (None, ''): params_gurobi['tempo_limite'] = float(dados['tempo_limite'])
+    if dados.get('mip_gap') not in (None, ''): params_gurobi['mip_gap'] = float(dados['mip_gap']) / 100.0
+    if dados.get('threads') not in (None, ''): params_gurobi['threads'] = int(dados['threads'])
+
+    return {
+        'valor': float(dados.get('valor') or 0),
+        'lambda': float(dados.get('lambda') or 50.0),
+        'risco': float(dados.get('risco') or 15) / 100.0,
+        'teto_ativo': float(dados.get('teto_ativo') or 30.0) / 100.0,
+        'teto_setor': float(dados.get('teto_setor') or 100.0) / 100.0,
+        'proibidos': dados.get('proibidos') or [],
+        'max_ativos': int(dados.get('max_ativos') or 15),
+        'max_ativos_setor': int(dados.get('max_ativos_setor') or 4),
+        'gurobi': params_gurobi
+    }
+
+# Usa o snapshot em disco; sem snapshot, baixa os dados
+def carregar_inputs():
+    inputs, _ = snapshot_dados.carregar_snapshot()
+    if inputs is None:
+        inputs = preparar_dados.calcular_inputs_otimizacao(0.0)
+    return inputs
+
+def inicializar_worker(inputs, nucleos):
+    global INPUTS_WORKER
+    INPUTS_WORKER = inputs
+    orcamento_cpu.definir_nucleos(nucleos)
+
+def resumir_carteira(nomes_ativos, pesos, retorno, risco, pvp, cvar, score, lotes=None):
+    pesos = np.nan_to_num(np.asarray(pesos, dtype=float))
+    investidos = np.flatnonzero(pesos > 1e-4)
+    resumo = {
+        'retorno_aa': float(retorno * 100),
+        'risco_aa': float(risco * 100),
+        'pvp': float(pvp),
+        'cvar': float(cvar * 100),
+        'score': float(score),
+        'qtd_ativos': int(len(investidos)),
+        'pesos': {nomes_ativos[i]: float(pesos[i]) for i in investidos}
+    }
+    if lotes is not None:
+        resumo['lotes'] = {nomes_ativos[i]: int(lotes[i]) for i in investidos}
+    return resumo
+
+# Roda AG, Gurobi warm e Gurobi cold para um cenário dentro do orçamento de tempo
+def resolver_cenario(cenario, tempo_cenario=None):
+    inicio = time.time()
+    resultado = {'id': cenario['id'], 'cenario': cenario}
+
+    def tempo_restante():
+        return None if tempo_cenario is None else tempo_cenario - (time.time() - inicio)
+
+    def limitar(params, fracao):
+        # Cada Gurobi recebe uma fração do tempo que sobrou (sem passar do tempo_limite do cenário)
+        restante = tempo_restante()
+        if restante is None:
+            return params
+        limite = restante * fracao
+        return dict(params, tempo_limite=min(params.get('tempo_limite', limite), limite))
+
+    try:
+        p = ler_parametros_cenario(cenario)
+        inputs = dict(INPUTS_WORKER)
+        inputs['valor_total_investido'] = p['valor']
+        nomes_ativos = list(inputs['nomes_dos_ativos'])
+
+        triagem = None
+        if cenario.get('triagem', config.TRIAGEM_ATIVA):
+            triagem = triagem_ativos.triar_universo(inputs, p['proibidos'], p['teto_ativo'],
+                                                   remover_dominados=cenario.get('remover_dominados'), verbose=False)
+            if len(triagem['indices']) == 0:
+                triagem = None
+        inputs_modelo = triagem['inputs'] if triagem else inputs
+        expandir = (lambda r: triagem_ativos.expandir_resultado(r, triagem)) if triagem else (lambda r: r)
+
+        # 1. AG (no máximo um terço do orçamento)
+        res_ga = modelo_AG.rodar_otimização(inputs_modelo, p['risco'], p['lambda'], p['proibidos'],
+                                            teto_maximo_ativo=p['teto_ativo'], teto_maximo_setor=p['teto_setor'],
+                                            max_ativos=p['max_ativos'], verbose=False,
+                                            tempo_limite=None if tempo_cenario is None else tempo_cenario / 3)
+        pesos_ga = res_ga['pesos_finais'] if res_ga else None
+        res_ga = expandir(res_ga)
+        if res_ga:
+            m = res_ga['metricas']
+            resultado['ga'] = resumir_carteira(nomes_ativos, res_ga['pesos_finais'], res_ga['retorno_final'],
+                                               res_ga['risco_final'], m['pvp_final'], m['cvar_final'], m['score'])
+
+        # 2. Gurobi warm e cold, dividindo o tempo restante
+        for chave, warm, fracao in [('gurobi_warm', pesos_ga, 0.5), ('gurobi_cold', None, 1.0)]:
+            restante = tempo_restante()
+            if restante is not None and restante < 1.0:
+                resultado['status'] = 'tempo_esgotado'
+                break
+            res_gu = modelo_GUROBI.resolver_com_gurobi_setores(
+                inputs_modelo, p['lambda'], p['risco'], warm_start_pesos=warm, setores_proibidos=p['proibidos'],
+                teto_maximo_ativo=p['teto_ativo'], teto_maximo_setor=p['teto_setor'],
+                max_ativos_carteira=p['max_ativos'], max_ativos_setor=p['max_ativos_setor'],
+                verbose=False, **limitar(p['gurobi'], fracao)
+            )
+            res_gu = expandir(res_gu)
+            if res_gu:
+                resultado[chave] = resumir_carteira(nomes_ativos, res_gu['pesos'], res_gu['retorno'], res_gu['risco'],
+                                                    res_gu['pvp_final'], res_gu['cvar_final'], res_gu['obj'],
+                                                    res_gu['lotes'])
+                resultado[chave]['status_solver'] = res_gu['status']
+
+        resultado.setdefault('status', 'ok' if any(m in resultado for m in MODELOS) else 'inviavel')
+    except Exception as e:
+        resultado['status'] = 'erro'
+        resultado['erro'] = str(e)
+
+    resultado['tempo'] = time.time() - inicio
+    return resultado
+
+# Escreve os resultados conforme chegam: JSONL (uma linha por cenário) ou Parquet (em blocos)
+class SaidaResultados:
+    def __init__(self, caminho, tamanho_bloco=50):
+        self.caminho = caminho
+        self.parquet = caminho.endswith('.parquet')
+        self.tamanho_bloco = tamanho_bloco
+        self.bloco = []
+        self.escritor = None
+        if self.parquet:
+            # Dependência opcional: falha antes de rodar os cenários se não estiver instalada
+            try:
+                self.pa = importlib.import_module('pyarrow')
+                self.pq = importlib.import_module('pyarrow.parquet')
+            except ImportError:
+                raise RuntimeError("Saída Parquet requer o pacote pyarrow (pip install pyarrow).")
+        else:
+            self.arquivo = open(caminho, 'w', encoding='utf-8')
+
+    # Linha plana para o Parquet (pesos e lotes como JSON)
+    def achatar(self, resultado):
+        linha = {
+            'id': str(resultado['id']),
+            'status': resultado['status'],
+            'erro': resultado.get('erro'),
+            'tempo': resultado['tempo'],
+            'cenario': json.dumps(resultado['cenario'], ensure_ascii=False)
+        }
+        for modelo in MODELOS:
+            carteira = resultado.get(modelo) or {}
+            for coluna in COLUNAS_METRICAS:
+                valor = carteira.get(coluna)
+                linha[f'{modelo}_{coluna}'] = None if valor is None else float(valor)
+            linha[f'{modelo}_pesos'] = json.dumps(carteira['pesos']) if carteira else None
+        return linha
+
+    def esquema(self):
+        pa = self.pa
+        campos = [('id', pa.string()), ('status', pa.string()), ('erro', pa.string()),
+                  ('tempo', pa.float64()), ('cenario', pa.string())]
+        for modelo in MODELOS:
+            campos += [(f'{modelo}_{coluna}', pa.float64()) for coluna in COLUNAS_METRICAS]
+            campos.append((f'{modelo}_pesos', pa.string()))
+        return pa.schema(campos)
+
+    def gravar_bloco(self):
+        if not self.bloco:
+            return
+        if self.escritor is None:
+            self.escritor = self.pq.ParquetWriter(self.caminho, self.esquema())
+        self.escritor.write_table(self.pa.Table.from_pylist(self.bloco, schema=self.esquema()))
+        self.bloco = []
+
+    def escrever(self, resultado):
+        if self.parquet:
+            self.bloco.append(self.achatar(resultado))
+            if len(self.bloco) >= self.tamanho_bloco:
+                self.gravar_bloco()
+        else:
+            self.arquivo.write(json.dumps(resultado, ensure_ascii=False) + '\n')
+            self.arquivo.flush()
+
+    def fechar(self):
+        if self.parquet:
+            self.gravar_bloco()
+            if self.escritor is not None:
+                self.escritor.close()
+        else:
+            self.arquivo.close()
+
+# Distribui os cenários em um pool de processos e grava cada resultado assim que termina
+def executar_lote(caminho_cenarios, caminho_saida, processos=None, tempo_cenario=None, verbose=True):
+    cenarios = ler_cenarios(caminho_cenarios)
+    processos = processos or config.LOTE_PROCESSOS or os.cpu_count() or 1
+    tempo_cenario = config.LOTE_TEMPO_CENARIO if tempo_cenario is None else tempo_cenario
+
+    # Sem threads definidas no cenário, o Gurobi divide os núcleos entre os processos
+    threads_por_processo = orcamento_cpu.nucleos_por_processo(processos)
+    for cenario in cenarios:
+        if cenario.get('threads') in (None, ''):
+            cenario['threads'] = threads_por_processo
+
+    orcamento_cpu.limitar_blas(threads_por_processo)   # herdado pelos processos filhos
+    saida = SaidaResultados(caminho_saida)
+    inputs = carregar_inputs()
+    if inputs is None:
+        saida.fechar()
+        raise RuntimeError("Dados de mercado não disponíveis.")
+
+    if verbose:
+        print(f"[LOTE] {len(cenarios)} cenários em {processos} processos ({inputs['n_ativos']} ativos)")
+
+    contagem = {}
+    inicio = time.time()
+    try:
+        with ProcessPoolExecutor(max_workers=processos, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=inicializar_worker, initargs=(inputs, threads_por_processo)) as executor:
+            futuros = [executor.submit(resolver_cenario, cenario, tempo_cenario) for cenario in cenarios]
+            for n, futuro in enumerate(as_completed(futuros), 1):
+                resultado = futuro.result()
+                saida.escrever(resultado)
+                contagem[resultado['status']] = contagem.get(resultado['status'], 0) + 1
+                if verbose:
+                    print(f"[LOTE] {n}/{len(cenarios)} cenário {resultado['id']}: "
+                          f"{resultado['status']} ({resultado['tempo']:.1f}s)")
+    finally:
+        saida.fechar()
+
+    if verbose:
+        print(f"[LOTE] Concluído em {time.time() - inicio:.1f}s: {contagem} -> {caminho_saida}")
+    return contagem
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Otimização em lote de cenários de carteira")
+    parser.add_argument('cenarios', help="arquivo de cenários (.csv ou .jsonl)")
+    parser.add_argument('saida', help="arquivo de resultados (.jsonl ou .parquet)")
+    parser.add_argument('--processos', type=int, default=None, help="processos em paralelo (padrão: núcleos)")
+    parser.add_argument('--tempo-cenario', type=float, default=None, help="orçamento de tempo por cenário (s)")
+    args = parser.parse_args()
+    executar_lote(args.cenarios, args.saida, args.processos, args.tempo_cenario)
@@ -0,0 +1,215 @@
+import collections
+import datetime
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+
+import config
+
+# Perfilamento sob demanda de uma requisição: um amostrador estatístico lê a pilha da thread da
+# requisição a cada poucos milissegundos (arquivo .folded, aberto por flamegraph.pl, speedscope e
+# similares) e o tracemalloc mede o pico de memória de cada etapa marcada com marcar_etapa().
+# Os arquivos ficam em disco, então funcionam também nos processos do modo ASGI.
+
+_ATUAL = threading.local()
+_HISTORICO_LOCK = threading.Lock()
+_HISTORICO = collections.deque()
+
+
+# Cabeçalho X-Perfil / ?perfil= pedindo perfil (sem consumir o limite de taxa)
+def pedido_de_perfil(pedido):
+    return config.PERFIL_ATIVO and str(pedido or '').lower() in ('1', 'true', 'sim')
+
+# Limite de taxa: no máximo PERFIL_MAX_POR_HORA perfis na última hora
+def deve_perfilar(pedido):
+    if not pedido_de_perfil(pedido):
+        return False
+    agora = time.monotonic()
+    with _HISTORICO_LOCK:
+        while _HISTORICO and agora - _HISTORICO[0] > 3600:
+            _HISTORICO.popleft()
+        if len(_HISTORICO) >= config.PERFIL_MAX_POR_HORA:
+            print("⚠️ Perfil pedido, mas o limite por hora foi atingido")
+            return False
+        _HISTORICO.append(agora)
+    return True
+
+# Amostrador de pilhas: o peso de cada amostra é o tempo decorrido desde a anterior (em ms), o que
+# mantém a proporção correta mesmo quando código nativo segura o GIL e atrasa a amostragem.
+# Além da thread da requisição, amostra as threads de pool registradas com propagar_perfil()
+class AmostradorPilhas(threading.Thread):
+    def __init__(self, perfil, id_thread):
+        super().__init__(daemon=True)
+        self.perfil = perfil
+        self.id_thread = id_thread
+        self.pilhas = collections.Counter()
+        self.parar = threading.Event()
+
+    def run(self):
+        anterior = time.perf_counter()
+        while not self.parar.wait(config.PERFIL_INTERVALO_MS / 1000):
+            agora = time.perf_counter()
+            frames = sys._current_frames()
+            for id_thread, rotulo in [(self.id_thread, None)] + self.perfil.threads_auxiliares():
+                frame = frames.get(id_thread)
+                if frame is None:
+                    continue
+                pilha = []
+                while frame is not None:
+                    codigo = frame.f_code
+                    pilha.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})")
+                    frame = frame.f_back
+                if rotulo:
+                    pilha.append(f"thread:{rotulo}")
+                pilha.append(f"etapa:{self.perfil.etapa_atual}")
+                self.pilhas[';'.join(reversed(pilha))] += (agora - anterior) * 1000
+            anterior = agora
+
+class Perfil:
+    def __init__(self, rota):
+        self.id = f"{datetime.datetime.now():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:6]}"
+        self.rota = rota
+        self.etapas = []
+        self.etapa_atual = 'inicio'
+        self.inicio_etapa = time.perf_counter()
+        self.threads = {}
+        self.threads_lock = threading.Lock()
+
+    # Threads de pool trabalhando para a requisição: [(id, rótulo)]
+    def threads_auxiliares(self):
+        with self.threads_lock:
+            return list(self.threads.items())
+
+    # Fecha a etapa corrente (tempo e pico de memória) e abre a próxima
+    def iniciar_etapa(self, nome):
+        agora = time.perf_counter()
+        etapa = {'nome': self.etapa_atual, 'segundos': round(agora - self.inicio_etapa, 4)}
+        if tracemalloc.is_tracing():
+            atual, pico = tracemalloc.get_traced_memory()
+            etapa['pico_memoria_mb'] = round(pico / 1e6, 2)
+            etapa['memoria_final_mb'] = round(atual / 1e6, 2)
+            tracemalloc.reset_peak()
+        self.etapas.append(etapa)
+        self.etapa_atual = nome
+        self.inicio_etapa = agora
+
+# Marca o início de uma etapa da requisição perfilada na thread atual (sem perfil ativo, não faz nada)
+def marcar_etapa(nome):
+    perfil = getattr(_ATUAL, 'perfil', None)
+    if perfil is not None:
+        perfil.iniciar_etapa(nome)
+
+# Envolve uma função que vai rodar em threads de um pool para que o perfil da requisição atual
+# amostre também essas threads (no flamegraph, sob 'thread:<rótulo>'). Sem perfil, devolve a função
+def propagar_perfil(funcao, rotulo='pool'):
+    perfil = getattr(_ATUAL, 'perfil', None)
+    if perfil is None:
+        return funcao
+
+    def executar_na_thread(*argumentos, **nomeados):
+        id_thread = threading.get_ident()
+        with perfil.threads_lock:
+            perfil.threads[id_thread] = rotulo
+        try:
+            return funcao(*argumentos, **nomeados)
+        finally:
+            with perfil.threads_lock:
+                perfil.threads.pop(id_thread, None)
+    return executar_na_thread
+
+# Executa a função de uma rota, perfilando se pedido. Resposta no formato (dict, status);
+# com perfil, a resposta ganha {'perfil': {'id', 'url'}}
+def executar(funcao, rota, ativo, *argumentos):
+    if not ativo:
+        return funcao(*argumentos)
+
+    perfil = Perfil(rota)
+    amostrador = AmostradorPilhas(perfil, threading.get_ident())
+    rastreando_memoria = config.PERFIL_MEMORIA and not tracemalloc.is_tracing()
+    if rastreando_memoria:
+        tracemalloc.start()
+    _ATUAL.perfil = perfil
+    inicio = time.perf_counter()
+    amostrador.start()
+    try:
+        resposta, status = funcao(*argumentos)
+    finally:
+        amostrador.parar.set()
+        amostrador.join()
+        perfil.iniciar_etapa(None)
+        _ATUAL.perfil = None
+        if rastreando_memoria:
+            tracemalloc.stop()
+        salvar_perfil(perfil, amostrador.pilhas, time.perf_counter() - inicio)
+
+    if isinstance(resposta, dict):
+        resposta['perfil'] = {'id': perfil.id, 'url': f"/admin/perfis/{perfil.id}"}
+    return resposta, status
+
+# Funções com mais tempo próprio (topo das pilhas)
+def funcoes_mais_lentas(pilhas, n=15):
+    proprio = collections.Counter()
+    for pilha, ms in pilhas.items():
+        proprio[pilha.rsplit(';', 1)[-1]] += ms
+    return [{'funcao': nome, 'ms': round(ms, 1)} for nome, ms in proprio.most_common(n)]
+
+def salvar_perfil(perfil, pilhas, duracao):
+    os.makedirs(config.PERFIL_PASTA, exist_ok=True)
+    with open(os.path.join(config.PERFIL_PASTA, f"{perfil.id}.folded"), 'w', encoding='utf-8') as f:
+        for pilha, ms in pilhas.items():
+            if round(ms) > 0:
+                f.write(f"{pilha} {round(ms)}\n")
+
+    resumo = {
+        'id': perfil.id,
+        'rota': perfil.rota,
+        'criado_em': datetime.datetime.now().isoformat(),
+        'duracao_s': round(duracao, 3),
+        'etapas': [etapa for etapa in perfil.etapas if not (etapa['nome'] == 'inicio' and etapa['segundos'] < 0.001)],
+        'funcoes_mais_lentas': funcoes_mais_lentas(pilhas),
+        'flamegraph': f"/admin/perfis/{perfil.id}.folded"
+    }
+    with open(os.path.join(config.PERFIL_PASTA, f"{perfil.id}.json"), 'w', encoding='utf-8') as f:
+        json.dump(resumo, f, ensure_ascii=False, indent=2)
+    limpar_perfis_antigos()
+
+def limpar_perfis_antigos():
+    ids = listar_ids()
+    for id_perfil in ids[config.PERFIL_MAX_ARQUIVOS:]:
+        for extensao in ('json', 'folded'):
+            try:
+                os.remove(os.path.join(config.PERFIL_PASTA, f"{id_perfil}.{extensao}"))
+            except OSError:
+                pass
+
+# Ids dos perfis salvos, do mais recente para o mais antigo
+def listar_ids():
+    if not os.path.isdir(config.PERFIL_PASTA):
+        return []
+    return sorted((nome[:-5] for nome in os.listdir(config.PERFIL_PASTA) if nome.endswith('.json')), reverse=True)
+
+def ler_resumo(id_perfil):
+    try:
+        with open(os.path.join(config.PERFIL_PASTA, f"{os.path.basename(id_perfil)}.json"), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def ler_flamegraph(id_perfil):
+    try:
+        with open(os.path.join(config.PERFIL_PASTA, f"{os.path.basename(id_perfil)}.folded"), encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return None
+
+# Acesso administrativo: token no cabeçalho X-Token-Admin, ou apenas localhost se nenhum token foi definido
+def acesso_admin_permitido(token, endereco):
+    esperado = os.environ.get(config.PERFIL_VARIAVEL_TOKEN)
+    if esperado:
+        return hmac.compare_digest(str(token or ''), esperado)
+    return endereco in ('127.0.0.1', '::1', 'localhost')
@@ -1,42 +1,75 @@
-import matplotlib
-matplotlib.use('Agg')
 import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.patheffects as path_effects
 import numpy as np
-import os
+import io
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
-# Função para plotar gráfico de pizza dos pesos da carteira
-def plot_pizza_por_ativos(serie_pesos, risco, retorno, valor_investido, nome_arquivo, titulo_personalizado):
-    # 1. Verifica sobra de caixa
+import config
+from importacao_tardia import importar_tardio
+
+# matplotlib só carrega na primeira renderização (os workers apenas montam os dados dos gráficos)
+matplotlib = importar_tardio('matplotlib', ao_carregar=lambda m: m.use('Agg'))
+path_effects = importar_tardio('matplotlib.patheffects')
+artist = importar_tardio('matplotlib.artist')
+figure = importar_tardio('matplotlib.figure')
+backend_agg = importar_tardio('matplotlib.backends.backend_agg')
+
+CAIXA_LABEL = "Caixa / Não Investido"
+
+# Cache LRU dos gráficos: chave (hash dos dados) -> {'dados': ..., 'png': bytes ou None}
+CACHE_GRAFICOS = OrderedDict()
+CACHE_GRAFICOS_LOCK = threading.Lock()
+EXECUTOR_GRAFICOS = ThreadPoolExecutor(max_workers=3)
+
+# Prepara rótulos e tamanhos da pizza (inclui a sobra de caixa)
+def montar_dados_grafico(serie_pesos, risco, retorno, titulo_personalizado):
+    serie_pesos = serie_pesos.copy()
     soma_pesos = serie_pesos.sum()
     if soma_pesos < 0.999:
-        sobra = 1.0 - soma_pesos
-        serie_pesos["Caixa / Não Investido"] = sobra
+        serie_pesos[CAIXA_LABEL] = 1.0 - soma_pesos
 
     # Filtra pesos irrelevantes
     pesos_relevantes = serie_pesos[serie_pesos > 0.0001]
     final_series = pesos_relevantes.sort_values(ascending=False)
 
-    if final_series.empty:
-        return
+    return {
+        'labels': [str(l) for l in final_series.index],
+        'pesos': [round(float(v), 6) for v in final_series.values],
+        'risco': round(float(risco), 6),
+        'retorno': round(float(retorno), 6),
+        'titulo': titulo_personalizado
+    }
+
+# Chave determinística do gráfico (mesmos dados -> mesma chave, em qualquer processo)
+def chave_grafico(dados_grafico):
+    conteudo = json.dumps(dados_grafico, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(conteudo.encode('utf-8')).hexdigest()[:20]
 
-    labels = list(final_series.index)
-    sizes = list(final_series.values)
+# Renderiza o gráfico de pizza em memória e retorna os bytes do PNG
+def renderizar_pizza_png(dados_grafico):
+    labels = dados_grafico['labels']
+    sizes = dados_grafico['pesos']
+    if not labels:
+        return None
 
-    fig, ax = plt.subplots(figsize=(10, 8))
+    # Figure direta (sem pyplot) para poder renderizar em várias threads
+    fig = figure.Figure(figsize=(10, 8))
+    backend_agg.FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
     
     # Cores
-    cmap = plt.get_cmap("nipy_spectral")
+    cmap = matplotlib.colormaps["nipy_spectral"]
     colors = []
-    num_ativos = len(labels)
     
     # Se tiver caixa, ele entra na conta das cores mas sempre cinza
     idx_cor = 0
-    total_ativos_reais = len([l for l in labels if l != "Caixa / Não Investido"])
+    total_ativos_reais = len([l for l in labels if l != CAIXA_LABEL])
     
     for label in labels:
-        if label == "Caixa / Não Investido":
+        if label == CAIXA_LABEL:
             colors.append("#D3D3D3") # Cinza claro
         else:
             # Distribui as cores espectrais apenas entre os ativos reais
@@ -58,13 +91,13 @@ def plot_pizza_por_ativos(serie_pesos, risco, retorno, valor_investido, nome_arq
     )
 
     # Estilo do texto
-    plt.setp(autotexts, size=9, weight="bold", color="white", 
-             path_effects=[path_effects.withStroke(linewidth=2, foreground='black')])
+    artist.setp(autotexts, size=9, weight="bold", color="white", 
+         path_effects=[path_effects.withStroke(linewidth=2, foreground='black')])
     
     ax.axis('equal')
 
     num_legend = min(20, len(labels))
-    plt.legend(
+    ax.legend(
         wedges[:num_legend], labels[:num_legend],
         title=f"Top {num_legend} Ativos",
         loc="center left",
@@ -72,59 +105,92 @@ def plot_pizza_por_ativos(serie_pesos, risco, retorno, valor_investido, nome_arq
         fontsize=9
     )
     
-    plt.title(
-        f"{titulo_personalizado}\n"
-        f"Volatilidade: {risco:.2%} | Retorno: {retorno:.2%}",
+    ax.set_title(
+        f"{dados_grafico['titulo']}\n"
+        f"Volatilidade: {dados_grafico['risco']:.2%} | Retorno: {dados_grafico['retorno']:.2%}",
         fontsize=14, pad=20
     )
     
-    plt.tight_layout()
-    plt.savefig(nome_arquivo, dpi=150)
-    plt.close(fig)
+    fig.tight_layout()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=config.GRAFICO_DPI)
+    return buffer.getvalue()
 
-# Função para gerar visualizações completas
-def rodar_visualizacao_completa(inputs, res_ga, res_gurobi_warm, res_gurobi_cold, 
-                                path_ga, path_gu_warm, path_gu_cold):
-    
-    valor_total = inputs['valor_total_investido']
+# Registra os dados de um gráfico no cache (sem renderizar) e retorna a chave
+def registrar_grafico(dados_grafico):
+    chave = chave_grafico(dados_grafico)
+    with CACHE_GRAFICOS_LOCK:
+        if chave in CACHE_GRAFICOS:
+            CACHE_GRAFICOS.move_to_end(chave)
+        else:
+            CACHE_GRAFICOS[chave] = {'dados': dados_grafico, 'png': None}
+            while len(CACHE_GRAFICOS) > config.GRAFICO_CACHE_MAX:
+                CACHE_GRAFICOS.popitem(last=False)
+    return chave
+
+# Renderiza uma entrada do cache (chamado uma única vez por gráfico)
+def renderizar_entrada(entrada):
+    if entrada['png'] is None:
+        entrada['png'] = renderizar_pizza_png(entrada['dados'])
+    return entrada['png']
+
+# Retorna o PNG do gráfico, aguardando a renderização em andamento ou renderizando agora
+def obter_png_grafico(chave):
+    with CACHE_GRAFICOS_LOCK:
+        entrada = CACHE_GRAFICOS.get(chave)
+        if entrada is None:
+            return None
+        CACHE_GRAFICOS.move_to_end(chave)
+        if entrada['png'] is not None:
+            return entrada['png']
+        if entrada.get('futuro') is None:
+            entrada['futuro'] = EXECUTOR_GRAFICOS.submit(renderizar_entrada, entrada)
+        futuro = entrada['futuro']
+    return futuro.result()
+
+# Renderiza os gráficos em paralelo, fora do caminho crítico da requisição
+def pre_renderizar_graficos(chaves):
+    with CACHE_GRAFICOS_LOCK:
+        for chave in chaves:
+            entrada = CACHE_GRAFICOS.get(chave)
+            if entrada is not None and entrada['png'] is None and entrada.get('futuro') is None:
+                entrada['futuro'] = EXECUTOR_GRAFICOS.submit(renderizar_entrada, entrada)
+
+# Função para plotar gráfico de pizza dos pesos da carteira em arquivo
+def plot_pizza_por_ativos(serie_pesos, risco, retorno, valor_investido, nome_arquivo, titulo_personalizado):
+    png = renderizar_pizza_png(montar_dados_grafico(serie_pesos, risco, retorno, titulo_personalizado))
+    if png is None:
+        return
+    with open(nome_arquivo, 'wb') as f:
+        f.write(png)
+
+# Extrai a série de pesos de um resultado do AG
+def pesos_resultado_ga(res_ga):
+    row_ga = res_ga['dataframe_resultado'].iloc[0]
+    # Dropa colunas que não são pesos
+    cols_meta = ['Risco_Alvo', 'Risco_Encontrado_Anual', 'Retorno_Encontrado_Anual']
+    return row_ga.drop(cols_meta, errors='ignore')
+
+# Monta os dados dos gráficos de pizza do GA e do Gurobi (warm e cold)
+def montar_graficos_completos(inputs, res_ga, res_gurobi_warm, res_gurobi_cold, titulo_ga="Algoritmo Genético"):
     nomes_ativos = inputs['nomes_dos_ativos']
+    graficos = {'ga': None, 'gurobi_warm': None, 'gurobi_cold': None}
 
-    # Gera os gráficos de pizza para o GA
     if res_ga:
-        row_ga = res_ga['dataframe_resultado'].iloc[0]
-        # Dropa colunas que não são pesos
-        cols_meta = ['Risco_Alvo', 'Risco_Encontrado_Anual', 'Retorno_Encontrado_Anual']
-        pesos_ga = row_ga.drop(cols_meta, errors='ignore')
-        
-        plot_pizza_por_ativos(
-            serie_pesos=pesos_ga,
-            risco=res_ga['risco_final'],
-            retorno=res_ga['retorno_final'],
-            valor_investido=valor_total,
-            nome_arquivo=path_ga,
-            titulo_personalizado="Algoritmo Genético"
+        graficos['ga'] = montar_dados_grafico(
+            pesos_resultado_ga(res_ga), res_ga['risco_final'], res_ga['retorno_final'], titulo_ga
         )
 
-    # Gera os gráficos de pizza para o Gurobi Warm Start
     if res_gurobi_warm:
-        pesos_warm = pd.Series(res_gurobi_warm['pesos'], index=nomes_ativos)
-        plot_pizza_por_ativos(
-            serie_pesos=pesos_warm,
-            risco=res_gurobi_warm['risco'],
-            retorno=res_gurobi_warm['retorno'],
-            valor_investido=valor_total,
-            nome_arquivo=path_gu_warm,
-            titulo_personalizado="Gurobi (Warm Start)"
+        graficos['gurobi_warm'] = montar_dados_grafico(
+            pd.Series(res_gurobi_warm['pesos'], index=nomes_ativos),
+            res_gurobi_warm['risco'], res_gurobi_warm['retorno'], "Gurobi (Warm Start)"
         )
 
-    # Gera os gráficos de pizza para o Gurobi Cold Start
     if res_gurobi_cold:
-        pesos_cold = pd.Series(res_gurobi_cold['pesos'], index=nomes_ativos)
-        plot_pizza_por_ativos(
-            serie_pesos=pesos_cold,
-            risco=res_gurobi_cold['risco'],
-            retorno=res_gurobi_cold['retorno'],
-            valor_investido=valor_total,
-            nome_arquivo=path_gu_cold,
-            titulo_personalizado="Gurobi (Cold Start)"
-        )
\ No newline at end of file
+        graficos['gurobi_cold'] = montar_dados_grafico(
+            pd.Series(res_gurobi_cold['pesos'], index=nomes_ativos),
+            res_gurobi_cold['risco'], res_gurobi_cold['retorno'], "Gurobi (Cold Start)"
+        )
+
+    return graficos
@@ -0,0 +1,280 @@
+import datetime
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+from collections import Counter, OrderedDict
+
+import config
+import universos
+
+# Pré-aquecimento: cache de respostas prontas das rotas de otimização e um agendador que, depois do
+# fechamento do mercado, atualiza os dados e recalcula as respostas dos pedidos mais frequentes
+# (registro em PREAQUECIMENTO_REGISTRO) e do pedido padrão da página. Assim os primeiros usuários
+# do dia não pagam o download nem o solve. A resposta depende do valor investido: só os pedidos com
+# o valor do pedido padrão são registrados e pré-aquecidos.
+
+# Só pedidos do universo padrão e sem carteira atual (rebalanceamento é pessoal) entram no cache
+ROTAS_CACHEAVEIS = ('/otimizar', '/calcular-fronteira')
+
+_RESULTADOS = OrderedDict()
+_RESULTADOS_LOCK = threading.Lock()
+_GERACAO = 0   # muda a cada troca de dados: respostas calculadas com os dados antigos são descartadas
+
+_REGISTRO_LOCK = threading.Lock()
+_FILA_REGISTRO = queue.Queue(maxsize=config.PREAQUECIMENTO_FILA_REGISTRO)
+_ESCRITOR = None
+
+_AGENDADOR = None
+_PARAR = threading.Event()
+_ESTADO = {'proxima_execucao': None, 'ultima_execucao': None, 'ultimo_resumo': None}
+
+
+# --- Cache de respostas ---
+
+# Corpo canônico: números enviados como texto pela página ("100000") valem o mesmo que os numéricos
+def normalizar(valor):
+    if isinstance(valor, dict):
+        return {chave: normalizar(v) for chave, v in valor.items()}
+    if isinstance(valor, list):
+        return [normalizar(v) for v in valor]
+    if isinstance(valor, str):
+        try:
+            return float(valor)
+        except ValueError:
+            return valor
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return float(valor)
+    return valor
+
+def chave_pedido(rota, dados):
+    return json.dumps([rota, normalizar(dados or {})], sort_keys=True, ensure_ascii=False)
+
+def cacheavel(rota, dados):
+    dados = dados or {}
+    return rota in ROTAS_CACHEAVEIS and not dados.get('lotes_atuais') \
+        and dados.get('universo') in (None, '', config.UNIVERSO_PADRAO)
+
+def geracao_atual():
+    return _GERACAO
+
+def obter_resultado(rota, dados):
+    if not cacheavel(rota, dados):
+        return None
+    chave = chave_pedido(rota, dados)
+    with _RESULTADOS_LOCK:
+        if chave not in _RESULTADOS:
+            return None
+        _RESULTADOS.move_to_end(chave)
+        return _RESULTADOS[chave]
+
+# Guarda a resposta se os dados não mudaram desde 'geracao' (capturada antes do solve)
+def guardar_resultado(rota, dados, resposta, geracao):
+    if not cacheavel(rota, dados):
+        return
+    with _RESULTADOS_LOCK:
+        if geracao != _GERACAO:
+            return
+        chave = chave_pedido(rota, dados)
+        _RESULTADOS[chave] = resposta
+        _RESULTADOS.move_to_end(chave)
+        while len(_RESULTADOS) > config.RESULTADOS_CACHE_MAX:
+            _RESULTADOS.popitem(last=False)
+
+# Chamado sempre que os inputs em cache são trocados
+def invalidar_resultados():
+    global _GERACAO
+    with _RESULTADOS_LOCK:
+        _GERACAO += 1
+        _RESULTADOS.clear()
+
+
+# --- Registro de pedidos ---
+
+# Parâmetros de um pedido sem os campos pessoais (PREAQUECIMENTO_CAMPOS_OMITIDOS): é o que vai ao registro
+def impressao_pedido(dados):
+    return {chave: v for chave, v in normalizar(dados or {}).items() if chave not in config.PREAQUECIMENTO_CAMPOS_OMITIDOS}
+
+# Pedido com os campos omitidos iguais aos do pedido padrão: só esses são reproduzidos com a mesma chave
+# de cache (quem manda outro valor não encontraria a resposta pré-aquecida)
+def reproduzivel(dados):
+    dados = normalizar(dados or {})
+    padrao = normalizar(config.PREAQUECIMENTO_PEDIDO_PADRAO)
+    return all(dados.get(chave) == padrao.get(chave) for chave in config.PREAQUECIMENTO_CAMPOS_OMITIDOS)
+
+# Põe a impressão de um pedido cacheável na fila do registro; quem escreve é a thread do escritor,
+# então a requisição (ou o laço de eventos do ASGI) não espera pelo disco
+def registrar_pedido(rota, dados):
+    if not cacheavel(rota, dados) or not reproduzivel(dados):
+        return
+    iniciar_escritor()
+    try:
+        _FILA_REGISTRO.put_nowait(json.dumps({'rota': rota, 'parametros': impressao_pedido(dados)}, ensure_ascii=False))
+    except queue.Full:
+        pass
+
+def iniciar_escritor():
+    global _ESCRITOR
+    if _ESCRITOR is not None:
+        return
+    with _REGISTRO_LOCK:
+        if _ESCRITOR is None:
+            _ESCRITOR = threading.Thread(target=laco_escritor, daemon=True)
+            _ESCRITOR.start()
+
+def laco_escritor():
+    while True:
+        linhas = [_FILA_REGISTRO.get()]
+        while not _FILA_REGISTRO.empty():
+            linhas.append(_FILA_REGISTRO.get_nowait())
+        escrever_registro(linhas)
+
+# Acrescenta as linhas ao registro (JSON por linha); passando de PREAQUECIMENTO_REGISTRO_MAX_BYTES,
+# ficam só as últimas PREAQUECIMENTO_JANELA_REGISTRO linhas
+def escrever_registro(linhas):
+    try:
+        with open(config.PREAQUECIMENTO_REGISTRO, 'a', encoding='utf-8') as f:
+            f.writelines(linha + '\n' for linha in linhas)
+        if os.path.getsize(config.PREAQUECIMENTO_REGISTRO) > config.PREAQUECIMENTO_REGISTRO_MAX_BYTES:
+            recentes = ler_registro()[-config.PREAQUECIMENTO_JANELA_REGISTRO:]
+            with open(config.PREAQUECIMENTO_REGISTRO, 'w', encoding='utf-8') as f:
+                f.writelines(json.dumps(p, ensure_ascii=False) + '\n' for p in recentes)
+    except OSError as e:
+        print(f"⚠️ Erro ao registrar pedido: {e}")
+
+# Linhas válidas do registro (as de formato antigo, com o corpo inteiro, são ignoradas)
+def ler_registro():
+    try:
+        with open(config.PREAQUECIMENTO_REGISTRO, encoding='utf-8') as f:
+            linhas = f.readlines()
+    except OSError:
+        return []
+    pedidos = []
+    for linha in linhas:
+        try:
+            pedido = json.loads(linha)
+        except ValueError:
+            continue
+        if isinstance(pedido, dict) and isinstance(pedido.get('parametros'), dict):
+            pedidos.append(pedido)
+    return pedidos
+
+# Pedidos mais frequentes de uma rota nas últimas PREAQUECIMENTO_JANELA_REGISTRO linhas do registro,
+# com os campos omitidos preenchidos pelo pedido padrão (os mesmos dos pedidos registrados)
+def pedidos_mais_frequentes(rota, n):
+    pedidos = [p for p in ler_registro()[-config.PREAQUECIMENTO_JANELA_REGISTRO:] if p.get('rota') == rota]
+    contagem = Counter(chave_pedido(rota, p['parametros']) for p in pedidos)
+    exemplo = {chave_pedido(rota, p['parametros']): p['parametros'] for p in pedidos}
+    omitidos = {chave: v for chave, v in config.PREAQUECIMENTO_PEDIDO_PADRAO.items()
+                if chave in config.PREAQUECIMENTO_CAMPOS_OMITIDOS}
+    return [{**omitidos, **exemplo[chave]} for chave, vezes in contagem.most_common(n)
+            if vezes >= config.PREAQUECIMENTO_MIN_OCORRENCIAS]
+
+
+# --- Agendador ---
+
+# Pedidos a pré-calcular: o padrão da página (fronteira e /otimizar) e os mais frequentes do registro
+def pedidos_pre_aquecimento():
+    pedidos = []
+    vistos = set()
+    candidatos = [('/calcular-fronteira', config.PREAQUECIMENTO_PEDIDO_PADRAO),
+                  ('/otimizar', config.PREAQUECIMENTO_PEDIDO_PADRAO)]
+    candidatos += [('/calcular-fronteira', d) for d in pedidos_mais_frequentes('/calcular-fronteira', config.PREAQUECIMENTO_PEDIDOS)]
+    candidatos += [('/otimizar', d) for d in pedidos_mais_frequentes('/otimizar', config.PREAQUECIMENTO_PEDIDOS)]
+    for rota, dados in candidatos:
+        chave = chave_pedido(rota, dados)
+        if chave not in vistos:
+            vistos.add(chave)
+            pedidos.append((rota, dados))
+    return pedidos
+
+# Calcula e guarda as respostas dos pedidos; executar(rota, dados) -> (resposta, status)
+def pre_aquecer(executar):
+    inicio = time.time()
+    resumo = {'pedidos': 0, 'guardados': 0, 'falhas': 0}
+    for rota, dados in pedidos_pre_aquecimento():
+        if _PARAR.is_set():
+            break
+        resumo['pedidos'] += 1
+        if obter_resultado(rota, dados) is not None:
+            resumo['guardados'] += 1
+            continue
+        geracao = geracao_atual()
+        try:
+            resposta, status = executar(rota, dados)
+        except Exception:
+            traceback.print_exc()
+            status = None
+        if status == 200:
+            guardar_resultado(rota, dados, resposta, geracao)
+            resumo['guardados'] += 1
+        else:
+            resumo['falhas'] += 1
+    resumo['tempo'] = round(time.time() - inicio, 1)
+    print(f"--- [PRÉ-AQUECIMENTO] {resumo['guardados']} de {resumo['pedidos']} respostas prontas em {resumo['tempo']}s ---")
+    return resumo
+
+# Próximo horário de execução (PREAQUECIMENTO_HORARIO, só nos dias de pregão de PREAQUECIMENTO_DIAS_SEMANA)
+def proxima_execucao(agora=None):
+    agora = agora or datetime.datetime.now()
+    hora, minuto = (int(parte) for parte in config.PREAQUECIMENTO_HORARIO.split(':'))
+    alvo = agora.replace(hour=hora, minute=minuto, second=0, microsecond=0)
+    if alvo <= agora:
+        alvo += datetime.timedelta(days=1)
+    while alvo.weekday() not in config.PREAQUECIMENTO_DIAS_SEMANA:
+        alvo += datetime.timedelta(days=1)
+    return alvo
+
+# Rodada noturna: atualiza os inputs (o servidor invalida o cache de respostas ao trocá-los),
+# os universos nomeados em memória e recalcula as respostas
+def executar_rodada(atualizar_dados, executar):
+    print("--- [PRÉ-AQUECIMENTO] Atualizando dados após o fechamento... ---")
+    try:
+        atualizar_dados()
+    except Exception:
+        traceback.print_exc()
+    for nome in universos.universos_carregados():
+        universos.atualizar_inputs(nome)
+    _ESTADO['ultimo_resumo'] = pre_aquecer(executar)
+    _ESTADO['ultima_execucao'] = datetime.datetime.now().isoformat()
+
+def laco_agendador(atualizar_dados, executar, carregar_inicial):
+    if carregar_inicial is not None:
+        try:
+            carregar_inicial()
+        except Exception:
+            traceback.print_exc()
+    if config.PREAQUECIMENTO_AO_INICIAR and not _PARAR.is_set():
+        _ESTADO['ultimo_resumo'] = pre_aquecer(executar)
+        _ESTADO['ultima_execucao'] = datetime.datetime.now().isoformat()
+
+    while True:
+        alvo = proxima_execucao()
+        _ESTADO['proxima_execucao'] = alvo.isoformat()
+        if _PARAR.wait((alvo - datetime.datetime.now()).total_seconds()):
+            return
+        executar_rodada(atualizar_dados, executar)
+
+# Inicia o agendador em uma thread daemon (uma vez por processo).
+# atualizar_dados(): recalcula os inputs; executar(rota, dados) -> (resposta, status);
+# carregar_inicial(): garante os inputs em memória antes do primeiro pré-aquecimento
+def iniciar_agendador(atualizar_dados, executar, carregar_inicial=None):
+    global _AGENDADOR
+    if not config.PREAQUECIMENTO_ATIVO or _AGENDADOR is not None:
+        return
+    _PARAR.clear()
+    _AGENDADOR = threading.Thread(target=laco_agendador, args=(atualizar_dados, executar, carregar_inicial),
+                                  daemon=True)
+    _AGENDADOR.start()
+
+def parar_agendador():
+    global _AGENDADOR
+    _PARAR.set()
+    _AGENDADOR = None
+
+def estado():
+    with _RESULTADOS_LOCK:
+        em_cache = len(_RESULTADOS)
+    return {**_ESTADO, 'ativo': _AGENDADOR is not None, 'respostas_em_cache': em_cache}
@@ -1,14 +1,22 @@
-import yfinance as yf
 import pandas as pd
 import numpy as np
 import datetime
 import os
-from bcb import sgs
+import shutil
+import tempfile
 import warnings
 from concurrent.futures import ThreadPoolExecutor
 
 
 import config
+import snapshot_dados
+import momentos_streaming
+import universos
+from importacao_tardia import importar_tardio
+
+# Clientes de dados externos só carregam quando há download
+yf = importar_tardio('yfinance')
+sgs = importar_tardio('bcb.sgs')
 
 
 DIAS_UTEIS_ANO = 252
@@ -426,10 +434,67 @@ def limpar_dados(retornos_medios, matriz_cov, volumes_medios):
     volumes_medios = volumes_medios.reindex(retornos_medios.index).fillna(0)
     return retornos_medios, matriz_cov, volumes_medios
 
+# Decide se os momentos são calculados em streaming (painel em disco) ou em memória
+def usar_momentos_streaming(n_ativos, data_inicio, data_fim):
+    if config.MOMENTOS_STREAMING != 'auto':
+        return bool(config.MOMENTOS_STREAMING)
+    dias_estimados = (data_fim - data_inicio).days * DIAS_UTEIS_ANO / 365.25
+    return n_ativos * dias_estimados >= config.MOMENTOS_LIMIAR_CELULAS
+
+# Baixa o universo em lotes de tickers, gravando cada lote no disco antes do próximo. Cada chamada tem a
+# sua pasta dentro de pasta_base (downloads simultâneos não se misturam); quem chama apaga a pasta
+# (painel['pasta']) depois de calcular os momentos
+def baixar_painel_em_disco(lista_de_tickers, data_inicio, data_fim, pasta_base=None):
+    pasta_base = pasta_base or config.MOMENTOS_PASTA
+    os.makedirs(pasta_base, exist_ok=True)
+    pasta = tempfile.mkdtemp(prefix='painel_', dir=pasta_base)
+
+    lote = config.MOMENTOS_LOTE_TICKERS
+    partes = 0
+    painel = None
+    try:
+        for k, inicio in enumerate(range(0, len(lista_de_tickers), lote)):
+            precos, volumes = baixar_dados_com_volume(lista_de_tickers[inicio:inicio + lote], data_inicio, data_fim)
+            if precos is None or precos.empty:
+                continue
+            momentos_streaming.salvar_parte(pasta, k, precos, volumes)
+            partes += 1
+        painel = momentos_streaming.montar_painel(pasta) if partes else None
+    finally:
+        if painel is None:
+            shutil.rmtree(pasta, ignore_errors=True)
+    return painel
+
+# Momentos em memória: painel completo de preços, retornos e covariância de uma vez
+def calcular_momentos_memoria(lista_ativos, data_inicio, data_fim):
+    precos, volumes = baixar_dados_com_volume(lista_ativos, data_inicio, data_fim)
+    if precos is None or precos.empty: return None
+
+    # Calcula retornos diários
+    retornos_diarios = precos.pct_change().replace([np.inf, -np.inf], np.nan).dropna()
+    if retornos_diarios.empty: return None
+    
+    # Calcula volume financeiro médio diário
+    preco_medio = precos.tail(126).mean()
+    vol_qtd = volumes.tail(126).mean()
+
+    return {
+        # Retornos médios anuais e matriz de covariância anualizada
+        'retornos_medios': retornos_diarios.mean() * DIAS_UTEIS_ANO,
+        'matriz_cov': retornos_diarios.cov() * DIAS_UTEIS_ANO,
+        'vetor_cvar': None,
+        'volume_financeiro': (vol_qtd * preco_medio).fillna(0),
+        'ultimos_precos': precos.ffill().iloc[-1].fillna(0.0),
+        'retornos_diarios': retornos_diarios
+    }
+
 # Função principal para calcular inputs de otimização para um período específico
-def calcular_inputs_otimizacao_periodo(valor_total_investido, data_inicio, data_fim):
+# (lista_ativos: universo nomeado; pasta_painel: painel em disco próprio do universo)
+def calcular_inputs_otimizacao_periodo(valor_total_investido, data_inicio, data_fim, lista_ativos=None,
+                                       pasta_painel=None):
     
-    lista_ativos = config.UNIVERSO_COMPLETO
+    # Tickers em quarentena (falharam em downloads recentes) ficam de fora
+    lista_ativos = universos.filtrar_quarentena(config.UNIVERSO_COMPLETO if lista_ativos is None else lista_ativos)
     if not lista_ativos: return None
 
     # Converte strings para datetime.date se necessário
@@ -440,33 +505,41 @@ def calcular_inputs_otimizacao_periodo(valor_total_investido, data_inicio, data_
     
     print(f"\n--- Baixando dados para período: {data_inicio} a {data_fim} ---")
     
-    # Baixa preços e volumes
-    precos, volumes = baixar_dados_com_volume(lista_ativos, data_inicio, data_fim)
-    if precos is None or precos.empty: return None
-
-    # Calcula retornos diários
-    retornos_diarios = precos.pct_change().replace([np.inf, -np.inf], np.nan).dropna()
-    if retornos_diarios.empty: return None
-    
-    # Calcula retornos médios anuais e matriz de covariância anualizada
-    retornos_medios = retornos_diarios.mean() * DIAS_UTEIS_ANO
-    matriz_cov = retornos_diarios.cov() * DIAS_UTEIS_ANO
-    
-    # Calcula volume financeiro médio diário
-    preco_medio = precos.tail(126).mean()
-    vol_qtd = volumes.tail(126).mean()
-    volume_financeiro = (vol_qtd * preco_medio).fillna(0)
-
-    retornos_medios, matriz_cov, volume_financeiro = limpar_dados(retornos_medios, matriz_cov, volume_financeiro)
+    # Baixa preços e volumes e calcula os momentos (em streaming para universos/históricos grandes)
+    if usar_momentos_streaming(len(lista_ativos), data_inicio, data_fim):
+        print("📦 Calculando momentos em streaming (painel em disco)...")
+        painel = baixar_painel_em_disco(lista_ativos, data_inicio, data_fim, pasta_painel)
+        momentos = None
+        if painel:
+            # Os retornos continuam mapeados do arquivo apagado até os inputs serem liberados
+            try:
+                momentos = momentos_streaming.calcular_momentos(painel)
+            finally:
+                shutil.rmtree(painel['pasta'], ignore_errors=True)
+    else:
+        momentos = calcular_momentos_memoria(lista_ativos, data_inicio, data_fim)
+    if momentos is None: return None
+    retornos_diarios = momentos['retornos_diarios']
+    universos.registrar_resultado_download(lista_ativos, retornos_diarios.columns)
+
+    retornos_medios, matriz_cov, volume_financeiro = limpar_dados(momentos['retornos_medios'], momentos['matriz_cov'],
+                                                                  momentos['volume_financeiro'])
 
     ativos_validos = list(retornos_medios.index)
-    ret_validos = retornos_diarios[ativos_validos] 
+    # Evita copiar o histórico (que pode estar mapeado do disco) quando nenhum ativo saiu
+    if list(retornos_diarios.columns) == ativos_validos:
+        ret_validos = retornos_diarios
+    else:
+        ret_validos = retornos_diarios[ativos_validos]
     
     # Calcula vetor CVaR 95% e P/VP
-    vetor_cvar = calcular_cvar_95(ret_validos)
+    if momentos['vetor_cvar'] is not None:
+        vetor_cvar = momentos['vetor_cvar']
+    else:
+        vetor_cvar = calcular_cvar_95(ret_validos)
     vetor_pvp = obter_pvp_ativos_otimizado(ativos_validos)
 
-    ultimos_precos = precos[ativos_validos].ffill().iloc[-1].fillna(0.0)
+    ultimos_precos = momentos['ultimos_precos'].reindex(ativos_validos)
     
     # Baixa benchmarks
     inicio_real = ret_validos.index[0].strftime('%Y-%m-%d')
@@ -505,12 +578,24 @@ def calcular_inputs_otimizacao_periodo(valor_total_investido, data_inicio, data_
     }
 
 # Função principal para calcular inputs de otimização usando período padrão
-def calcular_inputs_otimizacao(valor_total_investido):
+# (nome_universo: universo nomeado de universos.py, com painel e snapshot em pastas próprias)
+def calcular_inputs_otimizacao(valor_total_investido, lista_ativos=None, nome_universo=None):
     
     # Define período padrão
     data_fim = datetime.date.today()
     data_inicio = data_fim - datetime.timedelta(days=config.ANOS_DE_DADOS * 365.25)
     
+    if nome_universo:
+        inputs = calcular_inputs_otimizacao_periodo(valor_total_investido, data_inicio, data_fim, lista_ativos,
+                                                    os.path.join(config.UNIVERSOS_PAINEL_PASTA, nome_universo))
+        if inputs:
+            try:
+                pasta = snapshot_dados.salvar_snapshot(inputs, universos.pasta_snapshot(nome_universo), lista_ativos)
+                print(f"💾 Snapshot do universo '{nome_universo}' salvo em '{pasta}'")
+            except Exception as e:
+                print(f"⚠️ Erro ao salvar snapshot: {e}")
+        return inputs
+
     inputs = calcular_inputs_otimizacao_periodo(valor_total_investido, data_inicio, data_fim)
     
     # Salva debug de preços apenas na função padrão
@@ -524,5 +609,13 @@ def calcular_inputs_otimizacao(valor_total_investido):
             print(f"📄 [DEBUG] Preços atuais salvos em 'valores_cotas.csv'")
         except Exception as e:
             print(f"⚠️ Erro ao salvar CSV de debug: {e}")
+
+        # Snapshot em disco para a próxima inicialização do servidor
+        try:
+            pasta = snapshot_dados.salvar_snapshot(inputs)
+            inputs['id_snapshot'] = os.path.basename(pasta)
+            print(f"💾 Snapshot dos inputs salvo em '{pasta}'")
+        except Exception as e:
+            print(f"⚠️ Erro ao salvar snapshot: {e}")
     
     return inputs
\ No newline at end of file
@@ -0,0 +1,310 @@
+# Modo ASGI do servidor: uvicorn servidor_asgi:aplicacao --app-dir Trabalho_OTM
+# As rotas de otimização rodam num pool de processos limitado e as demais
+# (página, gráficos) são delegadas ao app Flask original.
+import asyncio
+import json
+import multiprocessing
+import os
+from urllib.parse import parse_qs
+from concurrent.futures import ProcessPoolExecutor
+
+from asgiref.wsgi import WsgiToAsgi
+
+import config
+import snapshot_dados
+import compactacao
+import perfilamento
+import orcamento_cpu
+import pre_aquecimento
+import app as app_flask
+from importacao_tardia import importar_tardio
+
+preparar_dados = importar_tardio('preparar_dados')
+
+
+APP_WSGI = WsgiToAsgi(app_flask.app)
+
+EXECUTOR_SOLVERS = None
+SOLVES_EM_ANDAMENTO = 0
+
+CACHE_DADOS = None
+METADADOS_SNAPSHOT = None
+TAREFA_CARREGAMENTO = None
+TAREFA_ATUALIZACAO = None
+STATUS_CARREGAMENTO = "Aguardando..."
+
+# Rotas que executam solvers: (função, usa os inputs em cache)
+ROTAS_SOLVERS = {
+    '/otimizar': (app_flask.executar_otimizacao, True),
+    '/calcular-fronteira': (app_flask.executar_fronteira, True),
+    '/otimizar-temporal': (app_flask.executar_otimizacao_temporal, False),
+    '/otimizar-lote': (app_flask.executar_otimizacao_lote, True),
+}
+
+# Nos workers os gráficos não são renderizados: quem serve os PNGs é o processo principal.
+# Cada worker fica com a sua fatia do orçamento de núcleos
+def configurar_worker(nucleos):
+    app_flask.PRE_RENDERIZAR_GRAFICOS = False
+    orcamento_cpu.definir_nucleos(nucleos)
+
+# Cria o pool de processos (spawn evita herdar threads e ambiente do Gurobi)
+def obter_executor():
+    global EXECUTOR_SOLVERS
+    if EXECUTOR_SOLVERS is None:
+        processos = config.ASGI_MAX_SOLVERS or os.cpu_count() or 1
+        orcamento_cpu.limitar_blas(orcamento_cpu.nucleos_por_processo(processos))   # herdado pelos processos filhos
+        EXECUTOR_SOLVERS = ProcessPoolExecutor(
+            max_workers=processos,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=configurar_worker,
+            initargs=(orcamento_cpu.nucleos_por_processo(processos),)
+        )
+    return EXECUTOR_SOLVERS
+
+# Inputs de cada worker: lidos do snapshot em disco (mapeado, páginas compartilhadas entre os processos)
+# e trocados só quando o id do snapshot muda; as requisições levam só o id, não os DataFrames
+INPUTS_WORKER = {'id': None, 'inputs': None}
+
+def inputs_do_worker(id_snapshot):
+    if INPUTS_WORKER['id'] != id_snapshot:
+        inputs, _ = snapshot_dados.ler_snapshot(os.path.join(config.SNAPSHOT_PASTA, id_snapshot), verbose=False)
+        if inputs is None:
+            return None
+        INPUTS_WORKER.update(id=id_snapshot, inputs=inputs)
+    return INPUTS_WORKER['inputs']
+
+# Roda no worker; None se o snapshot não puder ser lido (já apagado por um mais novo)
+def executar_com_snapshot(funcao, rota, perfilar, dados, id_snapshot):
+    inputs = inputs_do_worker(id_snapshot)
+    if inputs is None:
+        return None
+    return perfilamento.executar(funcao, rota, perfilar, dados, inputs)
+
+# Chamadas ao pool para uma rota, em ordem de tentativa: pelo id do snapshot e, se o worker não
+# conseguir lê-lo (ou os inputs não vierem de um snapshot), com os inputs inteiros
+def chamadas_pool(funcao, rota, perfilar, dados, inputs):
+    if inputs is None:
+        return [(perfilamento.executar, funcao, rota, perfilar, dados)]
+    chamadas = [(perfilamento.executar, funcao, rota, perfilar, dados, inputs)]
+    if inputs.get('id_snapshot'):
+        chamadas.insert(0, (executar_com_snapshot, funcao, rota, perfilar, dados, inputs['id_snapshot']))
+    return chamadas
+
+async def executar_no_pool(funcao, rota, perfilar, dados, inputs=None):
+    loop = asyncio.get_running_loop()
+    for chamada in chamadas_pool(funcao, rota, perfilar, dados, inputs):
+        resultado = await loop.run_in_executor(obter_executor(), *chamada)
+        if resultado is not None:
+            return resultado
+
+# Capacidade total: processos rodando + fila de espera
+def capacidade_maxima():
+    return (config.ASGI_MAX_SOLVERS or os.cpu_count() or 1) + config.ASGI_MAX_FILA
+
+# Download dos dados em uma thread, sem bloquear o loop de eventos
+async def carregar_dados():
+    global CACHE_DADOS, METADADOS_SNAPSHOT, STATUS_CARREGAMENTO
+    print("--- [ASGI] Iniciando pré-carregamento... ---")
+    STATUS_CARREGAMENTO = "Baixando Ativos..."
+    try:
+        dados = await asyncio.to_thread(preparar_dados.calcular_inputs_otimizacao, 10000)
+    except Exception as e:
+        print(f"--- [ASGI] Erro: {e}")
+        STATUS_CARREGAMENTO = "Erro"
+        return None
+
+    if dados:
+        CACHE_DADOS = dados
+        METADADOS_SNAPSHOT = snapshot_dados.localizar_snapshot()[1]
+        STATUS_CARREGAMENTO = "Dados Prontos"
+        print("--- [ASGI] Dados carregados! ---")
+    else:
+        STATUS_CARREGAMENTO = "Erro no Download"
+    return dados
+
+# Recalcula os inputs em background; o snapshot atual segue atendendo as requisições
+async def atualizar_dados():
+    global CACHE_DADOS, METADADOS_SNAPSHOT
+    print("--- [ASGI] Snapshot desatualizado, atualizando dados... ---")
+    try:
+        dados = await asyncio.to_thread(preparar_dados.calcular_inputs_otimizacao, 10000)
+    except Exception as e:
+        print(f"--- [ASGI] Erro na atualização: {e}")
+        return
+    if dados:
+        CACHE_DADOS = dados
+        METADADOS_SNAPSHOT = snapshot_dados.localizar_snapshot()[1]
+        pre_aquecimento.invalidar_resultados()
+        print("--- [ASGI] Dados atualizados! ---")
+
+def iniciar_atualizacao():
+    global TAREFA_ATUALIZACAO
+    if TAREFA_ATUALIZACAO is None or TAREFA_ATUALIZACAO.done():
+        TAREFA_ATUALIZACAO = asyncio.create_task(atualizar_dados())
+
+# Inicialização rápida a partir do snapshot em disco
+def carregar_snapshot_inicial():
+    global CACHE_DADOS, METADADOS_SNAPSHOT, STATUS_CARREGAMENTO
+    dados, metadados = snapshot_dados.carregar_snapshot()
+    if dados is None:
+        return
+    CACHE_DADOS, METADADOS_SNAPSHOT = dados, metadados
+    STATUS_CARREGAMENTO = "Dados Prontos"
+    if snapshot_dados.snapshot_desatualizado(metadados):
+        iniciar_atualizacao()
+
+# Dispara o carregamento uma única vez (requisições simultâneas compartilham a mesma tarefa)
+def iniciar_carregamento():
+    global TAREFA_CARREGAMENTO
+    if METADADOS_SNAPSHOT and snapshot_dados.snapshot_desatualizado(METADADOS_SNAPSHOT):
+        iniciar_atualizacao()
+    if CACHE_DADOS is None and (TAREFA_CARREGAMENTO is None or TAREFA_CARREGAMENTO.done()):
+        TAREFA_CARREGAMENTO = asyncio.create_task(carregar_dados())
+    return TAREFA_CARREGAMENTO
+
+async def obter_inputs():
+    if CACHE_DADOS is not None:
+        return CACHE_DADOS
+    return await iniciar_carregamento()
+
+async def ler_corpo(receive):
+    corpo = b''
+    while True:
+        mensagem = await receive()
+        corpo += mensagem.get('body', b'')
+        if not mensagem.get('more_body'):
+            return corpo
+
+# Valor de um cabeçalho da requisição (cabeçalhos ASGI vêm em bytes e minúsculos)
+def ler_cabecalho(scope, nome_procurado):
+    for nome, valor in scope.get('headers', []):
+        if nome == nome_procurado:
+            return valor.decode('latin-1')
+    return ''
+
+# Perfil pedido por cabeçalho X-Perfil ou ?perfil=1; o limite de taxa fica no processo principal
+def pedido_perfil(scope):
+    consulta = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    return ler_cabecalho(scope, b'x-perfil') or (consulta.get('perfil') or [''])[0]
+
+async def responder_json(send, payload, status=200, cabecalhos=(), aceita=''):
+    corpo, codificacao = compactacao.comprimir_corpo(app_flask.app.json.dumps(payload).encode('utf-8'), aceita)
+    cabecalhos = list(cabecalhos)
+    if codificacao:
+        cabecalhos += [(b'content-encoding', codificacao.encode()), (b'vary', b'accept-encoding')]
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'),
+                    (b'content-length', str(len(corpo)).encode())] + cabecalhos
+    })
+    await send({'type': 'http.response.body', 'body': corpo})
+
+# Executa uma rota de solver no pool, com controle de admissão. Respostas prontas do
+# pré-aquecimento saem direto, sem ocupar o pool
+async def processar_solver(rota, scope, receive, send):
+    global SOLVES_EM_ANDAMENTO
+    funcao, usa_inputs = ROTAS_SOLVERS[rota]
+    aceita = ler_cabecalho(scope, b'accept-encoding')
+    pedido = pedido_perfil(scope)
+
+    try:
+        dados = json.loads(await ler_corpo(receive) or b'{}')
+    except ValueError as e:
+        await responder_json(send, {'sucesso': False, 'erro': str(e)}, 400, aceita=aceita)
+        return
+    pre_aquecimento.registrar_pedido(rota, dados)
+    if not perfilamento.pedido_de_perfil(pedido):
+        pronta = pre_aquecimento.obter_resultado(rota, dados)
+        if pronta is not None:
+            app_flask.registrar_graficos_resposta(pronta)
+            await responder_json(send, pronta, aceita=aceita)
+            return
+
+    if SOLVES_EM_ANDAMENTO >= capacidade_maxima():
+        await responder_json(send, {'sucesso': False, 'erro': 'Servidor ocupado. Tente novamente em instantes.'},
+                             503, [(b'retry-after', b'5')])
+        return
+
+    # O limite de perfis por hora só é consumido por requisições admitidas
+    perfilar = perfilamento.deve_perfilar(pedido)
+    SOLVES_EM_ANDAMENTO += 1
+    try:
+        geracao = pre_aquecimento.geracao_atual()
+        inputs = None
+        if usa_inputs:
+            inputs = await obter_inputs()
+            if inputs is None:
+                await responder_json(send, {'sucesso': False, 'erro': 'Falha ao baixar dados.'}, 500)
+                return
+
+        resposta, status = await executar_no_pool(funcao, rota, perfilar, dados, inputs)
+        if status == 200:
+            app_flask.registrar_graficos_resposta(resposta)
+            if not perfilar:
+                pre_aquecimento.guardar_resultado(rota, dados, resposta, geracao)
+        await responder_json(send, resposta, status, aceita=aceita)
+    except Exception as e:
+        await responder_json(send, {'sucesso': False, 'erro': str(e)}, 500, aceita=aceita)
+    finally:
+        SOLVES_EM_ANDAMENTO -= 1
+
+# Pré-aquecimento no modo ASGI: o agendador roda numa thread; carga e atualização dos dados
+# passam pelo loop de eventos e os solves pelo mesmo pool das requisições
+def iniciar_pre_aquecimento(loop):
+    def no_loop(corotina):
+        return asyncio.run_coroutine_threadsafe(corotina, loop).result()
+
+    def executar(rota, dados):
+        funcao, usa_inputs = ROTAS_SOLVERS[rota]
+        inputs = CACHE_DADOS if usa_inputs else None
+        for chamada in chamadas_pool(funcao, rota, False, dados, inputs):
+            resultado = obter_executor().submit(*chamada).result()
+            if resultado is not None:
+                return resultado
+
+    pre_aquecimento.iniciar_agendador(lambda: no_loop(atualizar_dados()), executar,
+                                      lambda: no_loop(obter_inputs()))
+
+async def tratar_lifespan(receive, send):
+    while True:
+        mensagem = await receive()
+        if mensagem['type'] == 'lifespan.startup':
+            carregar_snapshot_inicial()
+            obter_executor()
+            iniciar_pre_aquecimento(asyncio.get_running_loop())
+            await send({'type': 'lifespan.startup.complete'})
+        elif mensagem['type'] == 'lifespan.shutdown':
+            pre_aquecimento.parar_agendador()
+            if EXECUTOR_SOLVERS is not None:
+                EXECUTOR_SOLVERS.shutdown(wait=False, cancel_futures=True)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+# Aplicação ASGI principal
+async def aplicacao(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await tratar_lifespan(receive, send)
+        return
+
+    rota = scope.get('path', '')
+    metodo = scope.get('method', 'GET')
+
+    if rota == '/status-dados':
+        await responder_json(send, {'status': STATUS_CARREGAMENTO,
+                                    'solves_em_andamento': SOLVES_EM_ANDAMENTO,
+                                    'capacidade': capacidade_maxima(),
+                                    'pre_aquecimento': pre_aquecimento.estado()})
+    elif rota == '/pre-carregar':
+        iniciar_carregamento()
+        await responder_json(send, {'status': 'iniciado'})
+    elif rota in ROTAS_SOLVERS and metodo == 'POST':
+        await processar_solver(rota, scope, receive, send)
+    else:
+        await APP_WSGI(scope, receive, send)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    print("✅ Servidor ASGI rodando! Acesse: http://127.0.0.1:5000")
+    uvicorn.run(aplicacao, host='127.0.0.1', port=5000)
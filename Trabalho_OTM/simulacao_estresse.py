@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+
+import config
+
+# Teste de estresse das carteiras otimizadas: milhares de caminhos futuros simulados a partir do
+# histórico (bootstrap em blocos) ou da covariância (normal multivariada), avaliando todas as
+# carteiras nos mesmos caminhos. Tudo é projetado nos retornos das carteiras antes de simular:
+# o custo por caminho não depende do número de ativos.
+
+PERCENTIS_BANDA = [5, 25, 50, 75, 95]
+
+
+# Matriz de pesos (ativos x carteiras) na ordem das colunas do histórico
+def matriz_pesos(carteiras, nomes_ativos, colunas):
+    return np.column_stack([
+        pd.Series(np.asarray(pesos, dtype=float), index=nomes_ativos).reindex(colunas).fillna(0.0).values
+        for pesos in carteiras.values()
+    ])
+
+# Índices de dias para um lote de caminhos: blocos contíguos com início sorteado
+def indices_bootstrap(rng, n_caminhos, horizonte, n_dias, bloco):
+    bloco = max(1, min(bloco, n_dias))
+    n_blocos = -(-horizonte // bloco)
+    inicios = rng.integers(0, n_dias - bloco + 1, size=(n_caminhos, n_blocos))
+    return (inicios[:, :, None] + np.arange(bloco)).reshape(n_caminhos, -1)[:, :horizonte]
+
+# Log-retornos acumulados de um lote (caminhos x pontos x carteiras), só nos dias das bandas
+def simular_lote(rng, n_caminhos, horizonte, pontos, metodo, retornos_carteiras, media, cholesky, bloco):
+    if metodo == 'bootstrap':
+        idx = indices_bootstrap(rng, n_caminhos, horizonte, len(retornos_carteiras), bloco)
+        log_ret = np.log1p(retornos_carteiras)[idx]
+    else:
+        z = rng.standard_normal((n_caminhos, horizonte, len(media)))
+        log_ret = np.log1p(np.maximum(media + z @ cholesky.T, -0.99))
+    return np.cumsum(log_ret, axis=1)[:, pontos - 1, :].astype(np.float32)
+
+# Simula todas as carteiras nos mesmos caminhos; retorna métricas por carteira (mesmas chaves de 'carteiras')
+def simular_carteiras(inputs, carteiras, n_caminhos=None, horizonte_dias=None, metodo=None,
+                      bloco_dias=None, lote=None, semente=None):
+    carteiras = {nome: pesos for nome, pesos in carteiras.items() if pesos is not None}
+    if not carteiras:
+        return {}
+
+    n_caminhos = n_caminhos or config.SIMULACAO_CAMINHOS
+    horizonte = horizonte_dias or config.SIMULACAO_HORIZONTE_DIAS
+    metodo = metodo or config.SIMULACAO_METODO
+    lote = lote or config.SIMULACAO_LOTE_CAMINHOS
+    rng = np.random.default_rng(config.SIMULACAO_SEMENTE if semente is None else semente)
+
+    # 1. Projeta o histórico (ou a covariância diária) nas carteiras
+    retornos_hist = inputs['retornos_diarios_historicos']
+    W = matriz_pesos(carteiras, inputs['nomes_dos_ativos'], retornos_hist.columns)
+    retornos_carteiras = np.nan_to_num(retornos_hist.values) @ W
+    media = cholesky = None
+    if metodo == 'normal':
+        nomes_cols = list(retornos_hist.columns)
+        cov_diaria = inputs['matriz_cov'].reindex(index=nomes_cols, columns=nomes_cols).fillna(0.0).values / 252
+        media = inputs['retornos_medios'].reindex(nomes_cols).fillna(0.0).values @ W / 252
+        cov_carteiras = W.T @ cov_diaria @ W
+        cholesky = np.linalg.cholesky(cov_carteiras + 1e-14 * np.eye(len(carteiras)))
+    elif metodo != 'bootstrap':
+        raise ValueError(f"Método de simulação desconhecido: {metodo}")
+
+    # 2. Lotes de caminhos; guarda só os dias das bandas, em float32
+    pontos = np.unique(np.linspace(1, horizonte, config.SIMULACAO_PONTOS_BANDA).astype(int))
+    acumulados = np.empty((n_caminhos, len(pontos), len(carteiras)), dtype=np.float32)
+    for inicio in range(0, n_caminhos, lote):
+        fim = min(inicio + lote, n_caminhos)
+        acumulados[inicio:fim] = simular_lote(rng, fim - inicio, horizonte, pontos, metodo, retornos_carteiras,
+                                              media, cholesky, bloco_dias or config.SIMULACAO_BLOCO_DIAS)
+
+    # 3. Métricas: bandas de percentis do valor (base 100), probabilidade de perda, VaR e CVaR no horizonte
+    valores = 100 * np.exp(acumulados)
+    bandas = np.percentile(valores, PERCENTIS_BANDA, axis=0)
+    retornos_finais = np.expm1(acumulados[:, -1, :].astype(float))
+    corte = max(1, int(0.05 * n_caminhos))
+    piores = np.sort(retornos_finais, axis=0)[:corte]
+
+    resultado = {}
+    for j, nome in enumerate(carteiras):
+        resultado[nome] = {
+            'metodo': metodo,
+            'caminhos': n_caminhos,
+            'dias': pontos.tolist(),
+            'bandas': {f"p{p}": bandas[k, :, j].tolist() for k, p in enumerate(PERCENTIS_BANDA)},
+            'retorno_mediano': float(np.median(retornos_finais[:, j])),
+            'prob_perda': float(np.mean(retornos_finais[:, j] < 0)),
+            'var_95': float(-piores[-1, j]),
+            'cvar_95': float(-piores[:, j].mean())
+        }
+    return resultado
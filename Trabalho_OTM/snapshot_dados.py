@@ -0,0 +1,148 @@
+import datetime
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+import config
+
+# Versão do formato em disco; snapshots de outra versão são ignorados
+VERSAO_SNAPSHOT = 1
+
+ARQUIVO_METADADOS = "metadados.json"
+
+# Séries indexadas pelos nomes dos ativos
+SERIES_POR_ATIVO = ['retornos_medios', 'vetor_pvp', 'vetor_cvar', 'volume_medio', 'ultimos_precos']
+
+
+# Identifica o universo e a janela de dados: mudou a configuração, o snapshot não serve.
+# 'ativos' = lista de um universo nomeado (padrão: config.UNIVERSO_COMPLETO)
+def hash_universo(ativos=None):
+    ativos = config.UNIVERSO_COMPLETO if ativos is None else ativos
+    conteudo = json.dumps({'ativos': sorted(ativos), 'anos': config.ANOS_DE_DADOS})
+    return hashlib.sha1(conteudo.encode('utf-8')).hexdigest()
+
+def salvar_array(pasta, nome, valores):
+    np.save(os.path.join(pasta, f"{nome}.npy"), np.ascontiguousarray(valores), allow_pickle=False)
+
+def carregar_array(pasta, nome):
+    # 'c' = copy-on-write: os arrays ficam mapeados do disco, mas alterações não voltam para o arquivo
+    return np.load(os.path.join(pasta, f"{nome}.npy"), mmap_mode='c', allow_pickle=False)
+
+# Salva os inputs em uma nova pasta versionada e remove os snapshots antigos
+def salvar_snapshot(inputs, pasta_base=None, ativos=None):
+    pasta_base = pasta_base or config.SNAPSHOT_PASTA
+    criado_em = datetime.datetime.now()
+    pasta = os.path.join(pasta_base, criado_em.strftime('%Y%m%d_%H%M%S_%f'))
+    temporaria = pasta + ".tmp"
+    os.makedirs(temporaria, exist_ok=True)
+
+    nomes = list(inputs['nomes_dos_ativos'])
+    salvar_array(temporaria, 'nomes_dos_ativos', np.array(nomes, dtype=str))
+    for chave in SERIES_POR_ATIVO:
+        salvar_array(temporaria, chave, inputs[chave].reindex(nomes).values.astype(float))
+    salvar_array(temporaria, 'matriz_cov', inputs['matriz_cov'].loc[nomes, nomes].values.astype(float))
+
+    # Sem cópia quando o histórico já está na ordem certa (pode ser um memmap do cálculo em streaming)
+    retornos = inputs['retornos_diarios_historicos']
+    if list(retornos.columns) != nomes:
+        retornos = retornos[nomes]
+    salvar_array(temporaria, 'retornos_diarios', retornos.values.astype(float, copy=False))
+    salvar_array(temporaria, 'datas_retornos', retornos.index.values.astype('datetime64[ns]'))
+
+    benchmarks = inputs['df_benchmarks']
+    salvar_array(temporaria, 'benchmarks', benchmarks.values.astype(float))
+    salvar_array(temporaria, 'datas_benchmarks', benchmarks.index.values.astype('datetime64[ns]'))
+
+    # Metadados por último: pasta sem metadados é considerada incompleta
+    metadados = {
+        'versao': VERSAO_SNAPSHOT,
+        'hash_universo': hash_universo(ativos),
+        'periodo': inputs.get('periodo'),
+        'criado_em': criado_em.isoformat(),
+        'valor_total_investido': inputs.get('valor_total_investido', 0.0),
+        'colunas_benchmarks': list(benchmarks.columns)
+    }
+    with open(os.path.join(temporaria, ARQUIVO_METADADOS), 'w', encoding='utf-8') as f:
+        json.dump(metadados, f, ensure_ascii=False, indent=2)
+    os.replace(temporaria, pasta)
+
+    limpar_snapshots_antigos(pasta_base, manter=os.path.basename(pasta))
+    return pasta
+
+# Remove snapshots anteriores (falhas são ignoradas: no Windows um snapshot em uso não pode ser apagado)
+def limpar_snapshots_antigos(pasta_base, manter):
+    for nome in os.listdir(pasta_base):
+        if nome != manter and not nome.endswith('.tmp'):
+            shutil.rmtree(os.path.join(pasta_base, nome), ignore_errors=True)
+
+def ler_metadados(pasta):
+    try:
+        with open(os.path.join(pasta, ARQUIVO_METADADOS), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+# Snapshot mais recente compatível com a versão e o universo atuais: (pasta, metadados) ou (None, None)
+def localizar_snapshot(pasta_base=None, ativos=None):
+    pasta_base = pasta_base or config.SNAPSHOT_PASTA
+    if not os.path.isdir(pasta_base):
+        return None, None
+
+    for nome in sorted(os.listdir(pasta_base), reverse=True):
+        pasta = os.path.join(pasta_base, nome)
+        if nome.endswith('.tmp') or not os.path.isdir(pasta):
+            continue
+        metadados = ler_metadados(pasta)
+        if metadados and metadados.get('versao') == VERSAO_SNAPSHOT \
+                and metadados.get('hash_universo') == hash_universo(ativos):
+            return pasta, metadados
+    return None, None
+
+# Snapshot antigo demais deve ser atualizado
+def snapshot_desatualizado(metadados, idade_maxima_horas=None):
+    idade_maxima_horas = config.SNAPSHOT_IDADE_MAXIMA_HORAS if idade_maxima_horas is None else idade_maxima_horas
+    criado_em = datetime.datetime.fromisoformat(metadados['criado_em'])
+    idade_horas = (datetime.datetime.now() - criado_em).total_seconds() / 3600
+    return idade_horas >= idade_maxima_horas
+
+# Reconstrói o dicionário de inputs no mesmo formato de preparar_dados.calcular_inputs_otimizacao
+def carregar_snapshot(pasta_base=None, verbose=True, ativos=None):
+    pasta, metadados = localizar_snapshot(pasta_base, ativos)
+    if pasta is None:
+        return None, None
+    return ler_snapshot(pasta, metadados, verbose)
+
+# Inputs de uma pasta de snapshot específica; 'id_snapshot' (nome da pasta) identifica os dados
+def ler_snapshot(pasta, metadados=None, verbose=True):
+    metadados = metadados or ler_metadados(pasta)
+    if metadados is None:
+        return None, None
+
+    try:
+        nomes = [str(n) for n in np.load(os.path.join(pasta, 'nomes_dos_ativos.npy'), allow_pickle=False)]
+        inputs = {chave: pd.Series(carregar_array(pasta, chave), index=nomes) for chave in SERIES_POR_ATIVO}
+        inputs['matriz_cov'] = pd.DataFrame(carregar_array(pasta, 'matriz_cov'), index=nomes, columns=nomes)
+
+        datas_retornos = pd.DatetimeIndex(carregar_array(pasta, 'datas_retornos'))
+        inputs['retornos_diarios_historicos'] = pd.DataFrame(carregar_array(pasta, 'retornos_diarios'),
+                                                             index=datas_retornos, columns=nomes)
+        inputs['df_benchmarks'] = pd.DataFrame(carregar_array(pasta, 'benchmarks'),
+                                               index=pd.DatetimeIndex(carregar_array(pasta, 'datas_benchmarks')),
+                                               columns=metadados['colunas_benchmarks'])
+    except (OSError, ValueError, KeyError) as e:
+        print(f"⚠️ Snapshot inválido em '{pasta}': {e}")
+        return None, None
+
+    inputs['nomes_dos_ativos'] = nomes
+    inputs['n_ativos'] = len(nomes)
+    inputs['valor_total_investido'] = metadados.get('valor_total_investido', 0.0)
+    inputs['periodo'] = metadados.get('periodo')
+    inputs['id_snapshot'] = os.path.basename(pasta)
+
+    if verbose:
+        print(f"💾 Snapshot carregado de '{pasta}' ({len(nomes)} ativos, criado em {metadados['criado_em']})")
+    return inputs, metadados
@@ -0,0 +1,152 @@
+import math
+import numpy as np
+import pandas as pd
+
+import config
+
+# Chaves do dicionário de inputs indexadas por ativo
+CHAVES_POR_ATIVO = ['retornos_medios', 'vetor_pvp', 'vetor_cvar', 'volume_medio', 'ultimos_precos']
+
+# Valor máximo comprável de cada ativo (teto por ativo e 10% do volume médio, em lotes inteiros)
+def tetos_financeiros(inputs, teto_maximo_ativo=0.30):
+    nomes_ativos = inputs['nomes_dos_ativos']
+    valor_investido = inputs.get('valor_total_investido') or 1.0
+    precos = inputs.get('ultimos_precos', pd.Series(dtype=float)).reindex(nomes_ativos).fillna(0.0).values
+    volumes = inputs['volume_medio'].reindex(nomes_ativos).fillna(0.0).values
+    teto = np.minimum(valor_investido * teto_maximo_ativo, 0.1 * volumes)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        unidades = np.where(precos > 0.01, np.floor(teto / np.where(precos > 0.01, precos, 1.0)), 0.0)
+    return unidades * precos
+
+# Identifica ativos que não podem ser comprados (proibidos, sem liquidez ou caros demais)
+def identificar_inviaveis(inputs, setores_proibidos=None, teto_maximo_ativo=0.30):
+    nomes_ativos = inputs['nomes_dos_ativos']
+    valor_investido = inputs.get('valor_total_investido') or 1.0
+    precos = inputs.get('ultimos_precos', pd.Series(dtype=float)).reindex(nomes_ativos).fillna(0.0).values
+    volumes = inputs['volume_medio'].reindex(nomes_ativos).fillna(0.0).values
+
+    # Ativos dos setores proibidos
+    proibidos = set()
+    if setores_proibidos:
+        mapa_setores = config.obter_mapa_setores_ativos(inputs.get('setores_universo'))
+        for setor in setores_proibidos:
+            proibidos.update(str(a).strip().upper() for a in mapa_setores.get(setor, []))
+
+    inviaveis = np.zeros(len(nomes_ativos), dtype=bool)
+    for i, ticker in enumerate(nomes_ativos):
+        if str(ticker).strip().upper() in proibidos or precos[i] <= 0.01:
+            inviaveis[i] = True
+            continue
+
+        # Mesma regra de lotes do Gurobi: precisa caber ao menos o lote mínimo
+        teto_financeiro = min(valor_investido * teto_maximo_ativo, 0.1 * volumes[i])
+        max_unidades = int(teto_financeiro / precos[i])
+        min_cotas = math.ceil(valor_investido * config.PESO_MINIMO_ATIVO / (precos[i] + 0.0001))
+        if max_unidades == 0 or min_cotas > max_unidades:
+            inviaveis[i] = True
+
+    return inviaveis
+
+# Identifica ativos dominados: outro ativo muito correlacionado é melhor em todos os critérios,
+# comporta pelo menos o mesmo valor (liquidez e teto por ativo) e está nos mesmos setores
+# (a troca não muda tetos setoriais nem limites de ativos por setor)
+def identificar_dominados(inputs, candidatos, correlacao_minima=None, teto_maximo_ativo=0.30):
+    correlacao_minima = config.TRIAGEM_CORRELACAO_DOMINANCIA if correlacao_minima is None else correlacao_minima
+    nomes_ativos = inputs['nomes_dos_ativos']
+
+    ret = inputs['retornos_medios'].reindex(nomes_ativos).values
+    cov = inputs['matriz_cov'].reindex(index=nomes_ativos, columns=nomes_ativos).values
+    pvp = inputs['vetor_pvp'].reindex(nomes_ativos).values
+    cvar = inputs['vetor_cvar'].reindex(nomes_ativos).values
+    vol = np.sqrt(np.maximum(np.diag(cov), 1e-12))
+    corr = cov / np.outer(vol, vol)
+
+    # domina[i, j] = True quando i domina j
+    melhor_igual = (ret[:, None] >= ret[None, :]) & (vol[:, None] <= vol[None, :]) \
+                   & (pvp[:, None] <= pvp[None, :]) & (cvar[:, None] <= cvar[None, :])
+    estritamente = (ret[:, None] > ret[None, :]) | (vol[:, None] < vol[None, :]) \
+                   | (pvp[:, None] < pvp[None, :]) | (cvar[:, None] < cvar[None, :])
+    domina = melhor_igual & estritamente & (corr >= correlacao_minima)
+
+    teto = tetos_financeiros(inputs, teto_maximo_ativo)
+    domina &= teto[:, None] >= teto[None, :]
+
+    setores_do_ativo = {}
+    for setor, ativos in config.obter_mapa_setores_ativos(inputs.get('setores_universo')).items():
+        for ativo in ativos:
+            setores_do_ativo.setdefault(ativo, set()).add(setor)
+    _, grupo_setorial = np.unique([','.join(sorted(setores_do_ativo.get(a, ()))) for a in nomes_ativos],
+                                  return_inverse=True)
+    domina &= grupo_setorial[:, None] == grupo_setorial[None, :]
+
+    # Só ativos viáveis podem dominar
+    domina &= candidatos[:, None]
+    return candidatos & domina.any(axis=0)
+
+# Reduz o universo de ativos antes do AG e do Gurobi
+def triar_universo(inputs, setores_proibidos=None, teto_maximo_ativo=0.30, remover_dominados=None, verbose=True):
+    remover_dominados = config.TRIAGEM_REMOVER_DOMINADOS if remover_dominados is None else remover_dominados
+    nomes_ativos = list(inputs['nomes_dos_ativos'])
+    n_ativos = len(nomes_ativos)
+
+    inviaveis = identificar_inviaveis(inputs, setores_proibidos, teto_maximo_ativo)
+    candidatos = ~inviaveis
+    dominados = identificar_dominados(inputs, candidatos, teto_maximo_ativo=teto_maximo_ativo) if remover_dominados else np.zeros(n_ativos, dtype=bool)
+    mantidos = candidatos & ~dominados
+
+    indices = np.flatnonzero(mantidos)
+    nomes_mantidos = [nomes_ativos[i] for i in indices]
+
+    if verbose:
+        print(f"[TRIAGEM] {len(indices)} de {n_ativos} ativos mantidos "
+              f"(inviáveis: {int(inviaveis.sum())}, dominados: {int(dominados.sum())})")
+
+    # Monta o dicionário de inputs reduzido
+    inputs_reduzidos = dict(inputs)
+    for chave in CHAVES_POR_ATIVO:
+        if chave in inputs:
+            inputs_reduzidos[chave] = inputs[chave].reindex(nomes_mantidos)
+    inputs_reduzidos['matriz_cov'] = inputs['matriz_cov'].loc[nomes_mantidos, nomes_mantidos]
+    inputs_reduzidos['nomes_dos_ativos'] = nomes_mantidos
+    inputs_reduzidos['n_ativos'] = len(nomes_mantidos)
+    if 'retornos_diarios_historicos' in inputs:
+        inputs_reduzidos['retornos_diarios_historicos'] = inputs['retornos_diarios_historicos'][nomes_mantidos]
+
+    return {
+        'inputs': inputs_reduzidos,
+        'indices': indices,
+        'nomes_completos': nomes_ativos,
+        'n_total': n_ativos
+    }
+
+# Mapeia um vetor do universo reduzido de volta para o universo completo
+def expandir_vetor(valores, triagem):
+    completo = np.zeros(triagem['n_total'])
+    if valores is not None:
+        completo[triagem['indices']] = np.asarray(valores, dtype=float)
+    return completo
+
+# Mapeia o resultado do AG ou do Gurobi de volta para o universo completo
+def expandir_resultado(res, triagem):
+    if res is None:
+        return None
+    res = dict(res)
+
+    # Resultado do AG
+    if 'pesos_finais' in res:
+        res['pesos_finais'] = expandir_vetor(res['pesos_finais'], triagem)
+        df = res['dataframe_resultado']
+        cols_meta = [c for c in df.columns if c not in triagem['inputs']['nomes_dos_ativos']]
+        df_pesos = pd.DataFrame([res['pesos_finais']], columns=triagem['nomes_completos'])
+        res['dataframe_resultado'] = pd.concat([df[cols_meta].reset_index(drop=True), df_pesos], axis=1)
+
+    # Resultado do Gurobi
+    if 'pesos' in res:
+        res['pesos'] = expandir_vetor(res['pesos'], triagem)
+        res['lotes'] = expandir_vetor(res.get('lotes'), triagem)
+        res['solucoes_pool'] = [
+            dict(sol, pesos=expandir_vetor(sol['pesos'], triagem), lotes=expandir_vetor(sol.get('lotes'), triagem))
+            for sol in res.get('solucoes_pool', [])
+        ]
+
+    return res
@@ -0,0 +1,241 @@
+import datetime
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import config
+import snapshot_dados
+from importacao_tardia import importar_tardio
+
+preparar_dados = importar_tardio('preparar_dados')
+
+# Registro de universos nomeados. O universo padrão (config.UNIVERSO_ATIVOS) segue pelo cache principal
+# do servidor; os demais vêm de arquivos <nome>.json em UNIVERSOS_PASTA ou do POST /universos, e cada um
+# tem seus próprios inputs (snapshot em disco + cache LRU em memória), carregados só quando pedidos.
+# Tickers que falham no download ficam de quarentena e são pulados nos downloads seguintes.
+
+NOME_VALIDO = re.compile(r'^[a-z0-9_-]{1,40}$')
+SETOR_SEM_CLASSIFICACAO = 'Outros'
+
+_REGISTRO = {}
+_REGISTRO_LOCK = threading.Lock()
+_ARQUIVOS_LIDOS = False
+
+_DADOS = OrderedDict()
+_DADOS_LOCK = threading.Lock()
+_CARREGANDO = {}   # um carregamento por universo; os demais pedidos esperam por ele
+
+_QUARENTENA_LOCK = threading.Lock()
+
+
+# --- Definições ---
+
+# Valida e normaliza {'setores': {setor: [tickers]}} ou {'ativos': [tickers]}
+def normalizar_definicao(nome, definicao):
+    if not isinstance(nome, str) or not NOME_VALIDO.match(nome):
+        raise ValueError("Nome de universo inválido (use a-z, 0-9, '_' ou '-', até 40 caracteres).")
+    if nome == config.UNIVERSO_PADRAO:
+        raise ValueError(f"O universo '{nome}' é definido em config.py.")
+
+    setores = definicao.get('setores') or {}
+    if not isinstance(setores, dict):
+        raise ValueError("'setores' deve mapear setor -> lista de tickers.")
+    setores = {str(setor): sorted({str(t).strip().upper() for t in tickers if str(t).strip()})
+               for setor, tickers in setores.items()}
+    ativos = {t for tickers in setores.values() for t in tickers}
+    ativos.update(str(t).strip().upper() for t in definicao.get('ativos') or [] if str(t).strip())
+    ativos -= set(config.TICKERS_COM_FALHA_YF)
+    if not ativos:
+        raise ValueError("O universo precisa de pelo menos um ativo.")
+    return {'nome': nome, 'ativos': sorted(ativos), 'setores': setores}
+
+# Setores dos tickers fora de config.UNIVERSO_ATIVOS: o da definição ou 'Outros'. Ficam só nos inputs do
+# universo (inputs['setores_universo']), então universos diferentes podem classificar o mesmo ticker
+def setores_extras(universo):
+    conhecidos = {t for tickers in config.UNIVERSO_ATIVOS.values() for t in tickers}
+    setor_de = {t: setor for setor, tickers in universo['setores'].items() for t in tickers}
+    extras = {}
+    for ticker in universo['ativos']:
+        if ticker not in conhecidos:
+            extras.setdefault(setor_de.get(ticker, SETOR_SEM_CLASSIFICACAO), []).append(ticker)
+    return extras
+
+def caminho_definicao(nome):
+    return os.path.join(config.UNIVERSOS_PASTA, f"{nome}.json")
+
+def ler_arquivos():
+    global _ARQUIVOS_LIDOS
+    _ARQUIVOS_LIDOS = True
+    if not os.path.isdir(config.UNIVERSOS_PASTA):
+        return
+    for arquivo in sorted(os.listdir(config.UNIVERSOS_PASTA)):
+        if not arquivo.endswith('.json') or arquivo[:-5] in _REGISTRO:
+            continue
+        try:
+            with open(os.path.join(config.UNIVERSOS_PASTA, arquivo), encoding='utf-8') as f:
+                registrar_universo(arquivo[:-5], json.load(f), salvar=False, origem='arquivo')
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Universo '{arquivo}' ignorado: {e}")
+
+# Registra (ou substitui) um universo; os dados em cache do nome são descartados
+def registrar_universo(nome, definicao, salvar=True, origem='api'):
+    universo = normalizar_definicao(nome, definicao)
+    universo['origem'] = origem
+    universo['setores_extras'] = setores_extras(universo)
+    with _REGISTRO_LOCK:
+        anterior = _REGISTRO.get(nome)
+        _REGISTRO[nome] = universo
+    if anterior is None or anterior['ativos'] != universo['ativos'] or anterior['setores'] != universo['setores']:
+        with _DADOS_LOCK:
+            _DADOS.pop(nome, None)
+
+    if salvar:
+        os.makedirs(config.UNIVERSOS_PASTA, exist_ok=True)
+        temporario = caminho_definicao(nome) + ".tmp"
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump({'ativos': universo['ativos'], 'setores': universo['setores']}, f, ensure_ascii=False, indent=2)
+        os.replace(temporario, caminho_definicao(nome))
+    return universo
+
+# Definição de um universo; nomes desconhecidos relêem a pasta (podem ter sido criados por outro processo)
+def obter_universo(nome):
+    if nome in (None, '', config.UNIVERSO_PADRAO):
+        return {'nome': config.UNIVERSO_PADRAO, 'ativos': config.UNIVERSO_COMPLETO, 'setores': {},
+                'setores_extras': {}, 'origem': 'config'}
+    if not _ARQUIVOS_LIDOS or nome not in _REGISTRO:
+        ler_arquivos()
+    if nome not in _REGISTRO:
+        raise ValueError(f"Universo desconhecido: {nome}")
+    return _REGISTRO[nome]
+
+def listar_universos():
+    if not _ARQUIVOS_LIDOS:
+        ler_arquivos()
+    nomes = [config.UNIVERSO_PADRAO] + sorted(_REGISTRO)
+    resultado = []
+    for nome in nomes:
+        universo = obter_universo(nome)
+        with _DADOS_LOCK:
+            carregado = nome in _DADOS
+        resultado.append({'nome': nome, 'n_ativos': len(universo['ativos']), 'origem': universo['origem'],
+                          'carregado': carregado})
+    return resultado
+
+
+# --- Dados por universo ---
+
+def pasta_snapshot(nome):
+    return os.path.join(config.UNIVERSOS_SNAPSHOT_PASTA, nome)
+
+def guardar_inputs(nome, inputs):
+    inputs['setores_universo'] = obter_universo(nome)['setores_extras']
+    with _DADOS_LOCK:
+        _DADOS[nome] = inputs
+        _DADOS.move_to_end(nome)
+        while len(_DADOS) > config.UNIVERSOS_CACHE_MAX:
+            _DADOS.popitem(last=False)
+
+# Inputs de um universo nomeado: memória, senão snapshot do universo, senão download (só deste universo).
+# Snapshot velho é usado na hora e atualizado em background
+def obter_inputs(nome):
+    universo = obter_universo(nome)
+    with _DADOS_LOCK:
+        if nome in _DADOS:
+            _DADOS.move_to_end(nome)
+            return _DADOS[nome]
+        trava = _CARREGANDO.setdefault(nome, threading.Lock())
+
+    with trava:
+        with _DADOS_LOCK:
+            if nome in _DADOS:
+                return _DADOS[nome]
+        inputs, metadados = snapshot_dados.carregar_snapshot(pasta_snapshot(nome), ativos=universo['ativos'])
+        if inputs is None:
+            print(f"--- [UNIVERSO {nome}] Sem snapshot, baixando {len(universo['ativos'])} ativos ---")
+            inputs = preparar_dados.calcular_inputs_otimizacao(0.0, lista_ativos=universo['ativos'], nome_universo=nome)
+            if inputs is None:
+                return None
+        elif snapshot_dados.snapshot_desatualizado(metadados):
+            threading.Thread(target=atualizar_inputs, args=(nome,), daemon=True).start()
+        guardar_inputs(nome, inputs)
+    return inputs
+
+# Baixa de novo os dados de um universo e troca o cache quando terminar (sem bloquear quem está usando)
+def atualizar_inputs(nome):
+    universo = obter_universo(nome)
+    with _DADOS_LOCK:
+        trava = _CARREGANDO.setdefault(nome, threading.Lock())
+    if not trava.acquire(blocking=False):
+        return None
+    try:
+        inputs = preparar_dados.calcular_inputs_otimizacao(0.0, lista_ativos=universo['ativos'], nome_universo=nome)
+        if inputs is not None:
+            guardar_inputs(nome, inputs)
+        return inputs
+    except Exception as e:
+        print(f"--- [UNIVERSO {nome}] Erro na atualização: {e}")
+        return None
+    finally:
+        trava.release()
+
+# Universos nomeados com dados em memória
+def universos_carregados():
+    with _DADOS_LOCK:
+        return list(_DADOS)
+
+
+# --- Quarentena de tickers ---
+
+def ler_quarentena():
+    try:
+        with open(config.QUARENTENA_ARQUIVO, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def salvar_quarentena(quarentena):
+    os.makedirs(os.path.dirname(config.QUARENTENA_ARQUIVO) or '.', exist_ok=True)
+    temporario = config.QUARENTENA_ARQUIVO + ".tmp"
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(quarentena, f, ensure_ascii=False, indent=2)
+    os.replace(temporario, config.QUARENTENA_ARQUIVO)
+
+# Tickers em quarentena agora: {ticker: {'falhas', 'ate'}}
+def listar_quarentena():
+    agora = datetime.datetime.now().isoformat()
+    with _QUARENTENA_LOCK:
+        return {t: info for t, info in ler_quarentena().items() if info['ate'] > agora}
+
+# Remove da lista os tickers em quarentena
+def filtrar_quarentena(tickers):
+    em_quarentena = listar_quarentena()
+    if not em_quarentena:
+        return list(tickers)
+    filtrados = [t for t in tickers if t not in em_quarentena]
+    print(f"⚠️ {len(tickers) - len(filtrados)} tickers em quarentena fora do download")
+    return filtrados
+
+# Atualiza a quarentena depois de um download: quem falhou fica fora por QUARENTENA_DIAS (dobrando a cada
+# falha seguida, até QUARENTENA_DIAS_MAX) e quem voltou sai. Falha de quase todos é problema de rede
+def registrar_resultado_download(pedidos, obtidos):
+    obtidos = set(obtidos)
+    falhas = [t for t in pedidos if t not in obtidos]
+    if not pedidos or len(falhas) > config.QUARENTENA_FRACAO_MAXIMA * len(pedidos):
+        return
+    agora = datetime.datetime.now()
+    with _QUARENTENA_LOCK:
+        quarentena = ler_quarentena()
+        alterada = False
+        for ticker in falhas:
+            n_falhas = quarentena.get(ticker, {}).get('falhas', 0) + 1
+            dias = min(config.QUARENTENA_DIAS * 2 ** (n_falhas - 1), config.QUARENTENA_DIAS_MAX)
+            quarentena[ticker] = {'falhas': n_falhas, 'ate': (agora + datetime.timedelta(days=dias)).isoformat()}
+            alterada = True
+        for ticker in obtidos:
+            alterada = quarentena.pop(ticker, None) is not None or alterada
+        if alterada:
+            salvar_quarentena(quarentena)
+    if falhas:
+        print(f"⚠️ Quarentena: {', '.join(falhas)}")